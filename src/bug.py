@@ -7,29 +7,127 @@
 
 
 import os
+import stat
+import threading
 
 
-def get_control(package):
+BUGDIR = "/usr/share/bug"
+
+
+def parse_control(f):
     """
-    Get /usr/share/bug/package/control info if available and return the
-    data as a dictionary.
+    Parse a control file and return the data as a dictionary.
     """
-    path = "/usr/share/bug/" + str(package) + "/control"
     control = dict()
-    if not os.path.exists(path):
-        return control
-    f = file(path)
-    for line in f.readlines():
+    for line in f:
         tokens = line.split(":", 1)
         if len(tokens) < 2:
             continue
         cmd = str(tokens[0].strip().lower())
         args = [str(i).strip() for i in tokens[1].split()]
         control[cmd] = args
-    f.close()
     return control
 
 
+class BugDirIndex(object):
+    """
+    Index of /usr/share/bug.
+
+    The directory is listed once and again when its mtime changes, so
+    packages without an entry cost no further stat. The control file,
+    presubj and bug script of a package are read on its first lookup and
+    memoized until the mtime of its own directory changes, e.g. by an
+    upgrade.
+    """
+
+    def __init__(self, bugdir=BUGDIR):
+        self.bugdir = bugdir
+        self.lock = threading.Lock()
+        self.stamp = None
+        self.names = set()
+        self.entries = dict()
+
+
+    def get(self, package):
+        """
+        Return a dictionary with the parsed control file ("control"), the
+        text of presubj ("presubj") and the path of the bug script
+        ("script") of package. Missing files are empty or None.
+        """
+        package = str(package)
+        with self.lock:
+            try:
+                stamp = os.stat(self.bugdir).st_mtime
+            except OSError:
+                stamp = None
+            if stamp != self.stamp:
+                self.names = set(os.listdir(self.bugdir)) if stamp else set()
+                self.entries = dict()
+                self.stamp = stamp
+            if package not in self.names:
+                return self._read(None, None)
+            path = os.path.join(self.bugdir, package)
+            try:
+                st = os.stat(path)
+            except OSError:
+                return self._read(None, None)
+            entry = self.entries.get(package)
+            if entry is None or entry["mtime"] != st.st_mtime:
+                entry = self._read(path, st)
+                self.entries[package] = entry
+            return entry
+
+
+    def _read(self, path, st):
+        entry = {"mtime" : None, "control" : dict(), "presubj" : None, "script" : None}
+        if path is None:
+            return entry
+        entry["mtime"] = st.st_mtime
+        if not stat.S_ISDIR(st.st_mode):
+            # the script is just the packagename under /usr/share/bug
+            entry["script"] = path
+            return entry
+        files = set(os.listdir(path))
+        if "control" in files:
+            f = open(os.path.join(path, "control"))
+            entry["control"] = parse_control(f)
+            f.close()
+        if "presubj" in files:
+            f = open(os.path.join(path, "presubj"))
+            entry["presubj"] = f.read()
+            f.close()
+        if "script" in files:
+            entry["script"] = os.path.join(path, "script")
+        return entry
+
+
+# Shared by all lookups of /usr/share/bug
+INDEX = BugDirIndex()
+
+
+def get_control(package):
+    """
+    Get /usr/share/bug/package/control info if available and return the
+    data as a dictionary.
+    """
+    return dict(INDEX.get(package)["control"])
+
+
+def get_presubj(package):
+    """
+    Return the text of /usr/share/bug/package/presubj or None.
+    """
+    return INDEX.get(package)["presubj"]
+
+
+def get_script(package):
+    """
+    Return the path of the package's bug script, either
+    /usr/share/bug/package or /usr/share/bug/package/script, or None.
+    """
+    return INDEX.get(package)["script"]
+
+
 def submit_as(package):
     """
     Returns the submit-as value of the packge if available otherwise
@@ -0,0 +1,397 @@
+# rngapt.py - Reading apt's package lists without apt.
+# Copyright (C) 2007-2014  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import re
+import gzip
+import glob
+import bisect
+import urllib
+import fnmatch
+import hashlib
+import logging
+import threading
+
+import rngcache
+import rngdpkg
+
+
+logger = logging.getLogger("RngApt")
+
+
+LISTSDIR = "/var/lib/apt/lists"
+# All package and source names of the archive, one per line, below a header
+# line identifying the list files they were read from
+NAMEINDEX = os.path.join(rngcache.CACHEDIR, "names.txt")
+# Source names are completed the way they are queried
+SOURCE_PREFIX = "src:"
+# Maximum number of fuzzy matches which are ranked
+MAX_CANDIDATES = 1000
+APTCONF = ["/etc/apt/apt.conf", "/etc/apt/apt.conf.d"]
+PREFERENCES = ["/etc/apt/preferences", "/etc/apt/preferences.d"]
+# Keys of a "Pin: release" and the Release fields they refer to
+PIN_FIELDS = {"a" : "suite",
+              "n" : "codename",
+              "o" : "origin",
+              "l" : "label",
+              "c" : "components",
+              "v" : "version"}
+
+
+def list_files(listsdir=LISTSDIR):
+    """Return the paths of the Packages and Sources files in listsdir."""
+    try:
+        names = os.listdir(listsdir)
+    except OSError as e:
+        logger.error("Unable to read %s: %s" % (listsdir, str(e)))
+        return []
+    files = []
+    for name in sorted(names):
+        base = name[:-3] if name.endswith(".gz") else name
+        if base.endswith("_Packages") or base.endswith("_Sources"):
+            files.append(os.path.join(listsdir, name))
+    return files
+
+
+def _open(path):
+    if path.endswith(".gz"):
+        return gzip.open(path)
+    return open(path)
+
+
+def read_names(path):
+    """Return the set of package and source names in a list file.
+
+    Only the Package and Source fields are looked at, so the stanzas are
+    never parsed completely. The "Package" of a Sources file is a source.
+    """
+    packages = set()
+    sources = set()
+    is_sources = path.endswith("_Sources") or path.endswith("_Sources.gz")
+    f = _open(path)
+    try:
+        for line in f:
+            if line.startswith("Package:"):
+                name = line[8:].strip()
+                if is_sources:
+                    sources.add(name)
+                else:
+                    packages.add(name)
+                    # a binary without Source field has a source of the same
+                    # name
+                    sources.add(name)
+            elif line.startswith("Source:"):
+                # "Source: name (version)"
+                sources.add(line[7:].split()[0])
+    finally:
+        f.close()
+    return packages | set(SOURCE_PREFIX + s for s in sources)
+
+
+def _stamp(files):
+    md5 = hashlib.md5()
+    for path in files:
+        st = os.stat(path)
+        md5.update("%s %r %i\n" % (path, st.st_mtime, st.st_size))
+    return md5.hexdigest()
+
+
+def archive_names(listsdir=LISTSDIR, indexfile=NAMEINDEX):
+    """Return the sorted package and source names of the archive.
+
+    Source names carry SOURCE_PREFIX. The names are taken from indexfile as
+    long as none of the list files changed, otherwise the list files are
+    read and the index rewritten.
+    """
+    files = list_files(listsdir)
+    try:
+        stamp = _stamp(files)
+    except OSError as e:
+        logger.error("Unable to read the package lists: %s" % str(e))
+        return []
+    try:
+        f = open(indexfile)
+        try:
+            if f.readline().rstrip("\n") == stamp:
+                return [line.rstrip("\n") for line in f]
+        finally:
+            f.close()
+    except IOError:
+        pass
+    logger.debug("Reading package names from %i list files." % len(files))
+    names = set()
+    for path in files:
+        try:
+            names |= read_names(path)
+        except (IOError, OSError) as e:
+            logger.warning("Unable to read %s: %s" % (path, str(e)))
+    names = sorted(names)
+    try:
+        dirname = os.path.dirname(indexfile)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        tmp = "%s.%i" % (indexfile, os.getpid())
+        f = open(tmp, "w")
+        f.write(stamp + "\n")
+        for name in names:
+            f.write(name + "\n")
+        f.close()
+        os.rename(tmp, indexfile)
+    except (IOError, OSError) as e:
+        logger.warning("Unable to write %s: %s" % (indexfile, str(e)))
+    return names
+
+
+class NameIndex(object):
+    """Prefix and fuzzy search over a large list of names.
+
+    The names are kept twice: as sorted list for prefix searches with
+    bisect, and joined into a single string, which the fuzzy search scans
+    with one regular expression instead of looping over the names in
+    Python. While typing, every keystroke extends the text, so if the
+    previous fuzzy search found all its matches, the next one only has to
+    scan those.
+    """
+
+    def __init__(self, names):
+        self.names = sorted(set(names))
+        self.blob = "\n".join(self.names) + "\n"
+        # (text, joined names) of the last complete fuzzy search
+        self.narrowed = None
+
+
+    def __len__(self):
+        return len(self.names)
+
+
+    def complete(self, prefix, limit=20):
+        """Return the first limit names starting with prefix."""
+        i = bisect.bisect_left(self.names, prefix)
+        result = []
+        while i < len(self.names) and len(result) < limit and self.names[i].startswith(prefix):
+            result.append(self.names[i])
+            i += 1
+        return result
+
+
+    def fuzzy(self, text, limit=20):
+        """Return the limit best names containing the characters of text in
+        order.
+
+        Names containing text as a whole rank before the others, then names
+        where the match starts early, then short names. At most
+        MAX_CANDIDATES matches are ranked.
+        """
+        if not text:
+            return []
+        blob = self.blob
+        if self.narrowed and text.startswith(self.narrowed[0]):
+            blob = self.narrowed[1]
+        # starting with a literal lets the regular expression engine skip
+        # quickly to the candidates, the negated classes keep the match
+        # within one name and avoid backtracking
+        pattern = re.compile(re.escape(text[0]) +
+                             "".join("[^\n%s]*%s" % (re.escape(c), re.escape(c)) for c in text[1:]))
+        candidates = []
+        pos = 0
+        while len(candidates) < MAX_CANDIDATES:
+            match = pattern.search(blob, pos)
+            if match is None:
+                break
+            first = blob.rfind("\n", 0, match.start()) + 1
+            pos = blob.find("\n", match.end())
+            name = blob[first:pos]
+            start = name.find(text)
+            if start < 0:
+                candidates.append((1, match.start() - first, len(name), name))
+            else:
+                candidates.append((0, start, len(name), name))
+        if len(candidates) < MAX_CANDIDATES:
+            self.narrowed = (text, "".join(c[3] + "\n" for c in candidates))
+        else:
+            self.narrowed = None
+        candidates.sort()
+        return [c[3] for c in candidates[:limit]]
+
+
+    def search(self, text, limit=20):
+        """Return up to limit names for text, prefix matches first and the
+        best fuzzy matches after them."""
+        result = self.complete(text, limit)
+        if len(result) < limit:
+            seen = set(result)
+            for name in self.fuzzy(text, limit):
+                if name not in seen and len(result) < limit:
+                    result.append(name)
+        return result
+
+
+def read_release(path):
+    """Return a dictionary with the lowercased fields of a Release or
+    InRelease file, without the lists of checksums."""
+    release = {}
+    f = open(path)
+    try:
+        for line in f:
+            line = line.rstrip("\n")
+            if line.startswith("-----BEGIN PGP SIGNED MESSAGE"):
+                # skip the armor headers up to the first blank line
+                for line in f:
+                    if not line.strip():
+                        break
+                continue
+            if line.startswith("-----BEGIN PGP SIGNATURE"):
+                break
+            if not line or line[0] in " \t" or ":" not in line:
+                continue
+            key, _, value = line.partition(":")
+            release[key.lower()] = value.strip()
+    finally:
+        f.close()
+    return release
+
+
+def _config_files(paths):
+    """Return the files of paths, expanding directories."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*"))))
+        elif os.path.isfile(path):
+            files.append(path)
+    return files
+
+
+def default_release(aptconf=APTCONF):
+    """Return the value of APT::Default-Release or None."""
+    pattern = re.compile(r'APT::Default-Release\s+"([^"]*)"', re.IGNORECASE)
+    for path in _config_files(aptconf):
+        try:
+            match = pattern.search(open(path).read())
+        except IOError:
+            continue
+        if match:
+            return match.group(1)
+    return None
+
+
+def read_pins(preferences=PREFERENCES):
+    """Return the general pins as list of tuples (pin, priority).
+
+    Only records for "Package: *" are returned, pin is the value of their
+    Pin field, e.g. "release a=unstable".
+    """
+    pins = []
+    for path in _config_files(preferences):
+        try:
+            f = open(path)
+        except IOError:
+            continue
+        try:
+            for stanza in rngdpkg.parse_status(f):
+                if stanza.get("package") == "*" and "pin" in stanza and "pin-priority" in stanza:
+                    try:
+                        pins.append((stanza["pin"], int(stanza["pin-priority"])))
+                    except ValueError:
+                        logger.warning("Invalid Pin-Priority in %s: %s" % (path, stanza["pin-priority"]))
+        finally:
+            f.close()
+    return pins
+
+
+def _pin_matches(pin, release, origin):
+    kind, _, condition = pin.partition(" ")
+    if kind == "origin":
+        return fnmatch.fnmatch(origin, condition.strip().strip('"'))
+    if kind != "release":
+        return False
+    for term in condition.split(","):
+        key, _, value = term.strip().partition("=")
+        if key not in PIN_FIELDS:
+            # a bare value is a version
+            key, value = "v", key
+        field = release.get(PIN_FIELDS[key], "")
+        values = field.split() if key == "c" else [field]
+        if not [v for v in values if fnmatch.fnmatch(v, value)]:
+            return False
+    return True
+
+
+def priority(release, origin, pins=(), default=None):
+    """Return the pin priority of the archive described by release."""
+    for pin, prio in pins:
+        if _pin_matches(pin, release, origin):
+            return prio
+    if default and default in (release.get("suite"), release.get("codename")):
+        return 990
+    if release.get("notautomatic", "").lower() == "yes":
+        if release.get("butautomaticupgrades", "").lower() == "yes":
+            return 100
+        return 1
+    return 500
+
+
+def _release_files(listsdir):
+    files = {}
+    for path in glob.glob(os.path.join(listsdir, "*Release")):
+        base = path[:-len("InRelease")] if path.endswith("InRelease") else path[:-len("Release")]
+        # prefer InRelease, like apt
+        if base not in files or path.endswith("InRelease"):
+            files[base] = path
+    return sorted(files.values())
+
+
+_release_info = (None, [])
+_release_lock = threading.Lock()
+
+
+def release_info(listsdir=LISTSDIR):
+    """Return the sorted list of tuples (priority, archive, origin) of the
+    configured archives, like the release lines of apt-cache policy.
+
+    The result is cached until the mtime of listsdir or the apt
+    configuration changes.
+    """
+    global _release_info
+    try:
+        stamp = [os.stat(p).st_mtime for p in [listsdir] + APTCONF + PREFERENCES if os.path.exists(p)]
+    except OSError as e:
+        logger.error("Unable to read %s: %s" % (listsdir, str(e)))
+        return []
+    with _release_lock:
+        if _release_info[0] == stamp:
+            return _release_info[1]
+        pins = read_pins()
+        default = default_release()
+        info = set()
+        for path in _release_files(listsdir):
+            try:
+                release = read_release(path)
+            except IOError as e:
+                logger.warning("Unable to read %s: %s" % (path, str(e)))
+                continue
+            # the list files are named after the URI, the host comes first
+            origin = urllib.unquote(os.path.basename(path).split("_", 1)[0])
+            info.add((priority(release, origin, pins, default), release.get("suite", ""), origin))
+        _release_info = (stamp, sorted(info, reverse=True))
+        return _release_info[1]
+
+
+def name_index(listsdir=LISTSDIR):
+    """Return a NameIndex over the archive and the installed packages."""
+    return NameIndex(archive_names(listsdir) + rngdpkg.installed_packages())
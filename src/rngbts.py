@@ -0,0 +1,304 @@
+# rngbts.py - Client for the SOAP interface of Debian's BTS.
+# Copyright (C) 2007-2014  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Drop-in replacement for the get_bugs and get_status calls of debianbts.
+
+debianbts sets up a new HTTP connection for every call. This module keeps a
+pool of keep-alive connections instead, which are shared by all threads and
+reused across queries, so a chunked fetch of hundreds of chunks only pays
+for a handful of TCP and TLS handshakes.
+"""
+
+
+import socket
+import logging
+import datetime
+import httplib
+import threading
+import urlparse
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+
+logger = logging.getLogger("RngBts")
+
+
+# Same as debianbts.BTS_URL
+BTS_URL = "https://bugs.debian.org/"
+URL = "https://bugs.debian.org/cgi-bin/soap.cgi"
+NS = "Debbugs/SOAP"
+TIMEOUT = 60
+# Maximum number of idle connections kept in the pool
+MAX_IDLE = 8
+
+ENVELOPE = """<?xml version="1.0" encoding="UTF-8"?>\
+<soap:Envelope soap:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/" \
+xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" \
+xmlns:soapenc="http://schemas.xmlsoap.org/soap/encoding/" \
+xmlns:xsd="http://www.w3.org/2001/XMLSchema" \
+xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\
+<soap:Body><ns:%(method)s xmlns:ns="%(ns)s">%(args)s</ns:%(method)s></soap:Body>\
+</soap:Envelope>"""
+
+
+def Bugreport():
+    """Return a new, empty debianbts.Bugreport.
+
+    debianbts and its SOAP library are only imported on first use, as they
+    take a noticeable part of the startup time.
+    """
+    from debianbts import Bugreport
+    return Bugreport()
+
+
+class BTSError(Exception):
+    """The BTS answered with a SOAP fault or an unexpected response."""
+    pass
+
+
+class ConnectionPool(object):
+    """A thread safe pool of keep-alive HTTP(S) connections to one host."""
+
+    def __init__(self, url, timeout=TIMEOUT, maxidle=MAX_IDLE):
+        self.logger = logging.getLogger("ConnectionPool")
+        parsed = urlparse.urlsplit(url)
+        self.scheme = parsed.scheme
+        self.host = parsed.netloc
+        self.path = parsed.path or "/"
+        self.timeout = timeout
+        self.maxidle = maxidle
+        self.idle = []
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+
+
+    def acquire(self):
+        """Return the tuple (connection, reused).
+
+        The connection is an idle one from the pool or a new one if there is
+        none.
+        """
+        with self.lock:
+            self.requests += 1
+            if self.idle:
+                return self.idle.pop(), True
+        return self._connect(), False
+
+
+    def release(self, conn):
+        """Put conn back into the pool."""
+        with self.lock:
+            if len(self.idle) < self.maxidle:
+                self.idle.append(conn)
+                return
+        conn.close()
+
+
+    def request(self, body, headers):
+        """POST body and return the tuple (status, data).
+
+        A connection which was idle might have been closed by the server in
+        the meantime, in that case the request is retried once on a new
+        connection.
+        """
+        conn, reused = self.acquire()
+        try:
+            response, data = self._post(conn, body, headers)
+        except (httplib.HTTPException, socket.error):
+            conn.close()
+            if not reused:
+                raise
+            self.logger.debug("Idle connection to %s was closed, reconnecting." % self.host)
+            conn = self._connect()
+            try:
+                response, data = self._post(conn, body, headers)
+            except Exception:
+                conn.close()
+                raise
+        if response.getheader("connection", "").lower() == "close":
+            conn.close()
+        else:
+            self.release(conn)
+        return response.status, data
+
+
+    def _post(self, conn, body, headers):
+        conn.request("POST", self.path, body, headers)
+        response = conn.getresponse()
+        return response, response.read()
+
+
+    def _connect(self):
+        with self.lock:
+            self.connections += 1
+            self.logger.debug("Opening connection #%i to %s (%i requests so far)." % (self.connections, self.host, self.requests))
+        if self.scheme == "https":
+            return httplib.HTTPSConnection(self.host, timeout=self.timeout)
+        return httplib.HTTPConnection(self.host, timeout=self.timeout)
+
+
+    def close(self):
+        """Close all idle connections."""
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            conn.close()
+
+
+_pool = ConnectionPool(URL)
+
+
+def set_url(url):
+    """Use the SOAP interface at url from now on."""
+    global _pool
+    _pool.close()
+    _pool = ConnectionPool(url)
+
+
+def stats():
+    """Return the number of connections opened and requests sent so far."""
+    with _pool.lock:
+        return {"connections" : _pool.connections, "requests" : _pool.requests}
+
+
+def _localname(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _arg(name, value):
+    if isinstance(value, (list, tuple)):
+        return ('<%s soapenc:arrayType="xsd:int[%i]" xsi:type="soapenc:Array">%s</%s>' %
+                (name, len(value), "".join(_arg("item", v) for v in value), name))
+    if isinstance(value, (int, long)):
+        return '<%s xsi:type="xsd:int">%i</%s>' % (name, value, name)
+    if isinstance(value, unicode):
+        value = value.encode("utf-8")
+    return '<%s xsi:type="xsd:string">%s</%s>' % (name, escape(str(value)), name)
+
+
+def _call(method, *args):
+    """Call method with args and return the element holding the result."""
+    body = ENVELOPE % {"method" : method, "ns" : NS,
+                       "args" : "".join(_arg("arg%i" % i, a) for i, a in enumerate(args))}
+    headers = {"Content-Type" : "text/xml; charset=utf-8",
+               "SOAPAction" : '"%s#%s"' % (NS, method)}
+    status, data = _pool.request(body, headers)
+    logger.debug("%s: HTTP %i, %i bytes" % (method, status, len(data)))
+    try:
+        root = ElementTree.fromstring(data)
+    except Exception as e:
+        raise BTSError("Unable to parse the answer to %s (HTTP %i): %s" % (method, status, str(e)))
+    body = [el for el in root if _localname(el.tag) == "Body"]
+    if not body or len(body[0]) == 0:
+        raise BTSError("Empty answer to %s (HTTP %i)" % (method, status))
+    response = body[0][0]
+    if _localname(response.tag) == "Fault":
+        fault = [el.text for el in response if _localname(el.tag) == "faultstring"]
+        raise BTSError("%s failed: %s" % (method, fault[0] if fault else "unknown fault"))
+    if len(response) == 0:
+        return None
+    return response[0]
+
+
+def _text(el):
+    return el.text or u""
+
+
+def _items(el):
+    return [_text(item) for item in el if _localname(item.tag) == "item"]
+
+
+def _ints(s):
+    return [int(i) for i in s.replace(",", " ").split()]
+
+
+def _timestamp(s):
+    return datetime.datetime.utcfromtimestamp(int(float(s))) if s else None
+
+
+def _parse_status(value):
+    """Return a Bugreport for the value element of a get_status item."""
+    fields = dict((_localname(el.tag), el) for el in value)
+    text = lambda name: _text(fields[name]) if name in fields else u""
+    bug = Bugreport()
+    bug.originator = text("originator")
+    bug.date = _timestamp(text("date"))
+    bug.subject = text("subject")
+    bug.msgid = text("msgid")
+    bug.package = text("package")
+    bug.tags = text("tags").split()
+    bug.done = bool(text("done"))
+    bug.forwarded = text("forwarded")
+    bug.mergedwith = _ints(text("mergedwith"))
+    bug.severity = text("severity")
+    bug.owner = text("owner")
+    bug.found_versions = _items(fields["found_versions"]) if "found_versions" in fields else []
+    bug.fixed_versions = _items(fields["fixed_versions"]) if "fixed_versions" in fields else []
+    bug.blocks = _ints(text("blocks"))
+    bug.blockedby = _ints(text("blockedby"))
+    bug.unarchived = bool(text("unarchived")) and text("unarchived") != "0"
+    bug.summary = text("summary")
+    bug.affects = [i.strip() for i in text("affects").split(",") if i.strip()]
+    bug.log_modified = _timestamp(text("log_modified"))
+    bug.location = text("location")
+    bug.archived = bug.location == "archive" or text("archived") not in (u"", u"0")
+    bug.bug_num = int(text("bug_num"))
+    bug.source = text("source")
+    bug.pending = text("pending")
+    return bug
+
+
+def get_bugs(*key_value):
+    """Return the bugnumbers matching the key/value pairs.
+
+    Like debianbts.get_bugs, the pairs can be given as single list.
+    """
+    if len(key_value) == 1 and isinstance(key_value[0], (list, tuple)):
+        key_value = key_value[0]
+    result = _call("get_bugs", *key_value)
+    if result is None:
+        return []
+    return [int(i) for i in _items(result)]
+
+
+def get_status(*nrs):
+    """Return the Bugreports for the given bugnumbers.
+
+    Like debianbts.get_status, the bugnumbers can be given as single list.
+    Unknown bugs are missing in the result.
+    """
+    numbers = []
+    for nr in nrs:
+        if isinstance(nr, (list, tuple)):
+            numbers.extend(int(i) for i in nr)
+        else:
+            numbers.append(int(nr))
+    if not numbers:
+        return []
+    result = _call("get_status", numbers)
+    if result is None:
+        return []
+    bugs = []
+    for item in result:
+        value = [el for el in item if _localname(el.tag) == "value"]
+        if value:
+            try:
+                bugs.append(_parse_status(value[0]))
+            except (KeyError, ValueError) as e:
+                raise BTSError("Unable to parse the answer to get_status: %s" % str(e))
+    return bugs
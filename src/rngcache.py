@@ -0,0 +1,245 @@
+# rngcache.py - Local caches for Reportbug-NG.
+# Copyright (C) 2007-2014  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import time
+import shutil
+import calendar
+import datetime
+import logging
+import sqlite3
+import threading
+
+import rngbts as bts
+
+
+CACHEDIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "reportbug-ng")
+CACHEFILE = os.path.join(CACHEDIR, "cache.sqlite")
+# QNetworkDiskCache of the web view
+WEBCACHEDIR = os.path.join(CACHEDIR, "web")
+
+
+def _to_timestamp(dt):
+    """Convert debianbts' naive UTC datetimes to a unix timestamp."""
+    if dt is None:
+        return None
+    return calendar.timegm(dt.timetuple())
+
+
+def _from_timestamp(ts):
+    if ts is None:
+        return None
+    return datetime.datetime.utcfromtimestamp(ts)
+
+
+def normalize_query(query):
+    """Return a normalized string for a query as returned by translate_query.
+
+    The order of the key/value pairs doesn't matter for the BTS, so
+    "severity:grave tag:patch" and "tag:patch severity:grave" result in the
+    same string.
+    """
+    pairs = []
+    for i in range(0, len(query), 2):
+        pairs.append("%s=%s" % (query[i], query[i+1].lower()))
+    return "&".join(sorted(pairs))
+
+
+def clear_web_cache(dirname=WEBCACHEDIR):
+    """Remove the pages cached by the web view."""
+    logging.getLogger("RngCache").info("Clearing cache %s." % dirname)
+    shutil.rmtree(dirname, ignore_errors=True)
+
+
+class _SqliteCache(object):
+    """Base class for the caches stored in a SQLite database."""
+
+    SCHEMA = ()
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        dirname = os.path.dirname(filename)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        for statement in self.SCHEMA:
+            self.db.execute(statement)
+        self.db.commit()
+
+
+class BugCache(_SqliteCache):
+    """Persistent cache for bugreports keyed by the bugnumber.
+
+    Only the fields shown in the buglist and exported by the command line
+    interface are stored, the rest of the Bugreport is left empty. Every entry is stamped with the log_modified
+    value of the bug and the time it was fetched; entries fetched more than
+    maxage seconds ago are considered stale and fetched again. If the cache
+    grows beyond size entries, the least recently used ones are evicted.
+    """
+
+    FIELDS = ("bug_num", "package", "source", "originator", "subject",
+              "severity", "tags", "done", "archived", "log_modified")
+
+    SCHEMA = ("""CREATE TABLE IF NOT EXISTS bugs (
+                     bug_num INTEGER PRIMARY KEY,
+                     package TEXT,
+                     source TEXT,
+                     originator TEXT,
+                     subject TEXT,
+                     severity TEXT,
+                     tags TEXT,
+                     done INTEGER,
+                     archived INTEGER,
+                     log_modified INTEGER,
+                     fetched REAL,
+                     accessed REAL)""",
+              "CREATE INDEX IF NOT EXISTS bugs_accessed ON bugs (accessed)")
+
+    def __init__(self, filename=CACHEFILE, size=20000, maxage=3600):
+        _SqliteCache.__init__(self, filename)
+        self.logger = logging.getLogger("BugCache")
+        self.size = size
+        self.maxage = maxage
+        # caches written by older versions lack some fields, start over
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(bugs)")]
+        if [f for f in self.FIELDS if f not in columns]:
+            self.logger.info("Clearing cache %s written by an older version." % filename)
+            self.db.execute("DROP TABLE bugs")
+            for statement in self.SCHEMA:
+                self.db.execute(statement)
+            self.db.commit()
+
+
+    def get(self, bugnumbers, maxage=None):
+        """Return a dictionary bugnumber:Bugreport of the fresh cached bugs.
+
+        Bugs which are not in the cache or stale are missing in the result.
+        If maxage is given, entries fetched more than maxage seconds ago are
+        considered stale, too.
+        """
+        result = {}
+        now = time.time()
+        if maxage is None or maxage > self.maxage:
+            maxage = self.maxage
+        numbers = [int(i) for i in bugnumbers]
+        with self.lock:
+            # stay below sqlite's limit of host parameters
+            for i in range(0, len(numbers), 500):
+                chunk = numbers[i:i+500]
+                rows = self.db.execute("""SELECT %s FROM bugs
+                                          WHERE fetched > ? AND bug_num IN (%s)""" %
+                                       (", ".join(self.FIELDS), ", ".join("?" * len(chunk))),
+                                       [now - maxage] + chunk).fetchall()
+                for row in rows:
+                    result[row[0]] = self._to_bugreport(row)
+                self.db.executemany("UPDATE bugs SET accessed = ? WHERE bug_num = ?",
+                                    [(now, row[0]) for row in rows])
+            self.db.commit()
+        self.logger.debug("%i of %i bugs found in cache." % (len(result), len(numbers)))
+        return result
+
+
+    def put(self, bugs):
+        """Store the bugreports in the cache."""
+        now = time.time()
+        rows = [(int(b.bug_num), b.package, b.source, b.originator, b.subject,
+                 b.severity, " ".join(b.tags or []), bool(b.done), bool(b.archived),
+                 _to_timestamp(b.log_modified), now, now) for b in bugs]
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO bugs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._evict()
+            self.db.commit()
+
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        self.logger.info("Clearing cache %s." % self.filename)
+        with self.lock:
+            self.db.execute("DELETE FROM bugs")
+            self.db.commit()
+            self.db.execute("VACUUM")
+
+
+    def _evict(self):
+        count = self.db.execute("SELECT COUNT(*) FROM bugs").fetchone()[0]
+        if count <= self.size:
+            return
+        self.logger.debug("Evicting %i bugs from cache." % (count - self.size))
+        self.db.execute("""DELETE FROM bugs WHERE bug_num IN
+                           (SELECT bug_num FROM bugs ORDER BY accessed LIMIT ?)""",
+                        (count - self.size,))
+
+
+    def _to_bugreport(self, row):
+        bug = bts.Bugreport()
+        bug.bug_num, bug.package, bug.source, bug.originator, bug.subject, bug.severity = row[0:6]
+        bug.tags = row[6].split() if row[6] else []
+        bug.done = bool(row[7])
+        bug.archived = bool(row[8])
+        bug.log_modified = _from_timestamp(row[9])
+        return bug
+
+
+class QueryCache(_SqliteCache):
+    """Persistent cache for the buglists returned by the BTS for a query.
+
+    The entries are keyed by the normalized query and expire after ttl
+    seconds.
+    """
+
+    SCHEMA = ("""CREATE TABLE IF NOT EXISTS queries (
+                     query TEXT PRIMARY KEY,
+                     bugs TEXT,
+                     fetched REAL)""",)
+
+    def __init__(self, filename=CACHEFILE, ttl=600):
+        _SqliteCache.__init__(self, filename)
+        self.logger = logging.getLogger("QueryCache")
+        self.ttl = ttl
+
+
+    def get(self, query):
+        """Return the cached buglist for query or None if there is none."""
+        key = normalize_query(query)
+        with self.lock:
+            row = self.db.execute("SELECT bugs FROM queries WHERE query = ? AND fetched > ?",
+                                  (key, time.time() - self.ttl)).fetchone()
+        if row is None:
+            return None
+        self.logger.debug("Buglist for %s found in cache." % key)
+        return [int(i) for i in row[0].split()]
+
+
+    def put(self, query, buglist):
+        """Store the buglist for query in the cache."""
+        key = normalize_query(query)
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO queries VALUES (?, ?, ?)",
+                            (key, " ".join(str(i) for i in buglist), time.time()))
+            # no need to keep expired entries around
+            self.db.execute("DELETE FROM queries WHERE fetched <= ?", (time.time() - self.ttl,))
+            self.db.commit()
+
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        self.logger.info("Clearing cache %s." % self.filename)
+        with self.lock:
+            self.db.execute("DELETE FROM queries")
+            self.db.commit()
@@ -0,0 +1,151 @@
+# rngcli.py - Headless interface of Reportbug-NG.
+# Copyright (C) 2007-2014  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Run a query like the main window does and write the matching bugs to a
+file as soon as they arrive, without importing PyQt5.
+"""
+
+
+import sys
+import csv
+import errno
+import json
+import logging
+
+import rnghelpers as rng
+import rngbts as bts
+import rngfetch
+import rngcache
+import rngoffline
+
+
+logger = logging.getLogger("RngCli")
+
+
+FORMATS = ("jsonl", "csv")
+
+
+class JsonLinesWriter(object):
+    """Writes bugs as JSON Lines in the format of rngoffline's export."""
+
+    def __init__(self, f, batch=False):
+        self.f = f
+
+
+    def write(self, bugs, matches=None):
+        for bug in bugs:
+            d = rngoffline.bug_to_dict(bug)
+            if matches is not None:
+                d["matched"] = matches.get(d["bug_num"], [])
+            self.f.write(json.dumps(d) + "\n")
+        self.f.flush()
+
+
+class CsvWriter(object):
+    """Writes bugs as CSV with a header line, one column per field."""
+
+    def __init__(self, f, batch=False):
+        self.f = f
+        self.writer = csv.writer(f)
+        header = list(rngoffline.FIELDS)
+        if batch:
+            header.append("matched")
+        self.writer.writerow(header)
+
+
+    def write(self, bugs, matches=None):
+        for bug in bugs:
+            d = rngoffline.bug_to_dict(bug)
+            d["tags"] = " ".join(d["tags"])
+            d["done"] = int(d["done"])
+            d["archived"] = int(d["archived"])
+            row = [d[field] for field in rngoffline.FIELDS]
+            if matches is not None:
+                row.append(" ".join(matches.get(d["bug_num"], [])))
+            self.writer.writerow([self._encode(v) for v in row])
+        self.f.flush()
+
+
+    def _encode(self, value):
+        if value is None:
+            return ""
+        if isinstance(value, unicode):
+            return value.encode("utf-8")
+        return value
+
+
+WRITERS = {"jsonl" : JsonLinesWriter,
+           "csv"   : CsvWriter}
+
+
+def run(text, format="jsonl", nocache=False, offline=False, out=sys.stdout):
+    """Write the bugs matching the query text to out, return the exit status.
+
+    Like in the main window, several queries can be given seperated by
+    commas. For such a batch, every bug is written with the queries which
+    found it.
+    """
+    settings = rng.Settings(rng.Settings.CONFIGFILE)
+    settings.load()
+    backend = bts
+    bugcache = None
+    querycache = None
+    if offline:
+        backend = rngoffline.OfflineBTS(rngoffline.OFFLINEFILE)
+    elif not nocache:
+        try:
+            bugcache = rngcache.BugCache(rngcache.CACHEFILE, settings.cacheSize,
+                                         settings.cacheMaxAge)
+            querycache = rngcache.QueryCache(rngcache.CACHEFILE, settings.queryCacheTTL)
+        except Exception as e:
+            logger.error("Unable to open the cache, continuing without: %s" % str(e))
+
+    terms = []
+    for t in rng.split_queries(text):
+        query = rng.apply_submit_as(rng.translate_query(t))
+        if query:
+            terms.append((t, query))
+    if not terms:
+        logger.error("Empty query.")
+        return 2
+
+    get_bugs = lambda query: rngfetch.get_buglist(query, backend.get_bugs, querycache)
+    buglists = rngfetch.fetch_buglists([query for t, query in terms], get_bugs)
+    if buglists.count(None) == len(buglists):
+        return 1
+    buglist, matches = rngfetch.merge_buglists(buglists)
+
+    batch = len(terms) > 1
+    if batch:
+        matches = dict((nr, [terms[i][0] for i in indices]) for nr, indices in matches.items())
+    else:
+        matches = None
+    try:
+        writer = WRITERS[format](out, batch)
+        rngfetch.fetch_status(buglist, callback=lambda bugs: writer.write(bugs, matches),
+                              get_status=backend.get_status, cache=bugcache)
+    except IOError as e:
+        # the reader went away, e.g. reportbug-ng --format csv foo | head
+        if e.errno == errno.EPIPE:
+            return 0
+        # socket.error is an IOError as well, e.g. if the BTS is unreachable
+        logger.error("Fetching the bugreports failed: %s" % str(e))
+        return 1
+    except Exception as e:
+        logger.error("Fetching the bugreports failed: %s" % str(e))
+        return 1
+    return 0
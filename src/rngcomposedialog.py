@@ -0,0 +1,59 @@
+# rngcomposedialog.py - ComposeDialog of Reportbug-NG.
+# Copyright (C) 2007-2014  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import QCoreApplication
+
+from ui import composedialog
+import rnghelpers as rng
+
+
+class ComposeDialog(QtWidgets.QDialog, composedialog.Ui_ComposeDialog):
+    """Lets the user write a bugreport sent by the built-in mailers.
+
+    The dialog can only be accepted once rnghelpers.check_report is happy
+    with the subject and the body.
+    """
+
+    def __init__(self, to, subject, body, attachments=(), parent=None):
+        QtWidgets.QDialog.__init__(self, parent)
+        self.setupUi(self)
+        self.template = body
+        self.labelTo.setText(to)
+        self.lineEditSubject.setText(subject)
+        self.plainTextEditBody.setPlainText(body)
+        if attachments:
+            self.labelAttachments.setText(QCoreApplication.translate("ComposeDialog", "Attachments: %s") %
+                                          ", ".join(os.path.basename(f) for f in attachments))
+        self.buttonBox.button(QtWidgets.QDialogButtonBox.Ok).clicked.connect(self.accept)
+        self.buttonBox.button(QtWidgets.QDialogButtonBox.Cancel).clicked.connect(self.reject)
+
+    def subject(self):
+        return unicode(self.lineEditSubject.text())
+
+    def body(self):
+        return unicode(self.plainTextEditBody.toPlainText())
+
+    def accept(self):
+        error = rng.check_report(self.subject(), self.body(), self.template)
+        if error:
+            QtWidgets.QMessageBox.warning(self, QCoreApplication.translate("ComposeDialog", "Bug report incomplete"), error)
+            return
+        QtWidgets.QDialog.accept(self)
@@ -0,0 +1,188 @@
+# rngdpkg.py - Reading dpkg's database without apt.
+# Copyright (C) 2007-2014  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import logging
+import threading
+
+import rngcache
+
+
+logger = logging.getLogger("RngDpkg")
+
+
+STATUSFILE = "/var/lib/dpkg/status"
+# Names of the installed packages, one per line, below a header line with
+# the mtime and size of the status file they were read from
+PACKAGEINDEX = os.path.join(rngcache.CACHEDIR, "installed.txt")
+# The fields StatusIndex keeps of each package
+INDEXED_FIELDS = ("status", "version", "source", "depends", "recommends",
+                  "suggests")
+
+
+def parse_status(f):
+    """Yield a dictionary for each stanza of a dpkg status file.
+
+    The keys are the lowercased field names, continuation lines are
+    appended to their field.
+    """
+    stanza = {}
+    field = None
+    for line in f:
+        line = line.rstrip("\n")
+        if not line:
+            if stanza:
+                yield stanza
+            stanza = {}
+            field = None
+        elif line[0] in " \t":
+            if field:
+                stanza[field] += "\n" + line[1:]
+        else:
+            key, _, value = line.partition(":")
+            field = key.lower()
+            stanza[field] = value.strip()
+    if stanza:
+        yield stanza
+
+
+def is_installed(stanza):
+    """Return True if the stanza of a status file is an installed package."""
+    return stanza.get("status", "").split()[-1:] == ["installed"]
+
+
+def read_installed(statusfile=STATUSFILE):
+    """Return the sorted names of the installed packages."""
+    names = set()
+    f = open(statusfile)
+    try:
+        for stanza in parse_status(f):
+            if "package" in stanza and is_installed(stanza):
+                names.add(stanza["package"])
+    finally:
+        f.close()
+    return sorted(names)
+
+
+def _stamp(statusfile):
+    st = os.stat(statusfile)
+    return "%r %i" % (st.st_mtime, st.st_size)
+
+
+class StatusIndex(object):
+    """In-memory index of the dpkg status file.
+
+    The status file is read in a single pass on first use and again
+    whenever its mtime or size changed, lookups are dictionary accesses.
+    Only the INDEXED_FIELDS of each package are kept. Like dpkg-query
+    --status, all packages dpkg knows about are included, not only the
+    installed ones.
+    """
+
+    def __init__(self, statusfile=STATUSFILE):
+        self.logger = logging.getLogger("StatusIndex")
+        self.statusfile = statusfile
+        self.stamp = None
+        self.packages = {}
+        self.lock = threading.Lock()
+
+
+    def get(self, package):
+        """Return the dictionary of fields of package or None."""
+        with self.lock:
+            self._refresh()
+            stanza = self.packages.get(package)
+            if stanza is None and ":" in package:
+                # architecture qualified, e.g. libc6:any
+                stanza = self.packages.get(package.split(":", 1)[0])
+            return stanza
+
+
+    def field(self, package, field, default=""):
+        """Return the value of field of package or default."""
+        stanza = self.get(package)
+        if stanza is None:
+            return default
+        return stanza.get(field, default)
+
+
+    def _refresh(self):
+        try:
+            stamp = _stamp(self.statusfile)
+        except OSError as e:
+            self.logger.error("Unable to read %s: %s" % (self.statusfile, str(e)))
+            self.stamp, self.packages = None, {}
+            return
+        if stamp == self.stamp:
+            return
+        self.logger.debug("Reading %s." % self.statusfile)
+        packages = {}
+        f = open(self.statusfile)
+        try:
+            for stanza in parse_status(f):
+                name = stanza.get("package")
+                # for Multi-Arch: same packages the first instance wins, as
+                # with dpkg-query
+                if name and name not in packages:
+                    packages[name] = dict((k, stanza[k]) for k in INDEXED_FIELDS if k in stanza)
+        finally:
+            f.close()
+        self.stamp, self.packages = stamp, packages
+
+
+# Shared by all users of the status file
+STATUS = StatusIndex()
+
+
+def installed_packages(statusfile=STATUSFILE, indexfile=PACKAGEINDEX):
+    """Return the sorted names of the installed packages.
+
+    The names are taken from indexfile as long as statusfile didn't change
+    since the index was written, otherwise statusfile is read and the index
+    rewritten.
+    """
+    try:
+        stamp = _stamp(statusfile)
+    except OSError as e:
+        logger.error("Unable to read %s: %s" % (statusfile, str(e)))
+        return []
+    try:
+        f = open(indexfile)
+        try:
+            if f.readline().rstrip("\n") == stamp:
+                return [line.rstrip("\n") for line in f]
+        finally:
+            f.close()
+    except IOError:
+        pass
+    logger.debug("Reading installed packages from %s." % statusfile)
+    names = read_installed(statusfile)
+    try:
+        dirname = os.path.dirname(indexfile)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        tmp = "%s.%i" % (indexfile, os.getpid())
+        f = open(tmp, "w")
+        f.write(stamp + "\n")
+        for name in names:
+            f.write(name + "\n")
+        f.close()
+        os.rename(tmp, indexfile)
+    except (IOError, OSError) as e:
+        logger.warning("Unable to write %s: %s" % (indexfile, str(e)))
+    return names
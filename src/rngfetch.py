@@ -0,0 +1,326 @@
+# rngfetch.py - Fetching bugreports from Debian's BTS.
+# Copyright (C) 2007-2014  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import time
+import logging
+import threading
+import Queue
+
+import rngbts as bts
+
+
+logger = logging.getLogger("RngFetch")
+
+
+# Number of bugs fetched with the first get_status call
+CHUNKSIZE = 50
+# Bounds for the number of bugs fetched with a single get_status call
+MIN_CHUNKSIZE = 10
+MAX_CHUNKSIZE = 400
+# get_status calls faster than FAST seconds grow the chunks, calls slower than
+# SLOW seconds shrink them
+FAST = 2.0
+SLOW = 10.0
+# Maximum number of get_status calls running at the same time
+WORKERS = 4
+# Seconds between two checks whether the fetch was cancelled
+POLL = 0.2
+# Bugs fetched less than REFRESH_MAXAGE seconds ago are taken from the cache
+# on a refresh
+REFRESH_MAXAGE = 120
+
+
+class AdaptiveBatcher(object):
+    """Splits a buglist into chunks whose size follows the BTS' latency.
+
+    The chunks are handed out in the order of the buglist and numbered
+    consecutively. After each get_status call the worker reports how long
+    it took and whether it failed: fast calls double the chunk size, slow or
+    failed ones halve it, within MIN_CHUNKSIZE and MAX_CHUNKSIZE.
+    """
+
+    def __init__(self, buglist, chunksize=CHUNKSIZE,
+                 minsize=MIN_CHUNKSIZE, maxsize=MAX_CHUNKSIZE):
+        self.logger = logging.getLogger("AdaptiveBatcher")
+        self.buglist = buglist
+        self.pos = 0
+        self.count = 0
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self.chunksize = max(minsize, min(chunksize, maxsize))
+        self.lock = threading.Lock()
+
+
+    def next_chunk(self):
+        """Return the tuple (number, chunk) or None if all bugs are handed out."""
+        with self.lock:
+            if self.pos >= len(self.buglist):
+                return None
+            chunk = self.buglist[self.pos:self.pos+self.chunksize]
+            self.pos += len(chunk)
+            self.count += 1
+            return self.count - 1, chunk
+
+
+    def report(self, seconds, ok):
+        """Adapt the chunk size to the outcome of the last get_status call."""
+        with self.lock:
+            old = self.chunksize
+            if not ok or seconds > SLOW:
+                self.chunksize = max(self.minsize, self.chunksize // 2)
+            elif seconds < FAST:
+                self.chunksize = min(self.maxsize, self.chunksize * 2)
+            if old != self.chunksize:
+                self.logger.debug("Chunk size changed from %i to %i after %.2fs." % (old, self.chunksize, seconds))
+
+
+def bisect_status(chunk, get_status, batcher=None, cancel=None):
+    """Return the bugreports of chunk, skipping the bugs the BTS chokes on.
+
+    If the BTS answers the chunk with a SOAP fault or a malformed reply, the
+    chunk is split in halves which are fetched separately, until the
+    offending bugs are found. The bisection stops as soon as cancel is set.
+
+    The BTS leaves out bugs it does not know, so a short or empty answer is
+    no failure and the missing bugs are not asked for again.
+
+    Any other error of get_status, e.g. a refused connection or a timeout,
+    says nothing about the bugs in the chunk and is raised right away.
+    """
+    start = time.time()
+    try:
+        bl, ok = get_status(chunk), True
+    except bts.BTSError as e:
+        logger.debug("Fetching the status of %i bugs failed: %s" % (len(chunk), str(e)))
+        bl, ok = [], False
+    if batcher:
+        batcher.report(time.time() - start, ok)
+    if ok or (cancel and cancel.is_set()):
+        return bl
+    if len(chunk) == 1:
+        logger.error("The following bug caused the BTS to hickup: %s" % str(chunk[0]))
+        return []
+    logger.warning("One of the following bugs caused the BTS to hickup, bisecting: %s" % str(chunk))
+    middle = len(chunk) // 2
+    return (bisect_status(chunk[:middle], get_status, batcher, cancel) +
+            bisect_status(chunk[middle:], get_status, batcher, cancel))
+
+
+def get_buglist(query, get_bugs=None, cache=None, refresh=False):
+    """Return the buglist for a translated query.
+
+    A query for a single bugnumber is answered without asking the BTS. If a
+    rngcache.QueryCache is given, the buglist is taken from it unless
+    refresh is True, and stored in it after it was fetched.
+
+    get_bugs defaults to rngbts.get_bugs.
+    """
+    if get_bugs is None:
+        get_bugs = bts.get_bugs
+    # Single bug or list of bugs?
+    if not query[0]:
+        return [query[1]]
+    if cache and not refresh:
+        buglist = cache.get(query)
+        if buglist is not None:
+            return buglist
+    buglist = get_bugs(query)
+    if cache:
+        cache.put(query, buglist)
+    return buglist
+
+
+def fetch_buglists(queries, get_bugs=None, workers=WORKERS, cancel=None):
+    """Return the buglists for several queries, fetched concurrently.
+
+    The buglists are returned in the order of queries. If get_bugs fails for
+    a query, the error is logged and its buglist is None. Queries which
+    weren't started yet when cancel was set are None as well.
+
+    get_bugs defaults to rngbts.get_bugs.
+    """
+    if get_bugs is None:
+        get_bugs = bts.get_bugs
+    buglists = [None] * len(queries)
+    tasks = Queue.Queue()
+    for i in range(len(queries)):
+        tasks.put(i)
+
+    def worker():
+        while not (cancel and cancel.is_set()):
+            try:
+                i = tasks.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                buglists[i] = get_bugs(queries[i])
+            except Exception as e:
+                logger.error("Fetching the buglist for %s failed: %s" % (str(queries[i]), str(e)))
+
+    threads = [threading.Thread(target=worker) for i in range(max(1, min(workers, len(queries))))]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    for t in threads:
+        t.join()
+    return buglists
+
+
+def merge_buglists(buglists):
+    """Merge several buglists into one without duplicates.
+
+    Returns the tuple (buglist, matches), buglist keeps the order in which
+    the bugs appear first, matches maps each bugnumber to the indices of
+    the buglists containing it. Missing buglists (None) are skipped.
+    """
+    merged = []
+    matches = {}
+    for i, buglist in enumerate(buglists):
+        for bug in buglist or []:
+            nr = int(bug)
+            if nr not in matches:
+                matches[nr] = []
+                merged.append(nr)
+            if i not in matches[nr]:
+                matches[nr].append(i)
+    return merged, matches
+
+
+def fetch_status(buglist, chunksize=CHUNKSIZE, workers=WORKERS, progress=None,
+                 callback=None, get_status=None, cache=None, cancel=None,
+                 refresh=False, maxage=None):
+    """Fetch the status of the bugs in buglist and return the bugreports.
+
+    The buglist is split into chunks by an AdaptiveBatcher, starting with
+    chunksize bugs, which are fetched by at most workers threads at the same
+    time. Chunks the BTS fails on are bisected, so only the offending bugs
+    are missing in the result. The bugreports are returned in the order of
+    buglist.
+
+    If progress is given, it is called with the percentage of fetched bugs
+    every time a chunk arrived. If callback is given, it is called with the
+    bugreports of each chunk as soon as the chunk and all chunks before it
+    arrived, so the bugreports are passed in the order of buglist. Both are
+    always called from the calling thread.
+
+    get_status defaults to rngbts.get_status and can be replaced by any
+    callable with the same signature, e.g. for a local stand-in BTS.
+
+    If a rngcache.BugCache is given, only the bugs missing in the cache are
+    fetched from the BTS and stored in the cache afterwards. The cached
+    bugreports are passed to callback first, in one go. maxage is passed to
+    BugCache.get, to take only the bugs fetched in the last maxage seconds
+    from the cache. If refresh is True, all bugs are fetched from the BTS
+    and only stored in the cache.
+
+    cancel is an optional threading.Event. Once it is set, no more chunks
+    are requested, progress and callback are not called anymore and the
+    bugreports fetched so far are returned right away. Requests already
+    on their way are left to the worker threads, which exit afterwards.
+
+    If get_status fails with anything but a rngbts.BTSError, e.g. because
+    the BTS is unreachable, the fetch stops like a cancelled one and the
+    error is raised. The bugs fetched until then were passed to callback
+    and stored in the cache already.
+    """
+    if get_status is None:
+        get_status = bts.get_status
+    cached = {}
+    if cache and not refresh:
+        cached = cache.get(buglist, maxage)
+        if cached and callback:
+            callback([cached[int(i)] for i in buglist if int(i) in cached])
+    missing = [i for i in buglist if int(i) not in cached]
+    if not missing:
+        if progress:
+            progress(100)
+        return [cached[int(i)] for i in buglist if int(i) in cached]
+
+    batcher = AdaptiveBatcher(missing, chunksize)
+    results = Queue.Queue()
+    # stops the workers and their bisections, set once the fetch is cancelled
+    # or by the first worker which hits an error other than a BTSError
+    stop = threading.Event()
+    errors = []
+
+    def cancelled():
+        return stop.is_set() or (cancel is not None and cancel.is_set())
+
+    def worker():
+        while True:
+            task = None if cancelled() else batcher.next_chunk()
+            if task is None:
+                results.put(None)
+                return
+            i, chunk = task
+            try:
+                bl = bisect_status(chunk, get_status, batcher, stop)
+            except Exception as e:
+                logger.error("Fetching the status of %i bugs failed, giving up: %s" % (len(chunk), str(e)))
+                errors.append(e)
+                stop.set()
+                results.put(None)
+                return
+            results.put((i, len(chunk), bl))
+
+    nworkers = max(1, min(workers, len(missing) // batcher.minsize + 1))
+    logger.debug("Fetching %i bugs with %i workers." % (len(missing), nworkers))
+    for i in range(nworkers):
+        t = threading.Thread(target=worker)
+        t.daemon = True
+        t.start()
+
+    fetched = {}
+    passed = 0
+    done = 0
+    running = nworkers
+    while running:
+        try:
+            result = results.get(timeout=POLL)
+        except Queue.Empty:
+            result = False
+        if result is None:
+            running -= 1
+        elif result:
+            # bugs which arrived are worth caching even if we are cancelled
+            i, n, bl = result
+            fetched[i] = bl
+            done += n
+            if cache and bl:
+                cache.put(bl)
+        if errors:
+            raise errors[0]
+        if cancelled():
+            stop.set()
+            logger.debug("Fetch cancelled, %i of %i bugs fetched." % (done, len(missing)))
+            break
+        if not result:
+            continue
+        if progress:
+            progress(int(100. * done / len(missing)))
+        while passed in fetched:
+            if callback:
+                callback(fetched[passed])
+            passed += 1
+
+    bugs = {}
+    for bl in fetched.values():
+        for bug in bl:
+            bugs[int(bug.bug_num)] = bug
+    bugs.update(cached)
+    return [bugs[int(i)] for i in buglist if int(i) in bugs]
@@ -16,28 +16,40 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 
+import os
 import logging
 import thread
+import threading
+import functools
 
-from PyQt5 import QtCore, QtWidgets, QtGui
+from PyQt5 import QtCore, QtWidgets, QtGui, QtNetwork
 from PyQt5.QtCore import QCoreApplication
 
 from ui import mainwindow
-from ui import submitdialog
 import rnghelpers as rng
-import debianbts as bts
-from rngsettingsdialog import RngSettingsDialog
-import bug
+import rngbts as bts
+import rngfetch
+import rngcache
+import rngoffline
 
 
-def chunks(l, n):
-    for i in range(0, len(l), n):
-        yield l[i:i+n]
+# the bug pages are requested directly instead of via BTS_URL/<bugnr> to
+# avoid a redirect, which couldn't be cached
+BUGPAGE = bts.BTS_URL + "cgi-bin/bugreport.cgi"
 
 
 class RngGui(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
 
-    def __init__(self, args):
+    # bytes written and seconds elapsed, emitted from the thread running the
+    # package's bug script
+    scriptProgress = QtCore.pyqtSignal(int, float)
+    # name of the message, delivered and error, emitted by the mail sender
+    mailSent = QtCore.pyqtSignal(str, bool, str)
+    # mailer, to, subject, body and attachments of a prepared bugreport for
+    # the built-in mailers, emitted from the thread preparing it
+    reportPrepared = QtCore.pyqtSignal(str, str, str, str, list)
+
+    def __init__(self, args, nocache=False, offline=False):
         QtWidgets.QMainWindow.__init__(self)
         self.setupUi(self)
 
@@ -60,15 +72,20 @@ class RngGui(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
         self.actionNewWnpp.triggered.connect(self.new_wnpp)
         self.actionClearLineEdit.triggered.connect(self.clear_lineedit)
         self.actionSettings.triggered.connect(self.settings_diag)
+        self.actionRefresh.triggered.connect(self.refresh)
         self.actionAbout.triggered.connect(self.about)
         self.actionAboutQt.triggered.connect(self.about_qt)
         self.lineEdit.textChanged.connect(self.lineedit_text_changed)
         self.lineEdit.returnPressed.connect(self.lineedit_return_pressed)
         self.tableView.activated.connect(self.activated)
+        self.tableView.verticalScrollBar().valueChanged.connect(self.schedule_prefetch)
         self.webView.loadProgress.connect(self.load_progress)
         self.webView.loadStarted.connect(self.load_started)
         self.webView.loadFinished.connect(self.load_finished)
         self.checkBox.clicked.connect(self.checkbox_clicked)
+        self.scriptProgress.connect(self.script_progress)
+        self.mailSent.connect(self.mail_sent)
+        self.reportPrepared.connect(self.compose_report)
 
         # setup the table
         self.model = TableModel(self)
@@ -79,6 +96,11 @@ class RngGui(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
         self.tableView.setModel(self.proxymodel)
         self.tableView.horizontalHeader().setSectionResizeMode(2, QtWidgets.QHeaderView.Stretch)
         self.tableView.verticalHeader().setVisible(False)
+        # the matched queries are only interesting for batch queries
+        self.tableView.setColumnHidden(7, True)
+        # only keyboard navigation shows the new current bug, not the changes
+        # of the current row caused by updates of the model
+        self.tableView.installEventFilter(self)
 
         # setup the settings
         self.settings = rng.Settings(rng.Settings.CONFIGFILE)
@@ -86,9 +108,53 @@ class RngGui(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
         self._apply_settings()
         self.webView.setHtml(rng.getRngInstructions())
 
+        # setup the disk cache for the web view, the pages of the rows
+        # around the cursor are prefetched into it
+        self.netmanager = QtNetwork.QNetworkAccessManager(self)
+        if not nocache:
+            netcache = BugPageCache(self.settings.cacheMaxAge, self.netmanager)
+            netcache.setCacheDirectory(rngcache.WEBCACHEDIR)
+            netcache.setMaximumCacheSize(self.settings.webCacheSize * 1024 * 1024)
+            self.netmanager.setCache(netcache)
+        self.webView.page().setNetworkAccessManager(self.netmanager)
+        self.prefetching = set()
+        self.prefetchtimer = QtCore.QTimer(self)
+        self.prefetchtimer.setSingleShot(True)
+        self.prefetchtimer.setInterval(200)
+        self.prefetchtimer.timeout.connect(self.prefetch)
+
+        # setup the BTS and the cache, answering queries offline is fast
+        # enough without
+        self.backend = bts
+        self.bugcache = None
+        self.querycache = None
+        if offline:
+            self.logger.info("Running in offline mode.")
+            self.backend = rngoffline.OfflineBTS(rngoffline.OFFLINEFILE)
+        elif not nocache:
+            try:
+                self.bugcache = rngcache.BugCache(rngcache.CACHEFILE,
+                                                  self.settings.cacheSize,
+                                                  self.settings.cacheMaxAge)
+                self.querycache = rngcache.QueryCache(rngcache.CACHEFILE,
+                                                      self.settings.queryCacheTTL)
+            except Exception as e:
+                self.logger.error("Unable to open the cache, continuing without: %s" % str(e))
+
         # setup the finite state machine
         self._stateChanged(None, None)
 
+        self.query = [None]
+        self.querytext = ""
+        self.querythread = None
+        self.incremental = False
+
+        # the sender of the built-in mailers, started on first use or a
+        # bit after startup to deliver what is left in the outbox
+        self.mailsender = None
+        self.mailsenderlock = threading.Lock()
+        QtCore.QTimer.singleShot(1000, self._mail_sender)
+
         if args:
             self.lineEdit.setText(unicode(args[0]))
             self.lineedit_return_pressed()
@@ -106,15 +172,65 @@ class RngGui(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
         """React on click in table."""
         self.logger.info("Row %s activated." % str(index.row()))
         realrow = self.proxymodel.mapToSource(index).row()
-        bugnr = self.model.elements[realrow].bug_num
-        # find the bug in our list, and get the package and nr
-        for i in self.bugs:
-            if i.bug_num == bugnr:
-                self.currentBug = i
-                break
+        self.currentBug = self.model.elements[realrow]
+        bugnr = self.currentBug.bug_num
         self._stateChanged(self.currentBug.package, self.currentBug)
-        url = bts.BTS_URL + str(bugnr)
-        self._show_url(url)
+        self._show_url(bug_url(bugnr))
+        self.schedule_prefetch()
+
+
+    def eventFilter(self, obj, event):
+        """Watch the key presses in the table."""
+        if obj is self.tableView and event.type() == QtCore.QEvent.KeyPress:
+            previous = QtCore.QPersistentModelIndex(self.tableView.currentIndex())
+            # the table handles the key after us
+            QtCore.QTimer.singleShot(0, functools.partial(self.current_changed, previous))
+        return QtWidgets.QMainWindow.eventFilter(self, obj, event)
+
+
+    def current_changed(self, previous):
+        """Show the bug when moving through the table with the keyboard."""
+        current = self.tableView.currentIndex()
+        if current.isValid() and current != QtCore.QModelIndex(previous):
+            self.activated(current)
+
+
+    def schedule_prefetch(self, *args):
+        """Prefetch the pages of the visible bugs once the table settled."""
+        self.prefetchtimer.start()
+
+
+    def prefetch(self):
+        """Load the pages of the next bugs into the web cache.
+
+        Starting at the current row or the topmost visible row, whichever is
+        further down, the pages of the next prefetchRows bugs are fetched
+        unless they are fresh in the cache already.
+        """
+        cache = self.netmanager.cache()
+        if cache is None or self.settings.prefetchRows <= 0:
+            return
+        first = max(self.tableView.rowAt(0), self.tableView.currentIndex().row(), 0)
+        now = QtCore.QDateTime.currentDateTime()
+        for row in range(first, min(first + self.settings.prefetchRows, self.proxymodel.rowCount())):
+            realrow = self.proxymodel.mapToSource(self.proxymodel.index(row, 0)).row()
+            url = bug_url(self.model.elements[realrow].bug_num)
+            if url in self.prefetching:
+                continue
+            meta = cache.metaData(QtCore.QUrl(url))
+            if meta.isValid() and meta.expirationDate() > now:
+                continue
+            self.logger.debug("Prefetching %s." % url)
+            self.prefetching.add(url)
+            reply = self.netmanager.get(QtNetwork.QNetworkRequest(QtCore.QUrl(url)))
+            reply.finished.connect(functools.partial(self._prefetch_finished, url, reply))
+
+
+    def _prefetch_finished(self, url, reply):
+        if reply.error() != QtNetwork.QNetworkReply.NoError:
+            self.logger.debug("Prefetching %s failed: %s" % (url, reply.errorString()))
+        self.prefetching.discard(url)
+        reply.deleteLater()
 
 
     def new_bugreport(self):
@@ -168,67 +284,150 @@ class RngGui(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
         self.lineEdit.clear()
         # TODO: self.lineEdit.clear() does not always work, why?
         #QtCore.QTimer.singleShot(0,self.lineEdit,QtCore.SLOT("clear()"))
-        query = rng.translate_query(text)
-        self.logger.debug("Query: %s" % str(query))
+        self._start_query(text)
 
-        # test if there is a submit-as field available and rename the packages
-        # if nececesairy
-        for i in range(0, len(query), 2):
-            if query[i] == 'package':
-                realname = bug.submit_as(query[i+1])
-                if query[i+1] != realname:
-                    self.logger.debug("Using %s as package name as requested by developer." % str(realname))
-                    query[i+1] = realname
-        # Single bug or list of bugs?
-        if query[0]:
-            buglist = bts.get_bugs(query)
-        else:
-            buglist = [query[1]]
+
+    def refresh(self):
+        """Run the last query again, bypassing the cached buglist.
+
+        Only the new bugs and the bugs not fetched in the last
+        rngfetch.REFRESH_MAXAGE seconds are fetched from the BTS. The BTS
+        can't tell which bugs changed since a given time, so finding the
+        bugs whose log_modified moved takes fetching all of them; a refresh
+        right after the query or another refresh is cheap, a later one
+        costs as much as the query itself.
+
+        If the last query is complete, only the changes are applied to the
+        buglist, otherwise the query is started from scratch.
+        """
+        self.logger.info("Refresh.")
+        if not self.querytext:
+            return
+        incremental = not self.querythread and bool(self.model.elements)
+        self._start_query(self.querytext, True, incremental)
+
+
+    def _start_query(self, text, refresh=False, incremental=False):
+        """Start a QueryThread for text.
+
+        If incremental is True, the query only applies the changes to the
+        current buglist instead of replacing it.
+        """
+        self.querytext = text
+        # the old query might still be running, abort it and make sure it
+        # doesn't mess with our model anymore
+        if self.querythread:
+            self.querythread.cancel()
+            self.querythread.translated.disconnect(self.query_translated)
+            self.querythread.progress.disconnect(self.fetch_progress)
+            self.querythread.matchesFetched.disconnect(self.matches_fetched)
+            self.querythread.buglistFetched.disconnect(self.buglist_fetched)
+            self.querythread.chunkFetched.disconnect(self.chunk_fetched)
+            self.querythread.fetchFailed.disconnect(self.fetch_failed)
+            self.querythread.finished.disconnect(self.query_finished)
+        self.incremental = incremental
+        if not self.incremental:
+            self.model.set_elements([])
+            self.model.set_matches({})
+            self.tableView.setColumnHidden(7, True)
+        self.load_started()
+        self.querythread = QueryThread(text, self.backend, self.bugcache,
+                                       self.querycache, refresh, self)
+        self.querythread.translated.connect(self.query_translated)
+        self.querythread.progress.connect(self.fetch_progress)
+        self.querythread.matchesFetched.connect(self.matches_fetched)
+        self.querythread.buglistFetched.connect(self.buglist_fetched)
+        self.querythread.chunkFetched.connect(self.chunk_fetched)
+        self.querythread.fetchFailed.connect(self.fetch_failed)
+        self.querythread.finished.connect(self.query_finished)
+        self.querythread.finished.connect(self.querythread.deleteLater)
+        self.querythread.start()
+
+
+    def _stale(self):
+        """Return True if the signal being handled comes from a superseded
+        query thread.
+
+        Signals of a thread are queued, so some of them might still arrive
+        after the thread was disconnected in _start_query.
+        """
+        return self.sender() is not self.querythread
+
+
+    def query_translated(self, query):
+        """The query thread translated the query.
+
+        For a batch of queries, query is empty.
+        """
+        if self._stale():
+            return
+        self.logger.debug("Query: %s" % str(query))
+        self.query = query
         # ok, we know the package, so enable some buttons which don't depend
         # on the existence of the acutal packe (wnpp) or bugreports for that
         # package.
-        if query[0] in ("src", "package"):
+        if query and query[0] in ("src", "package"):
             self._stateChanged(query[1], None)
         # if we got a bugnumber we'd like to select it and enable some more
         # buttons. unfortunately we don't know if the bugnumber actually exists
         # for now, so we have to wait a bit until the bug is fetched.
         else:
             self._stateChanged(None, None)
-        self.logger.debug("Buglist matching the query: %s" % str(buglist))
-        chunksize = 50
-        if len(buglist) > chunksize:
-            self.load_started()
-            self.logger.debug("Buglist longer than %i, splitting in chunks." % chunksize)
-            self.bugs = []
-            i = 0
-            for chunk in chunks(buglist, chunksize):
-                i += 1
-                progress = int(100. * i * chunksize / len(buglist))
-                if progress > 100:
-                    progress = 100
-                self.load_progress(progress)
-                bl = bts.get_status(chunk)
-                if len(bl) == 0:
-                    self.logger.error("One of the following bugs caused the BTS to hickup: %s" % str(bl))
-                self.bugs.extend(bl)
-            self.load_finished(True)
-        else:
-            self.bugs = bts.get_status(buglist)
-        # ok, we fetched the bugs. see if the list isn't empty
-        if query[0] in (None,) and len(self.bugs) > 0:
-            self.currentBug = self.bugs[0]
+
+
+    def matches_fetched(self, matches):
+        """The query thread fetched the buglists of a batch of queries."""
+        if self._stale():
+            return
+        self.model.set_matches(matches)
+        self.tableView.setColumnHidden(7, False)
+
+
+    def buglist_fetched(self, buglist):
+        """The query thread fetched the buglist."""
+        if self._stale():
+            return
+        if self.incremental:
+            self.model.retain_elements(buglist)
+
+
+    def chunk_fetched(self, bugs):
+        """The query thread fetched the next chunk of bugreports."""
+        if not bugs or self._stale():
+            return
+        if self.incremental:
+            self.model.update_elements(bugs)
+            return
+        # ok, we fetched the first bugs. see if the list isn't empty
+        if self.query and self.query[0] in (None,) and len(self.model.elements) == 0:
+            self.currentBug = bugs[0]
             self.currentPackage = self.currentBug.package
             self._stateChanged(self.currentPackage, self.currentBug)
-        self.model.set_elements(self.bugs)
-        self.tableView.resizeRowsToContents()
+        self.model.append_elements(bugs)
+
+
+    def query_finished(self):
+        """The query thread is done."""
+        if self._stale():
+            return
+        self.logger.debug("Query finished, got %i bugs." % len(self.model.elements))
+        self.querythread = None
+        self.load_finished(True)
+        # resizing all rows takes time proportional to the length of the
+        # list, so don't do it for an incremental refresh
+        if not self.incremental:
+            self.tableView.resizeRowsToContents()
+        self.schedule_prefetch()
 
 
     def settings_diag(self):
         """Spawn settings dialog and get settings."""
+        from rngsettingsdialog import RngSettingsDialog
         s = RngSettingsDialog(self.settings)
         if s.exec_() == s.Accepted:
             self.logger.debug("Accepted settings change, applying.")
             self.settings = s.settings
+            self.model.set_colors(self.settings)
 
 
     def about(self):
@@ -270,13 +469,14 @@ the Free Software Foundation; either version 2 of the License, or
             self.actionAdditionalInfo.setEnabled(1)
             self.actionCloseBugreport.setEnabled(1)
         else:
-            self.currentBug = bts.Bugreport()
+            self.currentBug = None
             self.actionAdditionalInfo.setEnabled(0)
             self.actionCloseBugreport.setEnabled(0)
 
 
     def __submit_dialog(self, type):
         """Setup and spawn the submit dialog."""
+        from rngsubmitdialog import SubmitDialog
         dialog = SubmitDialog()
         dialog.checkBox_script.setChecked(self.settings.script)
         dialog.checkBox_presubj.setChecked(self.settings.presubj)
@@ -342,6 +542,8 @@ the Free Software Foundation; either version 2 of the License, or
             presubj = dialog.checkBox_presubj.isChecked()
 
             body, subject = '', ''
+            # the arguments of prepareBody, which may take a while
+            bodyargs = None
             # WNPP Bugreport
             if dialog.wnpp_comboBox.isEnabled():
                 action = dialog.wnpp_comboBox.currentText()
@@ -357,17 +559,73 @@ the Free Software Foundation; either version 2 of the License, or
             else:
                 if type == 'moreinfo':
                     severity = ""
-                subject = unicode("[%s] %s" % (package, dialog.lineEditSummary.text()))
-                body = rng.prepareBody(package, version, severity, tags, cc, script)
+                summary = unicode(dialog.lineEditSummary.text())
+                if summary:
+                    subject = u"[%s] %s" % (package, summary)
+                bodyargs = (package, version, severity, tags, cc, script)
 
             if len(subject) == 0:
-                subject = "Please enter a subject before submitting the report."
+                subject = rng.NO_SUBJECT
 
             if presubj:
                 txt = rng.get_presubj(package)
                 if txt:
                     QtWidgets.QMessageBox.information(self, "Information", txt)
-            thread.start_new_thread(rng.prepareMail, (mua, to, subject, body))
+            thread.start_new_thread(self.__send_report, (mua, to, subject, body, bodyargs))
+
+
+    def __send_report(self, mua, to, subject, body, bodyargs=None):
+        """Prepare the body if bodyargs are given and hand the bugreport to
+        the MUA or to compose_report for the built-in mailers, runs in its
+        own thread."""
+        builtin = mua in rng.BUILTIN_MAILERS
+        attachments = []
+        if bodyargs:
+            body = rng.prepareBody(*bodyargs, timeout=self.settings.scriptTimeout,
+                                   maxsize=self.settings.scriptMaxSize * 1024,
+                                   progress=self.scriptProgress.emit,
+                                   attachments=attachments if builtin else None)
+        if not builtin:
+            rng.prepareMail(mua, to, subject, body)
+            return
+        self.reportPrepared.emit(mua, to, subject, body, attachments)
+
+
+    def compose_report(self, mua, to, subject, body, attachments):
+        """Let the user write the prepared bugreport and queue it in the
+        outbox of the built-in mailers once the dialog is accepted."""
+        from rngcomposedialog import ComposeDialog
+        dialog = ComposeDialog(to, subject, body, attachments, self)
+        if dialog.exec_() != dialog.Accepted:
+            self.logger.debug("Bugreport to %s discarded." % to)
+            for fname in attachments:
+                try:
+                    os.remove(fname)
+                except OSError:
+                    pass
+            return
+        import rngmail
+        sender = self._mail_sender()
+        try:
+            rngmail.submit(sender.outbox, mua, self.settings, to, dialog.subject(),
+                           dialog.body(), attachments)
+        except (IOError, OSError) as e:
+            self.logger.error("Unable to queue the bugreport: %s" % str(e))
+            self.mail_sent("", False, str(e))
+            return
+        sender.wake()
+
+
+    def _mail_sender(self):
+        """Return the mail sender of the built-in mailers, starting it if
+        necessary."""
+        with self.mailsenderlock:
+            if self.mailsender is None:
+                import rngmail
+                transport = functools.partial(rngmail.transport, settings=self.settings)
+                self.mailsender = rngmail.Sender(rngmail.Outbox(), transport, self.mailSent.emit)
+                self.mailsender.start()
+            return self.mailsender
 
 
     def _apply_settings(self):
@@ -386,6 +644,7 @@ the Free Software Foundation; either version 2 of the License, or
         self.tableView.setSortingEnabled(True)
         self.tableView.sortByColumn(self.settings.sortByCol, order)
         self.checkBox.setChecked(self.settings.hideClosedBugs)
+        self.model.set_colors(self.settings)
 
 
     def _get_settings(self):
@@ -423,6 +682,37 @@ the Free Software Foundation; either version 2 of the License, or
         self.progressbar.setValue(progress)
 
 
+    def fetch_progress(self, progress):
+        """Fetching the bugreports advanced."""
+        if self._stale():
+            return
+        self.load_progress(progress)
+
+
+    def fetch_failed(self, error):
+        """Fetching the bugreports failed."""
+        if self._stale():
+            return
+        msg = QCoreApplication.translate("RngGui", "Fetching the bugreports failed: %s") % error
+        self.statusbar.showMessage(msg, 10 * 1000)
+
+
+    def script_progress(self, size, seconds):
+        """The package's bug script is running."""
+        msg = QCoreApplication.translate("RngGui", "Running the bug script: %i KiB after %i seconds") % (size / 1024, seconds)
+        # vanishes by itself once the script is done
+        self.statusbar.showMessage(msg, 2 * 1000)
+
+
+    def mail_sent(self, name, delivered, error):
+        """The mail sender tried to deliver a bugreport."""
+        if delivered:
+            msg = QCoreApplication.translate("RngGui", "The bugreport was sent.")
+        else:
+            msg = QCoreApplication.translate("RngGui", "Sending the bugreport failed: %s") % error
+        self.statusbar.showMessage(msg, 10 * 1000)
+
+
     def load_finished(self, ok):
         """Webview finished do load the page."""
         self.progressbar.reset()
@@ -435,20 +725,169 @@ the Free Software Foundation; either version 2 of the License, or
         self.proxymodel.invalidate()
 
 
+def bug_url(bugnr):
+    """Return the URL of the page of a bug."""
+    return "%s?bug=%i" % (BUGPAGE, int(bugnr))
+
+
+def is_bug_page(url):
+    """Return True if the QUrl points to the page of a bug."""
+    return unicode(url.toString()).startswith(BUGPAGE)
+
+
+class BugPageCache(QtNetwork.QNetworkDiskCache):
+    """Disk cache which keeps bug pages for maxage seconds.
+
+    The BTS doesn't allow its pages to be cached, so the caching headers of
+    the bug pages are replaced by an expiration date maxage seconds in the
+    future, just like the bugs in rngcache.BugCache. With the default
+    PreferNetwork, Qt serves a page from the cache until it expires and
+    loads it again afterwards.
+    """
+
+    def __init__(self, maxage, parent=None):
+        QtNetwork.QNetworkDiskCache.__init__(self, parent)
+        self.maxage = maxage
+
+
+    def prepare(self, metaData):
+        status = metaData.attributes().get(QtNetwork.QNetworkRequest.HttpStatusCodeAttribute)
+        if is_bug_page(metaData.url()) and status == 200:
+            metaData = QtNetwork.QNetworkCacheMetaData(metaData)
+            metaData.setRawHeaders([(k, v) for k, v in metaData.rawHeaders()
+                                    if str(k).lower() not in ("cache-control", "pragma", "expires")])
+            metaData.setExpirationDate(QtCore.QDateTime.currentDateTime().addSecs(self.maxage))
+            metaData.setSaveToDisk(True)
+        return QtNetwork.QNetworkDiskCache.prepare(self, metaData)
+
+
+class QueryThread(QtCore.QThread):
+    """Runs a query against the BTS without blocking the GUI.
+
+    The bugreports are passed chunk by chunk via the chunkFetched signal, in
+    the order the BTS returned the bugnumbers.
+
+    If refresh is True, the buglist is fetched from the BTS even if it is
+    fresh in the query cache, and only the bugs fetched in the last
+    rngfetch.REFRESH_MAXAGE seconds are taken from the bug cache.
+
+    A text containing several queries seperated by commas is run as batch:
+    the buglists of all queries are fetched concurrently and merged, the
+    status of each bug is fetched only once. Before the merged buglist,
+    matchesFetched passes a dictionary mapping each bugnumber to the queries
+    which found it.
+
+    A cancelled thread stops fetching as soon as possible and doesn't emit
+    any signals but finished anymore.
+
+    If the status of the bugs can't be fetched, e.g. because the BTS is
+    unreachable, the thread stops and fetchFailed passes the error message.
+    """
+
+    translated = QtCore.pyqtSignal(list)
+    progress = QtCore.pyqtSignal(int)
+    matchesFetched = QtCore.pyqtSignal(dict)
+    buglistFetched = QtCore.pyqtSignal(list)
+    chunkFetched = QtCore.pyqtSignal(list)
+    fetchFailed = QtCore.pyqtSignal(str)
+
+    def __init__(self, text, backend=bts, bugcache=None, querycache=None,
+                 refresh=False, parent=None):
+        QtCore.QThread.__init__(self, parent)
+        self.logger = logging.getLogger("QueryThread")
+        self.text = text
+        self.backend = backend
+        self.bugcache = bugcache
+        self.querycache = querycache
+        self.refresh = refresh
+        self.cancelled = threading.Event()
+
+
+    def cancel(self):
+        """Abort the query, may be called from any thread."""
+        self.logger.debug("Cancelling query %s." % self.text)
+        self.cancelled.set()
+
+
+    def run(self):
+        terms = []
+        for text in rng.split_queries(self.text):
+            query = self.translate(text)
+            if query:
+                terms.append((text, query))
+        if not terms or self.cancelled.is_set():
+            return
+        if len(terms) == 1:
+            self.translated.emit(terms[0][1])
+        else:
+            self.translated.emit([])
+        buglists = rngfetch.fetch_buglists([query for text, query in terms],
+                                           self.get_bugs, cancel=self.cancelled)
+        if self.cancelled.is_set() or buglists.count(None) == len(buglists):
+            return
+        buglist, matches = rngfetch.merge_buglists(buglists)
+        if len(terms) > 1:
+            self.matchesFetched.emit(dict((nr, [terms[i][0] for i in indices])
+                                          for nr, indices in matches.items()))
+        self.logger.debug("Buglist matching the query: %s" % str(buglist))
+        self.buglistFetched.emit(buglist)
+        try:
+            rngfetch.fetch_status(buglist, progress=self.progress.emit,
+                                  callback=self.chunkFetched.emit,
+                                  get_status=self.backend.get_status,
+                                  cache=self.bugcache, cancel=self.cancelled,
+                                  maxage=rngfetch.REFRESH_MAXAGE if self.refresh else None)
+        except Exception as e:
+            if not self.cancelled.is_set():
+                self.fetchFailed.emit(str(e))
+
+
+    def translate(self, text):
+        """Translate text into a query for the BTS."""
+        return rng.apply_submit_as(rng.translate_query(text))
+
+
+    def get_bugs(self, query):
+        """Return the buglist for query, from the cache if possible."""
+        return rngfetch.get_buglist(query, self.backend.get_bugs,
+                                    self.querycache, self.refresh)
+
+
 class TableModel(QtCore.QAbstractTableModel):
+    """Model of the bugs in the table.
+
+    data() is called for every cell on every paint, so the displayed values
+    of all rows are computed once when the bugs are set: columns holds a
+    list of QVariants per column and colors the key of the foreground color
+    per row, data() only indexes them.
+    """
+
+    # keys of the foreground colors, the settings call them c_<key>
+    COLORS = ("wishlist", "minor", "normal", "important", "serious", "grave",
+              "critical", "resolved")
 
     def __init__(self, parent=None):
         QtCore.QAbstractTableModel.__init__(self, parent)
         self.parent = parent
         self.logger = logging.getLogger("TableModel")
         self.elements = []
+        # bugnumber -> row
+        self.rows = {}
+        # bugnumber -> queries of a batch which found the bug
+        self.matches = {}
+        # the displayed values, one list per column, and the key of the
+        # foreground color of each row
+        self.columns, self.colors = self._compute_rows([])
+        # color key -> QVariant of the QColor
+        self.palette = {}
         self.header = [QCoreApplication.translate('TableModel', "Bugnumber"),
                        QCoreApplication.translate('TableModel', "Package"),
                        QCoreApplication.translate('TableModel', "Summary"),
                        QCoreApplication.translate('TableModel', "Status"),
                        QCoreApplication.translate('TableModel', "Severity"),
                        QCoreApplication.translate('TableModel', "Tags"),
-                       QCoreApplication.translate('TableModel', "Last Action")]
+                       QCoreApplication.translate('TableModel', "Last Action"),
+                       QCoreApplication.translate('TableModel', "Matched")]
 
 
     def rowCount(self, parent):
@@ -465,42 +904,11 @@ class TableModel(QtCore.QAbstractTableModel):
     def data(self, index, role):
         if not index.isValid():
             return QtCore.QVariant()
+        if role == QtCore.Qt.DisplayRole:
+            return self.columns[index.column()][index.row()]
         if role == QtCore.Qt.ForegroundRole:
-            severity = self.elements[index.row()].severity.lower()
-            done = self.elements[index.row()].done
-            c = self.parent.settings.c_normal
-            if severity == "grave":
-                c = self.parent.settings.c_grave
-            elif severity == "serious":
-                c = self.parent.settings.c_serious
-            elif severity == "critical":
-                c = self.parent.settings.c_critical
-            elif severity == "important":
-                c = self.parent.settings.c_important
-            elif severity == "minor":
-                c = self.parent.settings.c_minor
-            elif severity == "wishlist":
-                c = self.parent.settings.c_wishlist
-            if done:
-                c = self.parent.settings.c_resolved
-            return QtCore.QVariant(QtGui.QColor(c))
-        if role != QtCore.Qt.DisplayRole:
-            return QtCore.QVariant()
-        bug = self.elements[index.row()]
-        if bug.archived:
-            status = "Archived"
-        elif bug.done:
-            status = "Closed"
-        else:
-            status = "Open"
-        data = {0 : bug.bug_num,
-                1 : bug.package,
-                2 : bug.subject,
-                3 : status,
-                4 : bug.severity,
-                5 : ", ".join(bug.tags),
-                6 : QtCore.QDate(bug.log_modified)}[index.column()]
-        return QtCore.QVariant(data)
+            return self.palette[self.colors[index.row()]]
+        return QtCore.QVariant()
 
 
     #
@@ -515,16 +923,136 @@ class TableModel(QtCore.QAbstractTableModel):
             return QtCore.QVariant()
 
 
+    def set_colors(self, settings):
+        """Set the foreground colors from settings."""
+        self.palette = dict((key, QtCore.QVariant(QtGui.QColor(getattr(settings, "c_" + key))))
+                            for key in self.COLORS)
+        if self.elements:
+            self.dataChanged.emit(self.index(0, 0),
+                                  self.index(len(self.elements)-1, len(self.header)-1))
+
+
+    def _color(self, bug):
+        if bug.done:
+            return "resolved"
+        severity = bug.severity.lower()
+        return severity if severity in self.COLORS else "normal"
+
+
+    def _status(self, bug):
+        if bug.archived:
+            return "Archived"
+        elif bug.done:
+            return "Closed"
+        return "Open"
+
+
+    def _matched(self, bug):
+        return QtCore.QVariant(", ".join(self.matches.get(int(bug.bug_num), [])))
+
+
+    def _compute_rows(self, bugs):
+        """Return the columns and colors of bugs."""
+        QVariant = QtCore.QVariant
+        columns = [[QVariant(bug.bug_num) for bug in bugs],
+                   [QVariant(bug.package) for bug in bugs],
+                   [QVariant(bug.subject) for bug in bugs],
+                   [QVariant(self._status(bug)) for bug in bugs],
+                   [QVariant(bug.severity) for bug in bugs],
+                   [QVariant(", ".join(bug.tags)) for bug in bugs],
+                   [QVariant(QtCore.QDate(bug.log_modified)) for bug in bugs],
+                   [self._matched(bug) for bug in bugs]]
+        return columns, [self._color(bug) for bug in bugs]
+
+
     def set_elements(self, entries):
         self.logger.info("Setting Elements.")
-        self.beginRemoveRows(QtCore.QModelIndex(), 0, len(self.elements)-1)
-        self.elements = []
-        self.endRemoveRows()
-        self.beginInsertRows(QtCore.QModelIndex(), 0, len(entries)-1)
-        self.elements = entries
+        if self.elements:
+            self.beginRemoveRows(QtCore.QModelIndex(), 0, len(self.elements)-1)
+            self.elements = []
+            self.columns, self.colors = self._compute_rows([])
+            self.endRemoveRows()
+        self.rows = {}
+        if entries:
+            columns, colors = self._compute_rows(entries)
+            self.beginInsertRows(QtCore.QModelIndex(), 0, len(entries)-1)
+            self.elements = entries
+            self.columns, self.colors = columns, colors
+            self._index_rows(0)
+            self.endInsertRows()
+
+
+    def set_matches(self, matches):
+        """Set the queries which found each bug."""
+        self.matches = matches
+        self.columns[7] = [self._matched(bug) for bug in self.elements]
+        if self.elements:
+            self.dataChanged.emit(self.index(0, 7), self.index(len(self.elements)-1, 7))
+
+
+    def append_elements(self, entries):
+        if not entries:
+            return
+        first = len(self.elements)
+        columns, colors = self._compute_rows(entries)
+        self.beginInsertRows(QtCore.QModelIndex(), first, first+len(entries)-1)
+        self.elements.extend(entries)
+        for column, values in zip(self.columns, columns):
+            column.extend(values)
+        self.colors.extend(colors)
+        self._index_rows(first)
         self.endInsertRows()
 
 
+    def update_elements(self, entries):
+        """Replace the bugs which changed and append the new ones."""
+        new = []
+        for bug in entries:
+            row = self.rows.get(int(bug.bug_num))
+            if row is None:
+                new.append(bug)
+                continue
+            if self.elements[row].log_modified != bug.log_modified:
+                self.elements[row] = bug
+                columns, colors = self._compute_rows([bug])
+                for column, values in zip(self.columns, columns):
+                    column[row] = values[0]
+                self.colors[row] = colors[0]
+                self.dataChanged.emit(self.index(row, 0),
+                                      self.index(row, len(self.header)-1))
+        self.logger.debug("Updated %i bugs, %i new ones." % (len(entries) - len(new), len(new)))
+        self.append_elements(new)
+
+
+    def retain_elements(self, bugnumbers):
+        """Remove all bugs which are not in bugnumbers."""
+        keep = set(int(i) for i in bugnumbers)
+        rows = sorted(row for nr, row in self.rows.items() if nr not in keep)
+        if not rows:
+            return
+        self.logger.debug("Removing %i bugs." % len(rows))
+        # remove contiguous blocks of rows, starting at the end so the
+        # remaining row numbers stay valid
+        while rows:
+            last = rows.pop()
+            first = last
+            while rows and rows[-1] == first - 1:
+                first = rows.pop()
+            self.beginRemoveRows(QtCore.QModelIndex(), first, last)
+            del self.elements[first:last+1]
+            for column in self.columns:
+                del column[first:last+1]
+            del self.colors[first:last+1]
+            self.endRemoveRows()
+        self.rows = {}
+        self._index_rows(0)
+
+
+    def _index_rows(self, first):
+        for row in range(first, len(self.elements)):
+            self.rows[int(self.elements[row].bug_num)] = row
+
+
 class MySortFilterProxyModel(QtCore.QSortFilterProxyModel):
 
     def __init__(self, parent=None):
@@ -545,17 +1073,3 @@ class MySortFilterProxyModel(QtCore.QSortFilterProxyModel):
         if self.sourceModel().elements[sourceRow].done and self.parent.settings.hideClosedBugs:
             return False
         return QtCore.QSortFilterProxyModel.filterAcceptsRow(self, sourceRow, sourceParent)
-
-
-class SubmitDialog(QtWidgets.QDialog, submitdialog.Ui_SubmitDialog):
-
-    def __init__(self):
-        QtWidgets.QDialog.__init__(self)
-        self.setupUi(self)
-        self.buttonBox.button(QtWidgets.QDialogButtonBox.Ok).clicked.connect(self.accept)
-        self.buttonBox.button(QtWidgets.QDialogButtonBox.Cancel).clicked.connect(self.reject)
-        self.comboBoxSeverity.currentIndexChanged.connect(self.severity_changed)
-
-    def severity_changed(self, index):
-        self.label_severity.setText(rng.getSeverityExplanation(index))
-
@@ -23,33 +23,73 @@ import os
 import webbrowser
 import urllib
 import thread
+import threading
+import time
 import logging
 import ConfigParser
 import tempfile
-
-from PyQt5.QtCore import QCoreApplication
+import json
+import subprocess
+import signal
 
 import bug
+import rngcache
+import rngdpkg
+import rngapt
 
 
 logger = logging.getLogger("ReportbugNG")
 
 
-RFC_MAILTO = '"mailto:%(to)s?subject=%(subject)s&body=%(body)s"'
+class _LazyQCoreApplication(object):
+    """Stand-in for QCoreApplication which imports PyQt5 on first use.
+
+    This keeps the helpers usable without PyQt5, e.g. for the headless mode
+    in rngcli.
+    """
+
+    def __getattr__(self, name):
+        from PyQt5.QtCore import QCoreApplication
+        return getattr(QCoreApplication, name)
+
+
+QCoreApplication = _LazyQCoreApplication()
+
+
+# The MUAs are called without a shell, every item of their command line is
+# formatted with to, subject and body.
+RFC_MAILTO = 'mailto:%(to)s?subject=%(subject)s&body=%(body)s'
 MUA_SYNTAX = {
-    "default" : 'xdg-email --utf8 --subject "%(subject)s" --body "%(body)s" "%(to)s"',
-    "icedove" : 'icedove -compose ' + RFC_MAILTO,
-    "iceape" : 'iceape -compose ' + RFC_MAILTO,
-    "evolution" : 'evolution ' + RFC_MAILTO,
-    "kmail" : 'kmail --composer --subject "%(subject)s" --body "%(body)s" "%(to)s"',
-#    "opera" : 'opera -newpage ' + RFC_MAILTO,
-    "sylpheed" : 'sylpheed --compose ' + RFC_MAILTO,
-    "claws-mail" : 'claws-mail --compose ' + RFC_MAILTO,
-    "mutt" : 'mutt ' + RFC_MAILTO,
-    "mutt-ng" : 'muttng ' + RFC_MAILTO,
-    "pine" : 'pine -url ' + RFC_MAILTO,
+    "default" : ['xdg-email', '--utf8', '--subject', '%(subject)s', '--body', '%(body)s', '%(to)s'],
+    "icedove" : ['icedove', '-compose', RFC_MAILTO],
+    "iceape" : ['iceape', '-compose', RFC_MAILTO],
+    "evolution" : ['evolution', RFC_MAILTO],
+    "kmail" : ['kmail', '--composer', '--subject', '%(subject)s', '--body', '%(body)s', '%(to)s'],
+#    "opera" : ['opera', '-newpage', RFC_MAILTO],
+    "sylpheed" : ['sylpheed', '--compose', RFC_MAILTO],
+    "claws-mail" : ['claws-mail', '--compose', RFC_MAILTO],
+    "mutt" : ['mutt', RFC_MAILTO],
+    "mutt-ng" : ['muttng', RFC_MAILTO],
+    "pine" : ['pine', '-url', RFC_MAILTO],
 #    "googlemail" : 'https://gmail.google.com/gmail?view=cm&cmid=0&fs=1&tearoff=1&to=%(to)s&su=%(subject)s&body=%(body)s'
-    'alpine' : 'alpine -url ' + RFC_MAILTO,
+    'alpine' : ['alpine', '-url', RFC_MAILTO],
+              }
+# The command lines used if the body doesn't fit into the command line. The
+# whole body is written to file, which the MUAs either read as body or
+# attach to the mail. In the latter case body is the beginning of the
+# body, plainsubject is the subject without quoting.
+MUA_FILE_SYNTAX = {
+    "default" : ['xdg-email', '--utf8', '--subject', '%(subject)s', '--body', '%(body)s', '--attach', '%(file)s', '%(to)s'],
+    "icedove" : ['icedove', '-compose', "to='%(to)s',subject='%(plainsubject)s',message='%(file)s'"],
+    "iceape" : ['iceape', '-compose', "to='%(to)s',subject='%(plainsubject)s',message='%(file)s'"],
+    "evolution" : ['evolution', RFC_MAILTO + '&attach=%(file)s'],
+    "kmail" : ['kmail', '--composer', '--subject', '%(subject)s', '--msg', '%(file)s', '%(to)s'],
+    "sylpheed" : ['sylpheed', '--compose', RFC_MAILTO, '--attach', '%(file)s'],
+    "claws-mail" : ['claws-mail', '--compose', RFC_MAILTO, '--attach', '%(file)s'],
+    "mutt" : ['mutt', '-s', '%(plainsubject)s', '-i', '%(file)s', '--', '%(to)s'],
+    "mutt-ng" : ['muttng', '-s', '%(plainsubject)s', '-i', '%(file)s', '--', '%(to)s'],
+    "pine" : ['pine', '-attach', '%(file)s', '-url', RFC_MAILTO],
+    'alpine' : ['alpine', '-attach', '%(file)s', '-url', RFC_MAILTO],
               }
 
 
@@ -69,6 +109,8 @@ def getMUAString(mua):
 #   if mua == "googlemail" : return QCoreApplication.translate("Google")
     # If everything else fails, just return the string we got
     if mua == 'alpine': return QCoreApplication.translate("rnghelpers", "Alpine")
+    if mua == "smtp": return QCoreApplication.translate("rnghelpers", "Built-in (SMTP)")
+    if mua == "sendmail": return QCoreApplication.translate("rnghelpers", "Built-in (sendmail)")
     return mua
 
 MUA_STRINGS = {
@@ -79,14 +121,43 @@ MUA_NO_URLQUOTE = ["default", "kmail"]
 MUA_NEEDS_TERMINAL = ["mutt", "mutt-ng", "pine", 'alpine']
 # Who needs a browser?
 WEBMAIL = ["googlemail"]
+# Sent by reportbug-ng itself, see rngmail
+BUILTIN_MAILERS = ["smtp", "sendmail"]
+SENDMAIL = "/usr/sbin/sendmail"
 
-# HACK: don't know the maximum lenght of a command yet
+# Longer output of the bug script is not embedded into the body, and a body
+# handed to the MUA as attachment is accompanied by this much of its
+# beginning
 MAX_BODY_LEN = 10000
+# Bytes of the command line reserved for whatever the exec of the MUA needs
+# besides the arguments and the environment
+ARG_MAX_MARGIN = 2048
+# Linux' limit for a single argument (MAX_ARG_STRLEN)
+MAX_ARG_LEN = 32 * 4096
+# Size of the pointer to each argument and environment variable
+POINTER_SIZE = 8
+
+# Seconds to wait for a section of the bugreport body, the package's bug
+# script may be interactive and gets more time
+SECTION_TIMEOUT = 10
+SCRIPT_TIMEOUT = 300
+# Bytes of output of the bug script which are kept, the rest is cut off
+SCRIPT_MAXSIZE = 1024 * 1024
+# Seconds between two checks of the running bug script
+SCRIPT_POLL = 0.5
+XTERM = "/usr/bin/xterm"
 
 
 # Those strings must not be translated!
 WNPP_ACTIONS = ("RFP", "ITP", "RFH", "RFA", "O")
 SEVERITY = ("Critical", "Grave", "Serious", "Important", "Normal", "Minor", "Wishlist")
+# The bugreport is written below this line of the body
+BODY_MARKER = "--- Please enter the report below this line. ---"
+# Subject of a bugreport the user didn't give a summary for
+NO_SUBJECT = "Please enter a subject before submitting the report."
+# Placeholders of the WNPP templates
+WNPP_PLACEHOLDERS = ("[PACKAGE]", "[SHORT DESCRIPTION]", "[NAME <name@example.com>]",
+                     "[http://example.com]", "[GPL, LGPL, BSD, MIT/X, etc.]", "[DESCRIPTION]")
 
 def getSeverityExplanation(severity):
     """Return a translated explanation of the severity."""
@@ -130,90 +201,208 @@ affects the packagename, bugnumber, summary, status and severity of a bug.</p>
 
 <h3>Step 3: Reporting Bugs</h3>
 <p>You can either provide additional information for an existing bug by clicking on the bug in the list and pressing the "Additional Info" button or you can create a new bugreport for the current package by clicking the "New Bugreport" button.</p>
+""") + \
+        QCoreApplication.translate("rnghelpers", """<p>Several queries separated by commas are run at the same time and their
+bugs are shown in one list, e.g.: "src:foo, src:bar, maintainer@foo.bar". The
+column "Matched" shows which of the queries found a bug.</p>
 """) + """</div>"""
 
-def getAvailableMUAs():
+def getSearchPath():
+    """Return the directories of $PATH."""
+    return [p for p in os.environ.get("PATH", os.defpath).split(os.pathsep) if p]
+
+
+def getAvailableMUAs(path=None):
     """
-    Returns a tuple of strings with available MUAs on this system. The Webmails
-    are always available, since there is no way to check.
+    Returns a list of strings with available MUAs on this system, looking in
+    the directories in path or $PATH. The Webmails are always available,
+    since there is no way to check, as is the built-in SMTP mailer.
     """
-    list = []
+    if path is None:
+        path = getSearchPath()
+    list = ["smtp"]
+    if os.access(SENDMAIL, os.X_OK):
+        list.append("sendmail")
     for mua in MUA_SYNTAX:
         if mua in WEBMAIL:
             list.append(mua)
             continue
-        command = MUA_SYNTAX[mua].split()[0]
-        for p in os.defpath.split(os.pathsep):
-            if os.path.exists(os.path.join(p, command)):
+        command = MUA_SYNTAX[mua][0]
+        for p in path:
+            if os.access(os.path.join(p, command), os.X_OK):
                 list.append(mua)
-                continue
+                break
     return list
 
 
-SUPPORTED_MUA = getAvailableMUAs()
-SUPPORTED_MUA.sort()
+MUACACHE = os.path.join(rngcache.CACHEDIR, "muas.json")
+_SUPPORTED_MUA = None
 
 
-def prepareMail(mua, to, subject, body, firstcall=True):
-    """Tries to call MUA with given parameters."""
+def _getMtimes(path):
+    mtimes = []
+    for p in path:
+        try:
+            mtimes.append(os.stat(p).st_mtime)
+        except OSError:
+            mtimes.append(None)
+    return mtimes
 
-    mua = mua.lower()
 
+def getSupportedMUAs(cachefile=MUACACHE):
+    """Return the sorted list of available MUAs.
+
+    The MUAs are looked up on first use and the result is cached in
+    cachefile, together with the directories of $PATH and their mtimes.
+    Installing or removing a program changes the mtime of its directory, so
+    the cached list is used as long as $PATH, the mtimes and the known MUAs
+    stay the same. This costs a single stat per directory.
+    """
+    global _SUPPORTED_MUA
+    if _SUPPORTED_MUA is not None:
+        return _SUPPORTED_MUA
+    path = getSearchPath()
+    mtimes = _getMtimes(path)
+    try:
+        f = open(cachefile)
+        cached = json.load(f)
+        f.close()
+        if (cached["path"] == path and cached["mtimes"] == mtimes and
+                sorted(cached["known"]) == sorted(list(MUA_SYNTAX) + BUILTIN_MAILERS)):
+            _SUPPORTED_MUA = cached["muas"]
+            return _SUPPORTED_MUA
+    except (IOError, ValueError, KeyError, TypeError):
+        pass
+    logger.debug("Looking for MUAs in %s." % str(path))
+    _SUPPORTED_MUA = sorted(getAvailableMUAs(path))
+    try:
+        if not os.path.isdir(os.path.dirname(cachefile)):
+            os.makedirs(os.path.dirname(cachefile))
+        # write to a temporary file first, so concurrent instances never
+        # read a half written cache
+        tmp = "%s.%i" % (cachefile, os.getpid())
+        f = open(tmp, "w")
+        json.dump({"path" : path, "mtimes" : mtimes,
+                   "known" : sorted(list(MUA_SYNTAX) + BUILTIN_MAILERS), "muas" : _SUPPORTED_MUA}, f)
+        f.close()
+        os.rename(tmp, cachefile)
+    except (IOError, OSError) as e:
+        logger.warning("Unable to cache the available MUAs: %s" % str(e))
+    return _SUPPORTED_MUA
+
+
+def getArgMax():
+    """Returns the number of bytes available for the command line of a new
+    process, i.e. ARG_MAX minus the environment."""
+    try:
+        argmax = os.sysconf("SC_ARG_MAX")
+    except (ValueError, OSError):
+        argmax = -1
+    if argmax <= 0:
+        # the minimum POSIX guarantees
+        argmax = 4096
+    env = sum(len(k) + len(v) + 2 + POINTER_SIZE for k, v in os.environ.items())
+    return argmax - env - POINTER_SIZE - ARG_MAX_MARGIN
+
+
+def fitsCommandLine(argv, argmax=None):
+    """Returns True if argv can be executed."""
+    if argmax is None:
+        argmax = getArgMax()
+    if max(len(a) for a in argv) >= MAX_ARG_LEN:
+        return False
+    return sum(len(a) + 1 + POINTER_SIZE for a in argv) <= argmax
+
+
+def formatMUACommand(mua, syntax, to, subject, body, fname=None):
+    """Returns the command line calling mua, syntax is MUA_SYNTAX or
+    MUA_FILE_SYNTAX."""
+    plainsubject = subject.encode("ascii", "replace").replace("'", "")
     if mua not in MUA_NO_URLQUOTE:
         subject = urllib.quote(subject.encode("ascii", "replace"))
         body = urllib.quote(body.encode("ascii", "replace"))
     else:
-        to = to.encode("ascii", "replace")
         subject = subject.encode("ascii", "replace")
         body = body.encode("ascii", "replace")
+    values = {"to" : to.encode("ascii", "replace"), "subject" : subject,
+              "body" : body, "plainsubject" : plainsubject, "file" : fname}
+    argv = [a % values for a in syntax[mua]]
+    if mua in MUA_NEEDS_TERMINAL:
+        argv = ["x-terminal-emulator", "-e"] + argv
+    return argv
 
-    # If quotes are used for this MUA, escape the quotes in the arguments:
-    if '"' in MUA_SYNTAX[mua] and MUA_SYNTAX[mua].count('"')%2 == 0:
-        to = to.replace('"', '\\"')
-        subject = subject.replace('"', '\\"')
-        body = body.replace('"', '\\"')
 
-    command = MUA_SYNTAX[mua] % {"to":to, "subject":subject, "body":body}
+def prepareMail(mua, to, subject, body):
+    """Tries to call MUA with given parameters.
 
-    if mua in MUA_NEEDS_TERMINAL:
-        command = "x-terminal-emulator -e "+command
+    If the body doesn't fit into the command line, it is written to a file
+    which is handed to the MUA instead, see MUA_FILE_SYNTAX.
+    """
+
+    mua = mua.lower()
 
     if mua in WEBMAIL:
-        callBrowser(command)
-    else:
-        status, output = callMailClient(command)
-        if status == 0:
-            return
-        # Great, calling the MUA failed, probably due too long output of the
-        # /usr/share/bug/$package/script...
-        if firstcall == False:
-            logger.error("Calling the MUA a second time with an even shorter message failed. Giving up.")
-            return
-        logger.warning("Grr! Calling the MUA failed. Status and output was: %s, %s. Length of the command is: %s" % (str(status), str(output), str(len(command))))
-        body = body[:MAX_BODY_LEN] + "\n\n[ MAILBODY EXCEEDED REASONABLE LENGTH, OUTPUT TRUNCATED ]"
-        prepareMail(mua, to, subject, body, False)
+        callBrowser(MUA_SYNTAX[mua] % {"to":to, "subject":urllib.quote(subject.encode("ascii", "replace")),
+                                       "body":urllib.quote(body.encode("ascii", "replace"))})
+        return
+
+    argv = formatMUACommand(mua, MUA_SYNTAX, to, subject, body)
+    if not fitsCommandLine(argv):
+        logger.info("Mailbody too long for the command line, handing it over as file.")
+        fd, fname = tempfile.mkstemp(".txt", "reportbug-ng-")
+        f = os.fdopen(fd, "w")
+        f.write(body.encode("utf-8", "replace"))
+        f.close()
+        head = body[:MAX_BODY_LEN]
+        head = head[:head.rfind("\n") + 1]
+        head += "\n[ The complete report is attached: %s ]\n" % os.path.basename(fname)
+        argv = formatMUACommand(mua, MUA_FILE_SYNTAX, to, subject, head, fname)
+    status, output = callMailClient(argv)
+    if status != 0:
+        logger.error("Calling the MUA failed. Status and output was: %s, %s" % (str(status), str(output)))
+
 
 
+def prepareBody(package, version=None, severity=None, tags=[], cc=[], script=True,
+                timeout=SCRIPT_TIMEOUT, maxsize=SCRIPT_MAXSIZE, progress=None,
+                attachments=None):
+    """Prepares the empty bugreport including body and system information.
 
-def prepareBody(package, version=None, severity=None, tags=[], cc=[], script=True):
-    """Prepares the empty bugreport including body and system information."""
+    timeout, maxsize and progress are passed to runPackageScript. If the
+    output of the bug script is too long for the body and attachments is a
+    list, the name of the file with the output is appended to it, otherwise
+    the body asks to attach the file.
+    """
 
     s = prepare_minimal_body(package, version, severity, tags, cc)
 
-    s += getSystemInfo() + "\n"
-    s += getDebianReleaseInfo() + "\n"
-    s += getPackageInfo(package) + "\n"
+    sections = [("System information", getSystemInfo, (), SECTION_TIMEOUT),
+                ("Debian release information", getDebianReleaseInfo, (), SECTION_TIMEOUT),
+                ("Package information", getPackageInfo, (package,), SECTION_TIMEOUT)]
+    if script:
+        sections.append(("Output from package bug script", runPackageScript,
+                         (package, timeout, maxsize, progress), timeout + SECTION_TIMEOUT))
+    results = collectSections(sections)
+
+    s += results[0] + "\n"
+    s += results[1] + "\n"
+    s += results[2] + "\n"
 
     if not script:
         return s
 
-    s2 = getPackageScriptOutput(package) + "\n"
-    if len(s+s2) > MAX_BODY_LEN:
+    spool = results[3]
+    if not spool or not os.path.isfile(spool):
+        # no script or the placeholder saying why there is no output
+        s += (spool or "") + "\n"
+        return s
+
+    if len(s) + os.path.getsize(spool) > MAX_BODY_LEN and attachments is not None:
+        attachments.append(spool)
+        s2 = "--- Output from package bug script: attached as %s ---\n" % os.path.basename(spool)
+    elif len(s) + os.path.getsize(spool) > MAX_BODY_LEN:
         logger.warning("Mailbody to long for os.pipe")
-        fd, fname = tempfile.mkstemp(".txt", "reportbug-ng-%s-" % package)
-        f = os.fdopen(fd, "w")
-        f.write(s2.encode('utf-8', 'replace'))
-        f.close()
+        # the spool file is attached as it is, the output is never read
         s2 = """
 -8<---8<---8<---8<---8<---8<---8<---8<---8<--
 Please attach the file:
@@ -221,12 +410,59 @@ Please attach the file:
 to the mail. I'd do it myself if the output wasn't too long to handle.
 
   Thank you!
-->8--->8--->8--->8--->8--->8--->8--->8--->8--""" % fname
+->8--->8--->8--->8--->8--->8--->8--->8--->8--""" % spool
+    else:
+        f = open(spool)
+        try:
+            s2 = unicode(f.read(), errors="replace") + "\n"
+        finally:
+            f.close()
+        os.remove(spool)
     s += s2
 
     return s
 
 
+def collectSections(sections):
+    """Run the functions collecting the sections of a bugreport concurrently.
+
+    sections is a list of tuples (name, function, args, timeout). Returns
+    the results of the functions in the order of sections. If a function
+    fails or doesn't return within timeout seconds, its result is a
+    placeholder saying so.
+    """
+    results = [None] * len(sections)
+
+    def collect(i, function, args):
+        try:
+            results[i] = (True, function(*args))
+        except Exception as e:
+            results[i] = (False, str(e))
+
+    started = time.time()
+    threads = []
+    for i, (name, function, args, timeout) in enumerate(sections):
+        t = threading.Thread(target=collect, args=(i, function, args))
+        # a section which hangs must not keep reportbug-ng alive
+        t.daemon = True
+        t.start()
+        threads.append(t)
+
+    collected = []
+    for i, (name, function, args, timeout) in enumerate(sections):
+        threads[i].join(max(0, started + timeout - time.time()))
+        result = results[i]
+        if result is None:
+            logger.warning("%s not collected within %i seconds." % (name, timeout))
+            collected.append("--- %s: not available, timed out after %i seconds. ---\n" % (name, timeout))
+        elif not result[0]:
+            logger.error("Collecting %s failed: %s" % (name, result[1]))
+            collected.append("--- %s: not available, %s ---\n" % (name, result[1]))
+        else:
+            collected.append(result[1])
+    return collected
+
+
 def prepare_minimal_body(package, version=None, severity=None, tags=[], cc=[]):
     """Prepares the body of the empty bugreport."""
 
@@ -244,7 +480,7 @@ def prepare_minimal_body(package, version=None, severity=None, tags=[], cc=[]):
     for i in cc:
         s += "X-Debbugs-CC: %s\n" % i
     s += "\n"
-    s += "--- Please enter the report below this line. ---\n\n\n"
+    s += BODY_MARKER + "\n\n\n"
 
     return s
 
@@ -275,6 +511,31 @@ Upstream Author: [NAME <name@example.com>]
     return s
 
 
+def check_report(subject, body, template):
+    """Return why the bugreport isn't ready to be sent or None if it is.
+
+    template is the body as it was prepared. The report is refused if the
+    subject is missing, if a WNPP placeholder is left or if nothing was
+    written below BODY_MARKER.
+    """
+    if not subject.strip() or subject.strip() == NO_SUBJECT:
+        return QCoreApplication.translate("rnghelpers", "Please enter a subject.")
+    for placeholder in WNPP_PLACEHOLDERS:
+        if placeholder in subject or (placeholder in body and placeholder in template):
+            return QCoreApplication.translate("rnghelpers", "Please replace the placeholder %s.") % placeholder
+    if _below_marker(body).split() == _below_marker(template).split():
+        if BODY_MARKER in body:
+            return QCoreApplication.translate("rnghelpers", "Please describe the problem below the line \"%s\".") % BODY_MARKER
+        return QCoreApplication.translate("rnghelpers", "Please write the bug report, the body is still the unmodified template.")
+    return None
+
+
+def _below_marker(body):
+    """Return the part of body below BODY_MARKER, or all of it if the
+    marker is missing."""
+    return body.split(BODY_MARKER, 1)[-1]
+
+
 def prepare_wnpp_subject(action, package, descr):
     if not package:
         package = "[PACKAGE]"
@@ -388,89 +649,121 @@ def pretty_print_depends(depends, depstring):
     return s
 
 
-def getPackageScriptOutput(package):
-    """Runs the package's script in /usr/share/bug/packagename/script or
-    /usr/share/bug/packagename and returns the output."""
-    output = ''
-    # In the first case the script is called "script", in the second one the
-    # script is just the packagename under /usr/share/bug
-    path = ["/usr/share/bug/" + str(package) + "/script",
-             "/usr/share/bug/" +str(package)]
-    xterm_path = "/usr/bin/xterm"
+def getPackageScript(package):
+    """Returns the path of the package's bug script or None.
+
+    The script is either /usr/share/bug/packagename or
+    /usr/share/bug/packagename/script.
+    """
+    return bug.get_script(package)
+
+
+def _prepareScript():
+    # bug scripts write their output to file descriptor 3, the own process
+    # group allows to kill the script together with its children
+    os.dup2(1, 3)
+    os.setpgrp()
+
+
+def runPackageScript(package, timeout=SCRIPT_TIMEOUT, maxsize=SCRIPT_MAXSIZE, progress=None):
+    """Runs the package's bug script and spools its output to a file.
+
+    Returns the name of the file or None if the package has no bug script.
+    The output goes straight into the file and is cut off after maxsize
+    bytes, the script is killed after timeout seconds. If given, progress
+    is called every SCRIPT_POLL seconds with the number of bytes written
+    and the seconds elapsed so far.
+    """
+    script = getPackageScript(package)
+    if script is None:
+        return None
     # pop up a terminal if we can because scripts can be interactive
-    if os.path.exists(xterm_path):
-        cmd = xterm_path + " -e "
+    if os.path.exists(XTERM):
+        argv = [XTERM, "-e", script]
     else:
         logger.error("Xterm not found, cannot start bugscript.")
-        cmd = ""
-    if os.path.isfile(path[1]):
-        cmd += commands.mkarg(path[1]) + " 3>&1"
-        output += "--- Output from package bug script ---\n"
-        output += commands.getoutput(cmd)
-    elif os.path.exists(path[0]):
-        cmd += commands.mkarg(path[0]) + " 3>&1"
-        output += "--- Output from package bug script ---\n"
-        output += commands.getoutput(cmd)
-    return unicode(output, errors="replace")
+        argv = [script]
+    fd, fname = tempfile.mkstemp(".txt", "reportbug-ng-%s-" % package)
+    spool = os.fdopen(fd, "w")
+    try:
+        spool.write("--- Output from package bug script ---\n")
+        spool.flush()
+        header = spool.tell()
+        try:
+            proc = subprocess.Popen(argv, stdout=spool, stderr=subprocess.STDOUT,
+                                    close_fds=False, preexec_fn=_prepareScript)
+        except OSError as e:
+            logger.error("Unable to run %s: %s" % (script, str(e)))
+            spool.write("--- Unable to run the bug script: %s ---\n" % str(e))
+            return fname
+        started = time.time()
+        note = None
+        while True:
+            status = proc.poll()
+            size = os.fstat(fd).st_size - header
+            elapsed = time.time() - started
+            if progress:
+                progress(min(size, maxsize), elapsed)
+            if status is not None:
+                break
+            if size > maxsize:
+                note = "output cut off after %i bytes" % maxsize
+            elif elapsed > timeout:
+                note = "killed after %i seconds" % timeout
+            if note:
+                logger.warning("Bug script of %s %s." % (package, note))
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except OSError:
+                    pass
+                proc.wait()
+                break
+            time.sleep(SCRIPT_POLL)
+        if os.fstat(fd).st_size - header > maxsize:
+            spool.truncate(header + maxsize)
+        spool.seek(0, os.SEEK_END)
+        if note:
+            spool.write("\n--- Bug script %s. ---\n" % note)
+    finally:
+        spool.close()
+    return fname
 
 
 def getInstalledPackageVersion(package):
     """Returns the version of package, if installed or empty string if not installed"""
 
-    out = commands.getoutput("dpkg-query --status %s 2>/dev/null" % package)
-    version = re.findall("^Version:\s(.*)$", out, re.MULTILINE)
-
-    if version:
-        return version[0]
-    else:
-        return ""
+    return rngdpkg.STATUS.field(package, "version")
 
 
 def getInstalledPackageVersions(packages):
     """Returns a dictionary package:version."""
 
     result = {}
+    for package in packages:
+        result[package] = rngdpkg.STATUS.field(package, "version")
+    return result
 
-    packagestring = ""
-    for i in packages:
-        packagestring += " "+i
-        result[i] = ""
-
-    out = commands.getoutput("dpkg-query --status %s 2>/dev/null" % packagestring)
 
-    packagere = re.compile("^Package:\s(.*)$", re.MULTILINE)
-    versionre = re.compile("^Version:\s(.*)$", re.MULTILINE)
+def _getRelations(packagelist, field):
+    """Returns the entries of the relationship field of the given packages."""
 
-    for line in out.splitlines():
-        pmatch = re.match(packagere, line)
-        vmatch = re.match(versionre, line)
+    list = []
+    for package in packagelist:
+        relations = rngdpkg.STATUS.field(package, field)
+        if not relations:
+            continue
 
-        if pmatch:
-            package = pmatch.group(1)
-        if vmatch:
-            version = vmatch.group(1)
-            result[package] = version
+        relations = relations.replace("| ", ", |")
 
-    return result
+        list.extend(relations.split(", "))
+    return list
 
 
 def getDepends(packagelist):
     """Returns strings of all the packages the given package depends on. The format is like:
        ['libapt-pkg-libc6.3-6-3.11', 'libc6 (>= 2.3.6-6)', 'libstdc++6 (>= 4.1.1-12)']"""
 
-    list = []
-    for package in packagelist:
-        out = commands.getoutput("dpkg-query --status %s 2>/dev/null" % package)
-        depends = re.findall("^Depends:\s(.*)$", out, re.MULTILINE)
-        if depends:
-            depends = depends[0]
-        else:
-            continue
-
-        depends = depends.replace("| ", ", |")
-
-        list.extend(depends.split(", "))
-    return list
+    return _getRelations(packagelist, "depends")
 
 
 def getSuggests(packagelist):
@@ -478,19 +771,7 @@ def getSuggests(packagelist):
     The format is like:
     ['libapt-pkg-libc6.3-6-3.11', 'libc6 (>= 2.3.6-6)', 'libstdc++6 (>= 4.1.1-12)']"""
 
-    list = []
-    for package in packagelist:
-        out = commands.getoutput("dpkg-query --status %s 2>/dev/null" % package)
-        suggests = re.findall("^Suggests:\s(.*)$", out, re.MULTILINE)
-        if suggests:
-            suggests = suggests[0]
-        else:
-            continue
-
-        suggests = suggests.replace("| ", ", |")
-
-        list.extend(suggests.split(", "))
-    return list
+    return _getRelations(packagelist, "suggests")
 
 
 def getRecommends(packagelist):
@@ -498,66 +779,31 @@ def getRecommends(packagelist):
     The format is like:
     ['libapt-pkg-libc6.3-6-3.11', 'libc6 (>= 2.3.6-6)', 'libstdc++6 (>= 4.1.1-12)']"""
 
-    list = []
-    for package in packagelist:
-        out = commands.getoutput("dpkg-query --status %s 2>/dev/null" % package)
-        recommends = re.findall("^Recommends:\s(.*)$", out, re.MULTILINE)
-        if recommends:
-            recommends = recommends[0]
-        else:
-            continue
-
-        recommends = recommends.replace("| ", ", |")
-
-        list.extend(recommends.split(", "))
-    return list
+    return _getRelations(packagelist, "recommends")
 
 
 def getSourceName(package):
     """Returns source package name for given package."""
 
-    out = commands.getoutput("dpkg-query --status %s 2>/dev/null" % package)
-    source = re.findall("^Source:\s(.*)$", out, re.MULTILINE)
-
-    if source:
-        return source[0]
-    else:
-        return package
+    return rngdpkg.STATUS.field(package, "source", package)
 
 
 def getDebianReleaseInfo():
     """Returns a string with Debian relevant info."""
 
     debinfo = ''
-    mylist = []
-    output = commands.getoutput('apt-cache policy 2>/dev/null')
-    if output:
-        mre = re.compile('\s+(\d+)\s+.*$\s+release\s.*a=(.*?),.*$\s+origin\s(.*)$', re.MULTILINE)
-        for match in mre.finditer(output):
-            try:
-                mylist.index(match.groups())
-            except:
-                mylist.append(match.groups())
-
-    mylist.sort(reverse=True)
 
     if os.path.exists('/etc/debian_version'):
         debinfo += 'Debian Release: %s\n' % file('/etc/debian_version').readline().strip()
 
-    for i in mylist:
+    for i in rngapt.release_info():
         debinfo += "%+5s %-15s %s \n" % i
 
     return debinfo
 
 
 def get_presubj(package):
-    path = "/usr/share/bug/" + str(package) + "/presubj"
-    if not os.path.exists(path):
-        return None
-    f = file(path)
-    c = f.read()
-    f.close()
-    return c
+    return bug.get_presubj(package)
 
 
 def callBrowser(url):
@@ -576,16 +822,29 @@ def callBrowser(url):
         logger.debug("After webbrowser.open")
 
 
-def callMailClient(command):
+def callMailClient(argv):
     """
-    Calls the external mailclient via command and returns the tuple:
-    (status, output)
+    Calls the external mailclient with the command line argv and returns the
+    tuple: (status, output)
     """
-    logger.debug("Just before the MUA call: %s" % str(command))
-    status, output = commands.getstatusoutput(command)
+    logger.debug("Just before the MUA call: %s" % " ".join(argv)[:1000])
+    try:
+        proc = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = proc.communicate()[0]
+        status = proc.returncode
+    except OSError as e:
+        status, output = -1, str(e)
     logger.debug("After the  MUA call")
     return status, output
 
+def split_queries(text):
+    """Split a batch of queries seperated by commas into single queries.
+
+    "src:foo, src:bar severity:grave" -> ["src:foo", "src:bar severity:grave"]
+    """
+    return [q.strip() for q in text.split(",") if q.strip()]
+
+
 def translate_query(query):
     """Translate query to a query the SOAP interface accepts.
 
@@ -617,6 +876,17 @@ def translate_query(query):
     return ans
 
 
+def apply_submit_as(query):
+    """Replace the packages in a translated query by their submit-as value."""
+    for i in range(0, len(query), 2):
+        if query[i] == 'package':
+            realname = bug.submit_as(query[i+1])
+            if query[i+1] != realname:
+                logger.debug("Using %s as package name as requested by developer." % str(realname))
+                query[i+1] = realname
+    return query
+
+
 class Settings(object):
     """A Settings object contains all the settings for reportbug-ng.
 
@@ -669,6 +939,27 @@ class Settings(object):
         self.lastactionWidth = 100
         self.hideClosedBugs = True
 
+        # Cache
+        self.cacheSize = 20000
+        self.cacheMaxAge = 3600
+        self.queryCacheTTL = 600
+        # in MiB
+        self.webCacheSize = 50
+        self.prefetchRows = 10
+
+        # Bug script, in seconds and KiB
+        self.scriptTimeout = SCRIPT_TIMEOUT
+        self.scriptMaxSize = SCRIPT_MAXSIZE / 1024
+
+        # Built-in mailers, an empty sender means $DEBEMAIL or $EMAIL. The
+        # password for smtpUser is read from ~/.netrc
+        self.mailFrom = ""
+        self.smtpHost = "localhost"
+        self.smtpPort = 25
+        self.smtpStartTLS = False
+        self.smtpUser = ""
+        self.sendmailPath = SENDMAIL
+
 
     def load(self):
         """Load settings from configfile."""
@@ -685,6 +976,10 @@ class Settings(object):
             self.script = config.getboolean("general", "script")
         if config.has_option("general", "presubj"):
             self.presubj = config.getboolean("general", "presubj")
+        if config.has_option("general", "scripttimeout"):
+            self.scriptTimeout = config.getint("general", "scripttimeout")
+        if config.has_option("general", "scriptmaxsize"):
+            self.scriptMaxSize = config.getint("general", "scriptmaxsize")
 
         if config.has_option("general", "wishlist"):
             self.c_wishlist = config.get("general", "wishlist")
@@ -727,6 +1022,30 @@ class Settings(object):
         if config.has_option("listview", "hideClosedBugs"):
             self.hideClosedBugs = config.getboolean("listview", "hideclosedbugs")
 
+        if config.has_option("cache", "size"):
+            self.cacheSize = config.getint("cache", "size")
+        if config.has_option("cache", "maxage"):
+            self.cacheMaxAge = config.getint("cache", "maxage")
+        if config.has_option("cache", "queryttl"):
+            self.queryCacheTTL = config.getint("cache", "queryttl")
+        if config.has_option("cache", "websize"):
+            self.webCacheSize = config.getint("cache", "websize")
+        if config.has_option("cache", "prefetch"):
+            self.prefetchRows = config.getint("cache", "prefetch")
+
+        if config.has_option("mail", "from"):
+            self.mailFrom = config.get("mail", "from")
+        if config.has_option("mail", "smtphost"):
+            self.smtpHost = config.get("mail", "smtphost")
+        if config.has_option("mail", "smtpport"):
+            self.smtpPort = config.getint("mail", "smtpport")
+        if config.has_option("mail", "smtpstarttls"):
+            self.smtpStartTLS = config.getboolean("mail", "smtpstarttls")
+        if config.has_option("mail", "smtpuser"):
+            self.smtpUser = config.get("mail", "smtpuser")
+        if config.has_option("mail", "sendmail"):
+            self.sendmailPath = config.get("mail", "sendmail")
+
 
     def save(self):
         """Save settings to configfile."""
@@ -740,6 +1059,8 @@ class Settings(object):
 
         config.set("general", "script", self.script)
         config.set("general", "presubj", self.presubj)
+        config.set("general", "scripttimeout", self.scriptTimeout)
+        config.set("general", "scriptmaxsize", self.scriptMaxSize)
 
         config.set("general", "wishlist", self.c_wishlist)
         config.set("general", "minor", self.c_minor)
@@ -768,6 +1089,23 @@ class Settings(object):
         config.set("listview", "lastactionwidth", self.lastactionWidth)
         config.set("listview", "hideclosedbugs", self.hideClosedBugs)
 
+        if not config.has_section("cache"):
+            config.add_section("cache")
+        config.set("cache", "size", self.cacheSize)
+        config.set("cache", "maxage", self.cacheMaxAge)
+        config.set("cache", "queryttl", self.queryCacheTTL)
+        config.set("cache", "websize", self.webCacheSize)
+        config.set("cache", "prefetch", self.prefetchRows)
+
+        if not config.has_section("mail"):
+            config.add_section("mail")
+        config.set("mail", "from", self.mailFrom)
+        config.set("mail", "smtphost", self.smtpHost)
+        config.set("mail", "smtpport", self.smtpPort)
+        config.set("mail", "smtpstarttls", self.smtpStartTLS)
+        config.set("mail", "smtpuser", self.smtpUser)
+        config.set("mail", "sendmail", self.sendmailPath)
+
         # Write everything to configfile
         config.write(open(self.configfile, "w"))
 
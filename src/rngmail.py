@@ -0,0 +1,580 @@
+# rngmail.py - Submitting bugreports via SMTP or sendmail.
+# Copyright (C) 2007-2014  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Built-in mail submission.
+
+Messages are composed here, queued in an on-disk outbox and delivered by a
+background Sender over SMTP or the local sendmail. Messages which could not
+be delivered stay in the outbox and are retried with an increasing delay,
+also after a restart.
+"""
+
+
+import os
+import json
+import time
+import errno
+import fcntl
+import netrc
+import socket
+import smtplib
+import logging
+import threading
+import subprocess
+from email import charset
+from email.header import Header
+from email.utils import formatdate, make_msgid, parseaddr
+from email.mime.multipart import MIMEMultipart
+from email.mime.nonmultipart import MIMENonMultipart
+
+import rngoffline
+
+
+logger = logging.getLogger("RngMail")
+
+
+OUTBOXDIR = os.path.join(rngoffline.DATADIR, "outbox")
+SENDMAIL = "/usr/sbin/sendmail"
+SMTP_TIMEOUT = 60
+# Seconds to wait before the n-th retry: RETRY_DELAY * 2**(n-1), at most
+# MAX_RETRY_DELAY
+RETRY_DELAY = 60
+MAX_RETRY_DELAY = 6 * 3600
+# Messages are given up after this many failed attempts and moved to the
+# failed directory of the outbox
+MAX_ATTEMPTS = 12
+
+
+class MailError(Exception):
+    """Delivering a message failed.
+
+    If permanent is True, retrying won't help.
+    """
+
+    def __init__(self, msg, permanent=False):
+        Exception.__init__(self, msg)
+        self.permanent = permanent
+
+
+def default_sender():
+    """Return the sender address from $DEBEMAIL or $EMAIL, like reportbug,
+    or user@host."""
+    for var in ("DEBEMAIL", "EMAIL"):
+        if os.environ.get(var):
+            address = os.environ[var]
+            name = os.environ.get("DEBFULLNAME", os.environ.get("NAME"))
+            if name and "<" not in address:
+                address = "%s <%s>" % (name, address)
+            return address
+    try:
+        import pwd
+        user = pwd.getpwuid(os.getuid()).pw_name
+    except (ImportError, KeyError):
+        user = os.environ.get("USER", "root")
+    return "%s@%s" % (user, socket.getfqdn())
+
+
+def _text_part(text, filename=None):
+    """Return a text/plain part, quoted-printable so it stays readable."""
+    cs = charset.Charset("utf-8")
+    cs.body_encoding = charset.QP
+    part = MIMENonMultipart("text", "plain")
+    part.set_payload(text.encode("utf-8"), cs)
+    if filename:
+        part.add_header("Content-Disposition", "attachment", filename=filename)
+    return part
+
+
+def compose(sender, to, subject, body, attachments=()):
+    """Return the message as email.message.Message.
+
+    body is the text of the mail, including the pseudo headers for the BTS.
+    attachments is a list of file names, each file is attached as text/plain
+    part.
+    """
+    if attachments:
+        msg = MIMEMultipart()
+        msg.attach(_text_part(body))
+        for fname in attachments:
+            f = open(fname)
+            try:
+                text = unicode(f.read(), errors="replace")
+            finally:
+                f.close()
+            msg.attach(_text_part(text, os.path.basename(fname)))
+    else:
+        msg = _text_part(body)
+    msg["From"] = sender
+    msg["To"] = to
+    msg["Subject"] = Header(subject, "utf-8")
+    msg["Date"] = formatdate(localtime=True)
+    msg["Message-ID"] = make_msgid("reportbug-ng")
+    msg["X-Mailer"] = "reportbug-ng"
+    return msg
+
+
+class Outbox(object):
+    """A directory of messages waiting to be delivered.
+
+    Every message is a file NAME.eml, with the mailer to deliver it with
+    ("smtp" or "sendmail"), its sender, recipients, the number of failed
+    attempts and the time of the next attempt in NAME.json.
+    Both are written to a temporary file first and renamed, the .json last,
+    so only completely written messages are ever seen.
+
+    Several Senders, also of different processes, may work on the same
+    outbox. Before delivering a message, a Sender claims it: it locks the
+    .json with flock and moves it to the sending directory, so no other
+    Sender sees it anymore. The lock is held until the message is
+    delivered, failed or released. Claims whose lock is not held, because
+    their process died, are returned to the queue by requeue().
+    """
+
+    def __init__(self, dirname=OUTBOXDIR):
+        self.logger = logging.getLogger("Outbox")
+        self.dirname = dirname
+        self.faileddir = os.path.join(dirname, "failed")
+        self.sendingdir = os.path.join(dirname, "sending")
+        self.lock = threading.Lock()
+        self.counter = 0
+        # name -> locked file of the claimed messages
+        self.claims = {}
+
+
+    def _write(self, path, data):
+        tmp = "%s.%i.tmp" % (path, os.getpid())
+        f = open(tmp, "w")
+        f.write(data)
+        f.close()
+        os.rename(tmp, path)
+
+
+    def put(self, mailer, sender, recipients, msg):
+        """Queue the message msg (a string) and return its name."""
+        with self.lock:
+            self.counter += 1
+            name = "%i.%i.%i" % (time.time() * 1000, os.getpid(), self.counter)
+        if not os.path.isdir(self.dirname):
+            os.makedirs(self.dirname)
+        path = os.path.join(self.dirname, name)
+        self._write(path + ".eml", msg)
+        self._write(path + ".json", json.dumps({"mailer" : mailer,
+                                                "sender" : sender,
+                                                "recipients" : recipients,
+                                                "attempts" : 0,
+                                                "next" : 0}))
+        self.logger.info("Queued message %s." % name)
+        return name
+
+
+    def names(self):
+        """Return the names of the queued messages, oldest first."""
+        try:
+            files = os.listdir(self.dirname)
+        except OSError:
+            return []
+        return sorted(f[:-5] for f in files if f.endswith(".json"))
+
+
+    def _json(self, name):
+        """Return the path of the .json of message name, in the sending
+        directory if it is claimed."""
+        if name in self.claims:
+            return os.path.join(self.sendingdir, name + ".json")
+        return os.path.join(self.dirname, name + ".json")
+
+
+    def info(self, name):
+        """Return the dictionary with mailer, sender, recipients, attempts
+        and next of message name."""
+        f = open(self._json(name))
+        try:
+            return json.load(f)
+        finally:
+            f.close()
+
+
+    def due(self, now=None):
+        """Return the names of the messages to be delivered now.
+
+        Messages whose .json can't be read are due as well, so the Sender
+        gets rid of them.
+        """
+        if now is None:
+            now = time.time()
+        due = []
+        for name in self.names():
+            try:
+                if self.info(name)["next"] <= now:
+                    due.append(name)
+            except (IOError, ValueError, KeyError, TypeError) as e:
+                self.logger.error("Unable to read %s: %s" % (name, str(e)))
+                due.append(name)
+        return due
+
+
+    def next_attempt(self):
+        """Return the time of the next attempt or None if the outbox is
+        empty."""
+        times = []
+        for name in self.names():
+            try:
+                times.append(self.info(name)["next"])
+            except (IOError, ValueError, KeyError, TypeError):
+                pass
+        return min(times) if times else None
+
+
+    def message(self, name):
+        f = open(os.path.join(self.dirname, name + ".eml"))
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+
+    def _lock(self, path):
+        """Return path opened and locked or None if another Sender holds
+        its lock or it is gone."""
+        try:
+            f = open(path)
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # the file might have been claimed, delivered or replaced
+            # before we got the lock
+            if os.fstat(f.fileno()).st_ino == os.stat(path).st_ino:
+                return f
+        except (IOError, OSError) as e:
+            if e.errno not in (errno.EAGAIN, errno.EACCES, errno.ENOENT):
+                f.close()
+                raise
+        f.close()
+        return None
+
+
+    def claim(self, name):
+        """Claim message name for delivery.
+
+        Returns False if another Sender claimed it first.
+        """
+        if not os.path.isdir(self.sendingdir):
+            try:
+                os.makedirs(self.sendingdir)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+        with self.lock:
+            if name in self.claims:
+                return False
+            f = self._lock(os.path.join(self.dirname, name + ".json"))
+            if f is None:
+                return False
+            os.rename(os.path.join(self.dirname, name + ".json"),
+                      os.path.join(self.sendingdir, name + ".json"))
+            self.claims[name] = f
+        return True
+
+
+    def _replace_claim(self, name, data):
+        """Replace the .json of the claimed message name with data, without
+        releasing the lock in between."""
+        path = self._json(name)
+        tmp = "%s.%i.tmp" % (path, os.getpid())
+        f = open(tmp, "w")
+        f.write(data)
+        f.flush()
+        fcntl.flock(f, fcntl.LOCK_EX)
+        os.rename(tmp, path)
+        with self.lock:
+            old, self.claims[name] = self.claims[name], f
+        old.close()
+
+
+    def release(self, name):
+        """Drop the claim of message name. If the message was neither
+        delivered nor given up, it is returned to the outbox."""
+        with self.lock:
+            f = self.claims.pop(name, None)
+            if f is None:
+                return
+            try:
+                path = os.path.join(self.sendingdir, name + ".json")
+                if os.path.exists(path) and os.stat(path).st_ino == os.fstat(f.fileno()).st_ino:
+                    os.rename(path, os.path.join(self.dirname, name + ".json"))
+            finally:
+                f.close()
+
+
+    def requeue(self):
+        """Return the claims left behind by crashed Senders to the outbox.
+
+        Returns the names of the requeued messages.
+        """
+        try:
+            files = os.listdir(self.sendingdir)
+        except OSError:
+            return []
+        requeued = []
+        for name in sorted(f[:-5] for f in files if f.endswith(".json")):
+            path = os.path.join(self.sendingdir, name + ".json")
+            with self.lock:
+                if name in self.claims:
+                    continue
+                f = self._lock(path)
+                if f is None:
+                    continue
+                try:
+                    os.rename(path, os.path.join(self.dirname, name + ".json"))
+                finally:
+                    f.close()
+            self.logger.warning("Requeued message %s, its sender died while delivering it." % name)
+            requeued.append(name)
+        return requeued
+
+
+    def delivered(self, name):
+        """Remove message name from the outbox."""
+        os.remove(self._json(name))
+        os.remove(os.path.join(self.dirname, name + ".eml"))
+
+
+    def _give_up(self, name, info):
+        path = os.path.join(self.dirname, name)
+        if not os.path.isdir(self.faileddir):
+            os.makedirs(self.faileddir)
+        if os.path.exists(path + ".eml"):
+            os.rename(path + ".eml", os.path.join(self.faileddir, name + ".eml"))
+        self._write(os.path.join(self.faileddir, name + ".json"), json.dumps(info))
+        os.remove(self._json(name))
+
+
+    def broken(self, name, error):
+        """Move message name, whose .json can't be read, to the failed
+        directory."""
+        self._give_up(name, {"error" : str(error)})
+
+
+    def failed(self, name, info, error, permanent=False):
+        """Schedule the next attempt for message name, info is its
+        dictionary as returned by info().
+
+        Returns True if the message is given up and was moved to the
+        failed directory.
+        """
+        info = dict(info)
+        info["attempts"] = info.get("attempts", 0) + 1
+        info["error"] = str(error)
+        path = os.path.join(self.dirname, name)
+        if permanent or info["attempts"] >= MAX_ATTEMPTS:
+            self._give_up(name, info)
+            return True
+        delay = min(RETRY_DELAY * 2 ** (info["attempts"] - 1), MAX_RETRY_DELAY)
+        info["next"] = time.time() + delay
+        if name in self.claims:
+            self._replace_claim(name, json.dumps(info))
+        else:
+            self._write(path + ".json", json.dumps(info))
+        return False
+
+
+class SmtpTransport(object):
+    """Delivers messages to an SMTP server.
+
+    If user is set, the password is looked up for host in ~/.netrc.
+    """
+
+    def __init__(self, host="localhost", port=25, starttls=False, user=None):
+        self.host = host
+        self.port = port
+        self.starttls = starttls
+        self.user = user
+
+
+    def _password(self):
+        try:
+            auth = netrc.netrc().authenticators(self.host)
+        except (IOError, netrc.NetrcParseError) as e:
+            raise MailError("Unable to read the password for %s from ~/.netrc: %s" % (self.host, str(e)), True)
+        if auth is None:
+            raise MailError("No password for %s in ~/.netrc" % self.host, True)
+        return auth[2]
+
+
+    def send(self, sender, recipients, msg):
+        try:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+            try:
+                smtp.ehlo()
+                if self.starttls:
+                    smtp.starttls()
+                    smtp.ehlo()
+                if self.user:
+                    smtp.login(self.user, self._password())
+                # the envelope wants the bare address
+                smtp.sendmail(parseaddr(sender)[1], recipients, msg)
+            finally:
+                try:
+                    smtp.quit()
+                except (smtplib.SMTPException, socket.error):
+                    pass
+        except smtplib.SMTPResponseException as e:
+            raise MailError("%s: %i %s" % (self.host, e.smtp_code, e.smtp_error), e.smtp_code >= 500)
+        except smtplib.SMTPRecipientsRefused as e:
+            codes = [code for code, text in e.recipients.values()]
+            raise MailError("%s refused the recipients: %s" % (self.host, str(e.recipients)),
+                            min(codes) >= 500)
+        except (smtplib.SMTPException, socket.error) as e:
+            raise MailError("%s: %s" % (self.host, str(e)))
+
+
+class SendmailTransport(object):
+    """Delivers messages with the local sendmail."""
+
+    def __init__(self, path=SENDMAIL):
+        self.path = path
+
+
+    def send(self, sender, recipients, msg):
+        # the envelope wants the bare address
+        argv = [self.path, "-oi", "-f", parseaddr(sender)[1], "--"] + list(recipients)
+        try:
+            proc = subprocess.Popen(argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT)
+            output = proc.communicate(msg)[0]
+        except OSError as e:
+            raise MailError("Unable to run %s: %s" % (self.path, str(e)))
+        if proc.returncode != 0:
+            raise MailError("%s exited with %i: %s" % (self.path, proc.returncode, output.strip()))
+
+
+class Sender(threading.Thread):
+    """Background thread delivering the messages of an outbox.
+
+    transport is a callable returning the transport for a mailer, so
+    changed settings take effect with the next attempt. callback, if given, is
+    called with the name of the message, True or False and the error
+    message after every attempt.
+    """
+
+    def __init__(self, outbox, transport, callback=None):
+        threading.Thread.__init__(self)
+        self.logger = logging.getLogger("Sender")
+        self.daemon = True
+        self.outbox = outbox
+        self.transport = transport
+        self.callback = callback
+        self.wakeup = threading.Event()
+        self.stopped = False
+
+
+    def wake(self):
+        """Look for due messages now, e.g. after queueing one."""
+        self.wakeup.set()
+
+
+    def stop(self):
+        self.stopped = True
+        self.wakeup.set()
+
+
+    def flush(self, force=False):
+        """Try to deliver the due messages, or all if force is True, once.
+        Returns the number of messages still queued."""
+        names = self.outbox.names() if force else self.outbox.due()
+        for name in names:
+            if self.stopped:
+                break
+            try:
+                self._deliver(name)
+            except (IOError, OSError) as e:
+                # the outbox itself is broken, try the next message anyway
+                self.logger.error("Unable to update message %s in the outbox: %s" % (name, str(e)))
+        return len(self.outbox.names())
+
+
+    def _deliver(self, name):
+        if not self.outbox.claim(name):
+            self.logger.debug("Message %s is delivered by another sender." % name)
+            return
+        try:
+            self._deliver_claimed(name)
+        finally:
+            self.outbox.release(name)
+
+
+    def _deliver_claimed(self, name):
+        try:
+            info = self.outbox.info(name)
+            mailer, sender, recipients = info["mailer"], info["sender"], info["recipients"]
+        except (IOError, ValueError, KeyError, TypeError) as e:
+            self.logger.error("Giving up unreadable message %s: %s" % (name, str(e)))
+            self.outbox.broken(name, e)
+            if self.callback:
+                self.callback(name, False, str(e))
+            return
+        try:
+            self.transport(mailer).send(sender, recipients, self.outbox.message(name))
+        except (MailError, IOError) as e:
+            permanent = getattr(e, "permanent", False)
+            if self.outbox.failed(name, info, e, permanent):
+                self.logger.error("Giving up message %s: %s" % (name, str(e)))
+            else:
+                self.logger.warning("Delivering message %s failed, will retry: %s" % (name, str(e)))
+            if self.callback:
+                self.callback(name, False, str(e))
+            return
+        self.outbox.delivered(name)
+        self.logger.info("Delivered message %s." % name)
+        if self.callback:
+            self.callback(name, True, "")
+
+
+    def run(self):
+        try:
+            self.outbox.requeue()
+        except (IOError, OSError) as e:
+            self.logger.error("Unable to requeue the messages of crashed senders: %s" % str(e))
+        while not self.stopped:
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                # never let the outbox stop retrying silently
+                self.logger.exception("Flushing the outbox failed.")
+            when = self.outbox.next_attempt()
+            timeout = None if when is None else max(1, when - time.time())
+            self.wakeup.wait(timeout)
+
+
+def transport(mailer, settings):
+    """Return the transport for mailer as configured in settings."""
+    if mailer == "sendmail":
+        return SendmailTransport(settings.sendmailPath)
+    return SmtpTransport(settings.smtpHost, settings.smtpPort,
+                         settings.smtpStartTLS, settings.smtpUser or None)
+
+
+def submit(outbox, mailer, settings, to, subject, body, attachments=()):
+    """Compose the bugreport and queue it in outbox for delivery with
+    mailer, returns its name."""
+    sender = settings.mailFrom or default_sender()
+    msg = compose(sender, to, subject, body, attachments)
+    return outbox.put(mailer, sender, [to], msg.as_string())
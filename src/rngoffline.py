@@ -0,0 +1,360 @@
+# rngoffline.py - Offline access to a local copy of Debian's BTS.
+# Copyright (C) 2007-2014  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import re
+import json
+import logging
+import calendar
+import datetime
+
+import rngbts as bts
+
+from rngcache import _SqliteCache
+
+
+DATADIR = os.path.join(os.environ.get("XDG_DATA_HOME", os.path.expanduser("~/.local/share")), "reportbug-ng")
+OFFLINEFILE = os.path.join(DATADIR, "offline.sqlite")
+
+# The fields of a Bugreport the offline store knows about
+FIELDS = ("bug_num", "package", "source", "originator", "subject",
+          "severity", "tags", "done", "archived", "log_modified")
+
+# Line numbers of the fields in old debbugs .status files
+STATUS_LINES = {"originator" : 0,
+                "subject"    : 2,
+                "package"    : 4,
+                "tags"       : 5,
+                "done"       : 6,
+                "severity"   : 9}
+
+
+def _email(s):
+    """Return the lowercased mail address of "Name <address>" or s."""
+    match = re.search(r"<([^>]*)>", s)
+    if match:
+        s = match.group(1)
+    return s.strip().lower()
+
+
+def _find_index(spooldir, name):
+    """Return the path of the index file name in spooldir or None."""
+    for candidate in (os.path.join(spooldir, name),
+                      os.path.join(spooldir, "indices", name)):
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def dict_to_bug(d):
+    """Return a Bugreport for a dictionary with the keys in FIELDS."""
+    bug = bts.Bugreport()
+    for field in FIELDS:
+        setattr(bug, field, d.get(field))
+    bug.tags = list(bug.tags or [])
+    bug.severity = bug.severity or "normal"
+    if bug.log_modified is not None:
+        bug.log_modified = datetime.datetime.utcfromtimestamp(bug.log_modified)
+    return bug
+
+
+def bug_to_dict(bug):
+    """Return a dictionary with the keys in FIELDS for a Bugreport."""
+    d = {}
+    for field in FIELDS:
+        d[field] = getattr(bug, field, None)
+    d["bug_num"] = int(d["bug_num"])
+    d["tags"] = list(d["tags"] or [])
+    d["done"] = bool(d["done"])
+    d["archived"] = bool(d["archived"])
+    if d["log_modified"] is not None:
+        d["log_modified"] = calendar.timegm(d["log_modified"].timetuple())
+    return d
+
+
+def parse_summary(f):
+    """Parse a debbugs .summary file into a dictionary."""
+    d = dict()
+    for line in f:
+        line = line.decode("utf-8", "replace").rstrip("\n")
+        if not line:
+            break
+        tokens = line.split(":", 1)
+        if len(tokens) < 2:
+            continue
+        d[tokens[0].strip().lower()] = tokens[1].strip()
+    return {"originator" : d.get("submitter", ""),
+            "subject"    : d.get("subject", ""),
+            "package"    : d.get("package", ""),
+            "tags"       : d.get("tags", "").split(),
+            "done"       : bool(d.get("done")),
+            "severity"   : d.get("severity") or "normal"}
+
+
+def parse_status(f):
+    """Parse an old style, line based debbugs .status file into a dictionary."""
+    lines = [l.decode("utf-8", "replace").rstrip("\n") for l in f]
+    get = lambda field: lines[STATUS_LINES[field]] if len(lines) > STATUS_LINES[field] else ""
+    return {"originator" : get("originator"),
+            "subject"    : get("subject"),
+            "package"    : get("package"),
+            "tags"       : get("tags").split(),
+            "done"       : bool(get("done")),
+            "severity"   : get("severity") or "normal"}
+
+
+def read_index(path):
+    """Read a "package value" index file like debbugs' Maintainers or sources.
+
+    For sources files ("package component source") the last column is used.
+    """
+    index = dict()
+    if not path or not os.path.exists(path):
+        return index
+    f = open(path)
+    for line in f:
+        tokens = line.decode("utf-8", "replace").split(None, 1)
+        if len(tokens) < 2:
+            continue
+        index[tokens[0]] = tokens[1].strip()
+    f.close()
+    return index
+
+
+class OfflineBTS(_SqliteCache):
+    """A local, indexed copy of (a part of) Debian's BTS.
+
+    It provides get_bugs and get_status like debianbts, so queries from
+    translate_query can be answered without any SOAP calls. The data is
+    imported from a debbugs spool or from a JSON Lines file written by
+    export.
+    """
+
+    SCHEMA = ("""CREATE TABLE IF NOT EXISTS bugs (
+                     bug_num INTEGER PRIMARY KEY,
+                     package TEXT,
+                     source TEXT,
+                     maintainer TEXT,
+                     originator TEXT,
+                     submitter TEXT,
+                     subject TEXT,
+                     severity TEXT,
+                     tags TEXT,
+                     done INTEGER,
+                     archived INTEGER,
+                     log_modified INTEGER)""",
+              """CREATE TABLE IF NOT EXISTS packages (
+                     bug_num INTEGER,
+                     package TEXT,
+                     source TEXT,
+                     maintainer TEXT)""",
+              """CREATE TABLE IF NOT EXISTS tags (
+                     bug_num INTEGER,
+                     tag TEXT)""",
+              "CREATE INDEX IF NOT EXISTS packages_package ON packages (package)",
+              "CREATE INDEX IF NOT EXISTS packages_source ON packages (source)",
+              "CREATE INDEX IF NOT EXISTS packages_maintainer ON packages (maintainer)",
+              "CREATE INDEX IF NOT EXISTS packages_bug_num ON packages (bug_num)",
+              "CREATE INDEX IF NOT EXISTS tags_tag ON tags (tag)",
+              "CREATE INDEX IF NOT EXISTS tags_bug_num ON tags (bug_num)",
+              "CREATE INDEX IF NOT EXISTS bugs_submitter ON bugs (submitter)",
+              "CREATE INDEX IF NOT EXISTS bugs_severity ON bugs (severity)")
+
+    # translate_query key -> SQL condition
+    CONDITIONS = {"package"   : "bug_num IN (SELECT bug_num FROM packages WHERE package = ?)",
+                  "src"       : "bug_num IN (SELECT bug_num FROM packages WHERE source = ?)",
+                  "maint"     : "bug_num IN (SELECT bug_num FROM packages WHERE maintainer = ?)",
+                  "submitter" : "submitter = ?",
+                  "severity"  : "severity = ?",
+                  "tag"       : "bug_num IN (SELECT bug_num FROM tags WHERE tag = ?)"}
+
+    def __init__(self, filename=OFFLINEFILE):
+        _SqliteCache.__init__(self, filename)
+        self.logger = logging.getLogger("OfflineBTS")
+
+
+    def get_bugs(self, query):
+        """Return the bugnumbers of the unarchived bugs matching query.
+
+        Different keys must all match, values for the same key are
+        alternatives.
+        """
+        conditions = dict()
+        for i in range(0, len(query), 2):
+            key, value = query[i], query[i+1]
+            if key not in self.CONDITIONS:
+                self.logger.warning("Unsupported query %s:%s, ignoring." % (key, value))
+                continue
+            if key in ("maint", "submitter"):
+                value = _email(value)
+            conditions.setdefault(key, []).append(value)
+        sql = ["archived = 0"]
+        args = []
+        for key, values in conditions.items():
+            sql.append("(%s)" % " OR ".join([self.CONDITIONS[key]] * len(values)))
+            args.extend(values)
+        with self.lock:
+            rows = self.db.execute("SELECT bug_num FROM bugs WHERE %s ORDER BY bug_num" % " AND ".join(sql),
+                                   args).fetchall()
+        return [row[0] for row in rows]
+
+
+    def get_status(self, bugnumbers):
+        """Return the Bugreports for bugnumbers, unknown bugs are skipped."""
+        if not isinstance(bugnumbers, (list, tuple)):
+            bugnumbers = [bugnumbers]
+        numbers = [int(i) for i in bugnumbers]
+        bugs = []
+        with self.lock:
+            for i in range(0, len(numbers), 500):
+                chunk = numbers[i:i+500]
+                rows = self.db.execute("SELECT %s FROM bugs WHERE bug_num IN (%s)" %
+                                       (", ".join(FIELDS), ", ".join("?" * len(chunk))),
+                                       chunk).fetchall()
+                for row in rows:
+                    d = dict(zip(FIELDS, row))
+                    d["tags"] = d["tags"].split() if d["tags"] else []
+                    d["done"] = bool(d["done"])
+                    d["archived"] = bool(d["archived"])
+                    bugs.append(dict_to_bug(d))
+        return bugs
+
+
+    def add(self, d, maintainers=None, sources=None):
+        """Add a bug, given as dictionary with the keys in FIELDS.
+
+        log_modified is a unix timestamp. maintainers and sources map
+        package names to maintainers and source packages.
+        """
+        maintainers = maintainers or {}
+        sources = sources or {}
+        packages = []
+        for package in (d.get("package") or "").split(","):
+            package = package.strip()
+            if not package:
+                continue
+            if package.startswith("src:"):
+                source = package[4:]
+            else:
+                source = sources.get(package) or d.get("source") or package
+            maintainer = maintainers.get(package) or maintainers.get(source) or d.get("maintainer") or ""
+            packages.append((d["bug_num"], package, source, _email(maintainer)))
+        with self.lock:
+            self.db.execute("DELETE FROM packages WHERE bug_num = ?", (d["bug_num"],))
+            self.db.execute("DELETE FROM tags WHERE bug_num = ?", (d["bug_num"],))
+            self.db.execute("INSERT OR REPLACE INTO bugs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (d["bug_num"], d.get("package"),
+                             packages[0][2] if packages else d.get("source"),
+                             packages[0][3] if packages else "",
+                             d.get("originator"), _email(d.get("originator") or ""),
+                             d.get("subject"), d.get("severity") or "normal",
+                             " ".join(d.get("tags") or []), bool(d.get("done")),
+                             bool(d.get("archived")), d.get("log_modified")))
+            self.db.executemany("INSERT INTO packages VALUES (?, ?, ?, ?)", packages)
+            self.db.executemany("INSERT INTO tags VALUES (?, ?)",
+                                [(d["bug_num"], tag) for tag in d.get("tags") or []])
+
+
+    def import_spool(self, spooldir, maintainers=None, sources=None):
+        """Import the .summary or .status files of a debbugs spool directory.
+
+        The bugs are expected in spooldir/db-h/*/ and, for archived bugs, in
+        spooldir/archive/*/. maintainers and sources are the paths of
+        debbugs' Maintainers and sources index files; if not given they are
+        looked up in spooldir and spooldir/indices. Returns the number of
+        imported bugs.
+        """
+        if maintainers is None:
+            maintainers = _find_index(spooldir, "Maintainers")
+        if sources is None:
+            sources = _find_index(spooldir, "sources")
+        maintainers = read_index(maintainers)
+        # sources is "package component source", we only want the source
+        sources = dict((k, v.split()[-1]) for k, v in read_index(sources).items())
+        count = 0
+        for subdir, archived in (("db-h", False), ("archive", True)):
+            topdir = os.path.join(spooldir, subdir)
+            if not os.path.isdir(topdir):
+                continue
+            for hashdir in sorted(os.listdir(topdir)):
+                path = os.path.join(topdir, hashdir)
+                if not os.path.isdir(path):
+                    continue
+                for bugfile in os.listdir(path):
+                    base, ext = os.path.splitext(bugfile)
+                    if not base.isdigit():
+                        continue
+                    if ext == ".summary":
+                        parse = parse_summary
+                    elif ext == ".status" and not os.path.exists(os.path.join(path, base + ".summary")):
+                        parse = parse_status
+                    else:
+                        continue
+                    f = open(os.path.join(path, bugfile))
+                    d = parse(f)
+                    f.close()
+                    log = os.path.join(path, base + ".log")
+                    if not os.path.exists(log):
+                        log = os.path.join(path, bugfile)
+                    d["bug_num"] = int(base)
+                    d["archived"] = archived
+                    d["log_modified"] = int(os.path.getmtime(log))
+                    self.add(d, maintainers, sources)
+                    count += 1
+        self.db.commit()
+        self.logger.info("Imported %i bugs from %s." % (count, spooldir))
+        return count
+
+
+    def import_jsonl(self, f):
+        """Import bugs from a JSON Lines file object as written by export.
+
+        Returns the number of imported bugs.
+        """
+        count = 0
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            self.add(json.loads(line))
+            count += 1
+        self.db.commit()
+        self.logger.info("Imported %i bugs." % count)
+        return count
+
+
+    def import_path(self, path):
+        """Import a debbugs spool directory or a JSON Lines file."""
+        if os.path.isdir(path):
+            return self.import_spool(path)
+        f = open(path)
+        count = self.import_jsonl(f)
+        f.close()
+        return count
+
+
+    def export(self, f):
+        """Write all bugs as JSON Lines to the file object f."""
+        with self.lock:
+            rows = self.db.execute("SELECT %s, maintainer FROM bugs ORDER BY bug_num" % ", ".join(FIELDS)).fetchall()
+        for row in rows:
+            d = dict(zip(FIELDS + ("maintainer",), row))
+            d["tags"] = d["tags"].split() if d["tags"] else []
+            d["done"] = bool(d["done"])
+            d["archived"] = bool(d["archived"])
+            f.write(json.dumps(d) + "\n")
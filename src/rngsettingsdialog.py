@@ -56,10 +56,11 @@ class RngSettingsDialog(QtWidgets.QDialog, settings.Ui_Dialog):
     def load_settings(self):
 
         # mua
-        for mua in rng.SUPPORTED_MUA:
+        muas = rng.getSupportedMUAs()
+        for mua in muas:
             self.comboBox_mua.addItem(rng.getMUAString(mua))
-        if self.settings.lastmua in rng.SUPPORTED_MUA:
-            self.comboBox_mua.setCurrentIndex(rng.SUPPORTED_MUA.index(self.settings.lastmua))
+        if self.settings.lastmua in muas:
+            self.comboBox_mua.setCurrentIndex(muas.index(self.settings.lastmua))
 
         # colors
         buttoncolor = [(self.pushButton_wishlist, self.settings.c_wishlist),
@@ -137,7 +138,7 @@ class RngSettingsDialog(QtWidgets.QDialog, settings.Ui_Dialog):
         mua = unicode(self.comboBox_mua.currentText())
         # translate back
         found = False
-        for mua_orig in rng.MUA_SYNTAX.keys():
+        for mua_orig in rng.MUA_SYNTAX.keys() + rng.BUILTIN_MAILERS:
             if getMUAString(mua_orig) == mua:
                 self.settings.lastmua = mua_orig
                 found = True
@@ -0,0 +1,35 @@
+# rngsubmitdialog.py - SubmitDialog of Reportbug-NG.
+# Copyright (C) 2007-2014  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+from PyQt5 import QtWidgets
+
+from ui import submitdialog
+import rnghelpers as rng
+
+
+class SubmitDialog(QtWidgets.QDialog, submitdialog.Ui_SubmitDialog):
+
+    def __init__(self):
+        QtWidgets.QDialog.__init__(self)
+        self.setupUi(self)
+        self.buttonBox.button(QtWidgets.QDialogButtonBox.Ok).clicked.connect(self.accept)
+        self.buttonBox.button(QtWidgets.QDialogButtonBox.Cancel).clicked.connect(self.reject)
+        self.comboBoxSeverity.currentIndexChanged.connect(self.severity_changed)
+
+    def severity_changed(self, index):
+        self.label_severity.setText(rng.getSeverityExplanation(index))
@@ -1,36 +1,71 @@
+import re
 import logging
 
 from PyQt5 import QtCore, QtWidgets
-from apt.cache import Cache, FilteredCache, Filter
 
-class InstalledFilter(Filter):
-    """ Filter that returns all installed packages """
-    def apply(self, pkg):
-        return pkg.is_installed
+import rngapt
+
+# Number of completions shown
+COMPLETIONS = 20
+
+class NameIndexThread(QtCore.QThread):
+    """Builds the index of the package names without blocking the GUI."""
+
+    loaded = QtCore.pyqtSignal(object)
+
+    def run(self):
+        self.loaded.emit(rngapt.name_index())
 
 class PackageLineEdit(QtWidgets.QLineEdit):
+    """Line edit completing the word at the cursor with the names of all
+    packages and sources of the archive, see rngapt.NameIndex."""
+
     def __init__(self, parent):
         QtWidgets.QLineEdit.__init__(self, parent)
         self.logger = logging.getLogger("PackageLineEdit")
-        cache = FilteredCache(Cache())
-        cache.set_filter(InstalledFilter())
-        self._completer = QtWidgets.QCompleter(sorted(cache.keys()))
-        self._completer.setModelSorting(QtWidgets.QCompleter.CaseSensitivelySortedModel)
-        self.setCompleter(self._completer)
-        #QtCore.QObject.connect(self, QtCore.SIGNAL("returnPressed()"), self.__disable_completion)
-
-    def __enable_completion(self):
-        self.logger.debug("Enabled completion.")
-        self.setCompleter(self._completer)
-        self.completer().setCompletionPrefix(self.text())
-        QtCore.QTimer.singleShot(0, self.completer().complete)
-
-    def __disable_completion(self):
-        self.logger.debug("Disabled completion.")
-        self.setCompleter(None)
+        self._index = None
+        self._model = QtCore.QStringListModel(self)
+        self._completer = QtWidgets.QCompleter(self._model, self)
+        # the index does the filtering, the completer only shows the result
+        self._completer.setCompletionMode(QtWidgets.QCompleter.UnfilteredPopupCompletion)
+        self._completer.setWidget(self)
+        self._completer.activated[str].connect(self.__insert_completion)
+        self.textEdited.connect(self.__update_completion)
+        self._thread = NameIndexThread(self)
+        self._thread.loaded.connect(self.__set_index)
+        self._thread.start()
+
+    def __set_index(self, index):
+        self.logger.debug("Got %i package names." % len(index))
+        self._index = index
+
+    def __current_word(self):
+        """Return the tuple (start, word) of the word left of the cursor."""
+        text = unicode(self.text())[:self.cursorPosition()]
+        word = re.split(r"[\s,]", text)[-1]
+        return len(text) - len(word), word
+
+    def __update_completion(self, text=None):
+        start, word = self.__current_word()
+        if self._index is None or not word:
+            self._completer.popup().hide()
+            return
+        names = self._index.search(word, COMPLETIONS)
+        self._model.setStringList(names)
+        if names:
+            self._completer.complete()
+        else:
+            self._completer.popup().hide()
+
+    def __insert_completion(self, name):
+        start, word = self.__current_word()
+        text = unicode(self.text())
+        end = self.cursorPosition()
+        self.setText(text[:start] + unicode(name) + text[end:])
+        self.setCursorPosition(start + len(name))
 
     def keyPressEvent(self, event):
         if event.key() == QtCore.Qt.Key_Down:
-            QtCore.QTimer.singleShot(0, self.__enable_completion)
+            QtCore.QTimer.singleShot(0, self.__update_completion)
         else:
             QtWidgets.QLineEdit.keyPressEvent(self, event)
@@ -0,0 +1,108 @@
+# helpers.py - Shared helpers of the tests of Reportbug-NG.
+# Copyright (C) 2007-2014  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Makes src and tools importable and runs tools/fakebts.py in-process."""
+
+
+import os
+import sys
+import shutil
+import logging
+import tempfile
+import threading
+import unittest
+
+
+TOPDIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, os.path.join(TOPDIR, "src"))
+sys.path.insert(0, os.path.join(TOPDIR, "tools"))
+
+import fakebts
+
+# the errors the tests provoke on purpose are logged, but not shown
+logging.getLogger().addHandler(logging.NullHandler())
+
+try:
+    import debianbts
+except ImportError:
+    debianbts = None
+
+# the Bugreports are debianbts', so everything creating them needs it
+needs_debianbts = unittest.skipIf(debianbts is None, "python-debianbts is not installed")
+
+
+class FakeBTSMixin(object):
+    """Starts a FakeBTS with BUGS bugs for every test, its URL is self.url.
+
+    Subclasses tune the server with the attributes LATENCY, FAILRATE and
+    BADBUGS.
+    """
+
+    BUGS = 200
+    LATENCY = 0.0
+    FAILRATE = 0.0
+    BADBUGS = ()
+
+    def setUp(self):
+        self.dataset = fakebts.Dataset(self.BUGS)
+        self.server = fakebts.FakeBTS(("127.0.0.1", 0), self.dataset, self.LATENCY,
+                                      0.0, self.FAILRATE, self.BADBUGS)
+        # the injected failures should be reproducible
+        self.server.random.seed(0)
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval" : 0.05})
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = "http://127.0.0.1:%i/" % self.server.server_address[1]
+        self.buglist = sorted(self.dataset.bugs)
+
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+    def stats(self):
+        """Return the requests, connections and faults served so far."""
+        with self.server.lock:
+            return dict(self.server.stats)
+
+
+class TempDirMixin(object):
+    """Provides an empty temporary directory self.tmpdir for every test."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="rng-test-")
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+    def path(self, *names):
+        return os.path.join(self.tmpdir, *names)
+
+
+    def write(self, name, data):
+        """Write data to the file name in tmpdir and return its path."""
+        path = self.path(name)
+        dirname = os.path.dirname(path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        f = open(path, "w")
+        f.write(data)
+        f.close()
+        return path
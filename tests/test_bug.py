@@ -0,0 +1,94 @@
+# test_bug.py - Tests of bug.
+# Copyright (C) 2007-2014  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import unittest
+from StringIO import StringIO
+
+from helpers import TempDirMixin
+
+import bug
+
+
+class ParseControlTest(unittest.TestCase):
+
+    def test_parse_control(self):
+        control = bug.parse_control(StringIO("Submit-As: foo-src\nReport-With: foo  libfoo1\nbroken\n"))
+        self.assertEqual(control, {"submit-as" : ["foo-src"], "report-with" : ["foo", "libfoo1"]})
+
+
+class BugDirIndexTest(TempDirMixin, unittest.TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.write("bug/foo/control", "Submit-As: foo-src\n")
+        self.write("bug/foo/presubj", "Please read the FAQ first.\n")
+        self.write("bug/foo/script", "#!/bin/sh\n")
+        self.write("bug/bar", "#!/bin/sh\n")
+        self.index = bug.BugDirIndex(self.path("bug"))
+
+    def touch(self, name, delta=10):
+        """Move the mtime of name in the bug directory forward."""
+        path = self.path("bug", name) if name else self.path("bug")
+        st = os.stat(path)
+        os.utime(path, (st.st_atime, st.st_mtime + delta))
+
+    def test_directory(self):
+        entry = self.index.get("foo")
+        self.assertEqual(entry["control"], {"submit-as" : ["foo-src"]})
+        self.assertEqual(entry["presubj"], "Please read the FAQ first.\n")
+        self.assertEqual(entry["script"], self.path("bug", "foo", "script"))
+
+    def test_script_only(self):
+        entry = self.index.get("bar")
+        self.assertEqual(entry["control"], {})
+        self.assertEqual(entry["presubj"], None)
+        self.assertEqual(entry["script"], self.path("bug", "bar"))
+
+    def test_missing(self):
+        entry = self.index.get("baz")
+        self.assertEqual((entry["control"], entry["presubj"], entry["script"]), ({}, None, None))
+
+    def test_missing_bugdir(self):
+        index = bug.BugDirIndex(self.path("missing"))
+        self.assertEqual(index.get("foo")["script"], None)
+
+    def test_entries_are_memoized(self):
+        self.assertTrue(self.index.get("foo") is self.index.get("foo"))
+
+    def test_changed_package_is_read_again(self):
+        self.index.get("foo")
+        self.write("bug/foo/control", "Submit-As: other\n")
+        self.touch("foo")
+        self.assertEqual(self.index.get("foo")["control"], {"submit-as" : ["other"]})
+
+    def test_new_package_is_found(self):
+        self.assertEqual(self.index.get("baz")["script"], None)
+        self.write("bug/baz", "#!/bin/sh\n")
+        self.touch("")
+        self.assertEqual(self.index.get("baz")["script"], self.path("bug", "baz"))
+
+    def test_removed_package(self):
+        self.index.get("bar")
+        os.remove(self.path("bug", "bar"))
+        # even if the directory listing wasn't refreshed yet
+        self.assertEqual(self.index.get("bar")["script"], None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,230 @@
+# test_rngapt.py - Tests of rngapt.
+# Copyright (C) 2007-2014  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import gzip
+import unittest
+
+from helpers import TempDirMixin
+
+import rngapt
+
+
+PACKAGES = """\
+Package: foo
+Version: 1.0
+
+Package: libfoo1
+Source: foo (1.0-1)
+Version: 1.0-1
+
+Package: bar-utils
+Source: bar
+"""
+
+SOURCES = """\
+Package: baz
+Binary: baz, libbaz0
+"""
+
+
+class NameIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = rngapt.NameIndex(["reportbug-ng", "reportbug", "python-reportbug",
+                                       "bug", "debbugs", "rng", "src:reportbug",
+                                       "reportbug"])
+
+    def test_duplicates_are_dropped(self):
+        self.assertEqual(len(self.index), 7)
+
+    def test_complete(self):
+        self.assertEqual(self.index.complete("report"), ["reportbug", "reportbug-ng"])
+        self.assertEqual(self.index.complete("report", limit=1), ["reportbug"])
+        self.assertEqual(self.index.complete("src:"), ["src:reportbug"])
+        self.assertEqual(self.index.complete("zzz"), [])
+
+    def test_fuzzy_ranking(self):
+        # substring matches first, early and short ones before the others,
+        # then the names only containing the characters in order
+        self.assertEqual(self.index.fuzzy("bug"),
+                         ["bug", "debbugs", "reportbug", "reportbug-ng", "src:reportbug",
+                          "python-reportbug"])
+        self.assertEqual(self.index.fuzzy("rng"), ["rng", "reportbug-ng"])
+        self.assertEqual(self.index.fuzzy(""), [])
+
+    def test_fuzzy_matches_within_one_name(self):
+        # "g" and "d" are only found in different names
+        self.assertEqual(self.index.fuzzy("gd"), [])
+
+    def test_fuzzy_special_characters(self):
+        self.assertEqual(self.index.fuzzy("g-n"), ["reportbug-ng"])
+        self.assertEqual(self.index.fuzzy("."), [])
+
+    def test_narrowed_search(self):
+        self.assertEqual(self.index.fuzzy("re"), ["reportbug", "reportbug-ng",
+                                                  "src:reportbug", "python-reportbug"])
+        self.assertEqual(self.index.narrowed[0], "re")
+        self.assertEqual(self.index.fuzzy("rep"), ["reportbug", "reportbug-ng",
+                                                   "src:reportbug", "python-reportbug"])
+        # a new text searches all names again
+        self.assertEqual(self.index.fuzzy("db"), ["debbugs"])
+
+    def test_search(self):
+        self.assertEqual(self.index.search("reportbug", limit=3),
+                         ["reportbug", "reportbug-ng", "src:reportbug"])
+        self.assertEqual(self.index.search("rbg"), ["reportbug", "reportbug-ng",
+                                                    "src:reportbug", "python-reportbug"])
+
+
+class ArchiveNamesTest(TempDirMixin, unittest.TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.listsdir = self.path("lists")
+        os.makedirs(self.listsdir)
+        self.write("lists/deb.example.org_dists_sid_main_binary-amd64_Packages", PACKAGES)
+        f = gzip.open(self.path("lists", "deb.example.org_dists_sid_main_source_Sources.gz"), "w")
+        f.write(SOURCES)
+        f.close()
+        self.write("lists/deb.example.org_dists_sid_Release", "Suite: sid\n")
+        self.indexfile = self.path("cache", "names.txt")
+
+    def test_list_files(self):
+        self.assertEqual([os.path.basename(p) for p in rngapt.list_files(self.listsdir)],
+                         ["deb.example.org_dists_sid_main_binary-amd64_Packages",
+                          "deb.example.org_dists_sid_main_source_Sources.gz"])
+
+    def test_read_names(self):
+        packages, sources = rngapt.list_files(self.listsdir)
+        self.assertEqual(rngapt.read_names(packages),
+                         set(["foo", "libfoo1", "bar-utils", "src:foo", "src:libfoo1",
+                              "src:bar-utils", "src:bar"]))
+        self.assertEqual(rngapt.read_names(sources), set(["src:baz"]))
+
+    def test_archive_names(self):
+        names = rngapt.archive_names(self.listsdir, self.indexfile)
+        self.assertEqual(names, sorted(names))
+        self.assertTrue("foo" in names and "src:baz" in names)
+        self.assertTrue(os.path.exists(self.indexfile))
+
+    def test_index_is_reused_until_a_list_changes(self):
+        names = rngapt.archive_names(self.listsdir, self.indexfile)
+        # a changed index file shows whether it was used
+        f = open(self.indexfile)
+        stamp = f.readline()
+        f.close()
+        self.write("cache/names.txt", stamp + "cached\n")
+        self.assertEqual(rngapt.archive_names(self.listsdir, self.indexfile), ["cached"])
+        self.write("lists/deb.example.org_dists_sid_main_binary-amd64_Packages",
+                   PACKAGES + "\nPackage: new\n")
+        self.assertTrue("new" in rngapt.archive_names(self.listsdir, self.indexfile))
+        self.assertTrue("new" not in names)
+
+    def test_missing_listsdir(self):
+        self.assertEqual(rngapt.archive_names(self.path("missing"), self.indexfile), [])
+
+
+INRELEASE = """\
+-----BEGIN PGP SIGNED MESSAGE-----
+Hash: SHA256
+
+Origin: Debian
+Suite: experimental
+Codename: rc-buggy
+Components: main contrib
+NotAutomatic: yes
+SHA256:
+ 0123 456 main/binary-amd64/Packages
+-----BEGIN PGP SIGNATURE-----
+
+iQIzBAEBCAAdFiEE
+-----END PGP SIGNATURE-----
+"""
+
+PREFERENCES = """\
+Package: foo
+Pin: release a=experimental
+Pin-Priority: 800
+
+Package: *
+Pin: release a=experimental
+Pin-Priority: 200
+
+Package: *
+Pin: origin "deb.example.org"
+Pin-Priority: broken
+"""
+
+
+class ReleaseTest(TempDirMixin, unittest.TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.release = rngapt.read_release(self.write("InRelease", INRELEASE))
+
+    def tearDown(self):
+        rngapt._release_info = (None, [])
+        TempDirMixin.tearDown(self)
+
+    def test_read_release(self):
+        self.assertEqual(self.release, {"origin" : "Debian", "suite" : "experimental",
+                                        "codename" : "rc-buggy", "components" : "main contrib",
+                                        "notautomatic" : "yes", "sha256" : ""})
+
+    def test_priority(self):
+        self.assertEqual(rngapt.priority(self.release, "deb.debian.org"), 1)
+        self.release["butautomaticupgrades"] = "yes"
+        self.assertEqual(rngapt.priority(self.release, "deb.debian.org"), 100)
+        self.assertEqual(rngapt.priority({"suite" : "sid"}, "deb.debian.org"), 500)
+        self.assertEqual(rngapt.priority({"codename" : "sid"}, "deb.debian.org", default="sid"), 990)
+
+    def test_pins(self):
+        pins = [("release a=unstable", 700), ("release n=rc-buggy,c=main", 600),
+                ("origin \"*.debian.org\"", 300)]
+        self.assertEqual(rngapt.priority(self.release, "deb.debian.org", pins), 600)
+        self.assertEqual(rngapt.priority({"suite" : "sid"}, "deb.debian.org", pins), 300)
+        self.assertEqual(rngapt.priority({"suite" : "sid"}, "deb.example.org", pins), 500)
+
+    def test_read_pins(self):
+        self.write("preferences.d/experimental", PREFERENCES)
+        self.assertEqual(rngapt.read_pins([self.path("preferences.d"), self.path("missing")]),
+                         [("release a=experimental", 200)])
+
+    def test_default_release(self):
+        self.write("apt.conf.d/00default", 'APT::Default-Release "testing";\n')
+        self.assertEqual(rngapt.default_release([self.path("apt.conf.d")]), "testing")
+        self.assertEqual(rngapt.default_release([self.path("missing")]), None)
+
+    def test_release_info(self):
+        self.write("lists/deb.debian.org_debian_dists_experimental_InRelease", INRELEASE)
+        self.write("lists/deb.debian.org_debian_dists_experimental_Release", "Suite: ignored\n")
+        self.write("lists/deb.example.org_dists_stable_Release", "Suite: stable\n")
+        default, pins = rngapt.default_release, rngapt.read_pins
+        rngapt.default_release = lambda: "stable"
+        rngapt.read_pins = lambda: []
+        try:
+            self.assertEqual(rngapt.release_info(self.path("lists")),
+                             [(990, "stable", "deb.example.org"),
+                              (1, "experimental", "deb.debian.org")])
+        finally:
+            rngapt.default_release, rngapt.read_pins = default, pins
+
+
+if __name__ == "__main__":
+    unittest.main()
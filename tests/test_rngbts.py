@@ -0,0 +1,183 @@
+# test_rngbts.py - Tests of rngbts.
+# Copyright (C) 2007-2014  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import socket
+import datetime
+import threading
+import unittest
+import BaseHTTPServer
+
+from helpers import FakeBTSMixin, needs_debianbts
+
+import rngbts as bts
+
+
+class CannedHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answers every POST with the server's canned reply."""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.getheader("content-length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.server.reply)))
+        self.end_headers()
+        self.wfile.write(self.server.reply)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ArgTest(unittest.TestCase):
+
+    def test_int(self):
+        self.assertEqual(bts._arg("arg0", 42), '<arg0 xsi:type="xsd:int">42</arg0>')
+
+    def test_string(self):
+        self.assertEqual(bts._arg("arg0", u"caf\xe9 <&>"),
+                         '<arg0 xsi:type="xsd:string">caf\xc3\xa9 &lt;&amp;&gt;</arg0>')
+
+    def test_array(self):
+        self.assertEqual(bts._arg("arg0", [1, 2]),
+                         '<arg0 soapenc:arrayType="xsd:int[2]" xsi:type="soapenc:Array">'
+                         '<item xsi:type="xsd:int">1</item><item xsi:type="xsd:int">2</item></arg0>')
+
+
+class FakeBTSTest(FakeBTSMixin, unittest.TestCase):
+    """rngbts against tools/fakebts.py."""
+
+    BADBUGS = (100013,)
+
+    def setUp(self):
+        FakeBTSMixin.setUp(self)
+        bts.set_url(self.url + "cgi-bin/soap.cgi")
+
+    def tearDown(self):
+        bts.set_url(bts.URL)
+        FakeBTSMixin.tearDown(self)
+
+    def test_get_bugs(self):
+        query = ("package", "package0", "severity", "normal")
+        expected = self.dataset.get_bugs(query)
+        self.assertTrue(expected)
+        self.assertEqual(bts.get_bugs(*query), expected)
+        # like debianbts, the pairs can be given as one list
+        self.assertEqual(bts.get_bugs(list(query)), expected)
+        self.assertEqual(bts.get_bugs("package", "missing"), [])
+
+    @needs_debianbts
+    def test_get_status(self):
+        bugs = bts.get_status(100001, [100002, 100003], 999)
+        self.assertEqual([b.bug_num for b in bugs], [100001, 100002, 100003])
+        for bug in bugs:
+            data = self.dataset.bugs[bug.bug_num]
+            self.assertEqual(bug.package, data["package"])
+            self.assertEqual(bug.source, data["source"])
+            self.assertEqual(bug.subject, data["subject"])
+            self.assertEqual(bug.severity, data["severity"])
+            self.assertEqual(bug.tags, data["tags"])
+            self.assertEqual(bug.done, data["done"])
+            self.assertEqual(bug.archived, False)
+            self.assertEqual(bug.found_versions, [])
+            self.assertEqual(bug.log_modified, datetime.datetime.utcfromtimestamp(data["log_modified"]))
+
+    def test_get_status_of_nothing(self):
+        self.assertEqual(bts.get_status([]), [])
+        self.assertEqual(self.stats()["requests"], 0)
+
+    def test_fault(self):
+        self.assertRaises(bts.BTSError, bts.get_status, [100012, 100013])
+        self.assertEqual(self.stats()["faults"], 1)
+
+    def test_connection_is_reused(self):
+        for i in range(20):
+            bts.get_bugs("package", "package%i" % i)
+        self.assertEqual(self.stats()["connections"], 1)
+        self.assertEqual(bts.stats(), {"connections" : 1, "requests" : 20})
+
+    def test_concurrent_requests(self):
+        errors = []
+        def worker():
+            try:
+                for i in range(10):
+                    bts.get_bugs("package", "package%i" % i)
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=worker) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.stats()["requests"], 40)
+        self.assertTrue(self.stats()["connections"] <= 4)
+
+    def test_closed_idle_connection_is_replaced(self):
+        bts.get_bugs("package", "package0")
+        # the connection went away while it was idle
+        for conn in bts._pool.idle:
+            conn.sock.shutdown(socket.SHUT_RDWR)
+        self.assertEqual(bts.get_bugs("package", "package0"), self.dataset.get_bugs(("package", "package0")))
+        self.assertEqual(bts.stats()["connections"], 2)
+
+
+class MalformedReplyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(("127.0.0.1", 0), CannedHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval" : 0.05})
+        self.thread.daemon = True
+        self.thread.start()
+        bts.set_url("http://127.0.0.1:%i/cgi-bin/soap.cgi" % self.server.server_address[1])
+
+    def tearDown(self):
+        bts.set_url(bts.URL)
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_not_xml(self):
+        self.server.reply = "<html>Internal Server Error"
+        self.assertRaises(bts.BTSError, bts.get_bugs, "package", "foo")
+
+    def test_empty_body(self):
+        self.server.reply = ('<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">'
+                             '<soap:Body></soap:Body></soap:Envelope>')
+        self.assertRaises(bts.BTSError, bts.get_bugs, "package", "foo")
+
+    @needs_debianbts
+    def test_broken_status(self):
+        self.server.reply = ('<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">'
+                             '<soap:Body><get_statusResponse><s><item><value>'
+                             '<bug_num>not a number</bug_num>'
+                             '</value></item></s></get_statusResponse></soap:Body></soap:Envelope>')
+        self.assertRaises(bts.BTSError, bts.get_status, [1])
+
+
+class UnreachableTest(unittest.TestCase):
+
+    def test_transport_error_is_no_btserror(self):
+        s = socket.socket()
+        s.bind(("127.0.0.1", 0))
+        bts.set_url("http://127.0.0.1:%i/cgi-bin/soap.cgi" % s.getsockname()[1])
+        s.close()
+        try:
+            self.assertRaises(socket.error, bts.get_bugs, "package", "foo")
+        finally:
+            bts.set_url(bts.URL)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,179 @@
+# test_rngcache.py - Tests of rngcache.
+# Copyright (C) 2007-2014  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import time
+import sqlite3
+import datetime
+import unittest
+
+from helpers import TempDirMixin, needs_debianbts
+
+import rngcache
+
+
+class FakeBug(object):
+
+    def __init__(self, bug_num, **fields):
+        self.bug_num = bug_num
+        self.package = "foo"
+        self.source = "foo-src"
+        self.originator = "Jane Doe <jane@example.org>"
+        self.subject = "bug %i" % bug_num
+        self.severity = "normal"
+        self.tags = []
+        self.done = False
+        self.archived = False
+        self.log_modified = datetime.datetime(2014, 1, 1, 12, 0, 0)
+        for key, value in fields.items():
+            setattr(self, key, value)
+
+
+class NormalizeQueryTest(unittest.TestCase):
+
+    def test_order_and_case_dont_matter(self):
+        self.assertEqual(rngcache.normalize_query(("severity", "Grave", "tag", "patch")),
+                         rngcache.normalize_query(("tag", "patch", "severity", "grave")))
+
+    def test_different_queries(self):
+        self.assertNotEqual(rngcache.normalize_query(("package", "foo")),
+                            rngcache.normalize_query(("src", "foo")))
+
+
+class QueryCacheTest(TempDirMixin, unittest.TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.cache = rngcache.QueryCache(self.path("cache.sqlite"), ttl=600)
+
+    def age(self, seconds):
+        self.cache.db.execute("UPDATE queries SET fetched = fetched - ?", (seconds,))
+
+    def test_get_put(self):
+        self.assertEqual(self.cache.get(("package", "foo")), None)
+        self.cache.put(("package", "foo"), [3, 1, 2])
+        self.assertEqual(self.cache.get(("package", "foo")), [3, 1, 2])
+        self.assertEqual(self.cache.get(("package", "bar")), None)
+
+    def test_empty_buglist(self):
+        self.cache.put(("package", "foo"), [])
+        self.assertEqual(self.cache.get(("package", "foo")), [])
+
+    def test_ttl(self):
+        self.cache.put(("package", "foo"), [1])
+        self.age(599)
+        self.assertEqual(self.cache.get(("package", "foo")), [1])
+        self.age(2)
+        self.assertEqual(self.cache.get(("package", "foo")), None)
+
+    def test_put_removes_expired_entries(self):
+        self.cache.put(("package", "foo"), [1])
+        self.age(601)
+        self.cache.put(("package", "bar"), [2])
+        self.assertEqual(self.cache.db.execute("SELECT COUNT(*) FROM queries").fetchone()[0], 1)
+
+    def test_persistent(self):
+        self.cache.put(("package", "foo"), [1])
+        cache = rngcache.QueryCache(self.path("cache.sqlite"))
+        self.assertEqual(cache.get(("package", "foo")), [1])
+
+    def test_clear(self):
+        self.cache.put(("package", "foo"), [1])
+        self.cache.clear()
+        self.assertEqual(self.cache.get(("package", "foo")), None)
+
+
+@needs_debianbts
+class BugCacheTest(TempDirMixin, unittest.TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.cache = rngcache.BugCache(self.path("cache.sqlite"), size=10, maxage=3600)
+
+    def age(self, seconds, bugnumbers=None):
+        sql = "UPDATE bugs SET fetched = fetched - ?, accessed = accessed - ?"
+        if bugnumbers is None:
+            self.cache.db.execute(sql, (seconds, seconds))
+        else:
+            self.cache.db.executemany(sql + " WHERE bug_num = ?",
+                                      [(seconds, seconds, i) for i in bugnumbers])
+
+    def test_get_put(self):
+        self.cache.put([FakeBug(1, tags=["patch", "l10n"], done=True), FakeBug(2)])
+        bugs = self.cache.get([1, 2, 3])
+        self.assertEqual(sorted(bugs), [1, 2])
+        bug = bugs[1]
+        self.assertEqual(bug.bug_num, 1)
+        self.assertEqual(bug.package, "foo")
+        self.assertEqual(bug.source, "foo-src")
+        self.assertEqual(bug.originator, "Jane Doe <jane@example.org>")
+        self.assertEqual(bug.subject, "bug 1")
+        self.assertEqual(bug.tags, ["patch", "l10n"])
+        self.assertEqual(bug.done, True)
+        self.assertEqual(bug.archived, False)
+        self.assertEqual(bug.log_modified, datetime.datetime(2014, 1, 1, 12, 0, 0))
+
+    def test_put_replaces(self):
+        self.cache.put([FakeBug(1)])
+        self.cache.put([FakeBug(1, severity="grave")])
+        self.assertEqual(self.cache.get([1])[1].severity, "grave")
+
+    def test_maxage(self):
+        self.cache.put([FakeBug(1), FakeBug(2)])
+        self.age(3599, [1])
+        self.age(3601, [2])
+        self.assertEqual(sorted(self.cache.get([1, 2])), [1])
+        self.assertEqual(sorted(self.cache.get([1, 2], maxage=3000)), [])
+        # a longer maxage doesn't make stale bugs fresh again
+        self.assertEqual(sorted(self.cache.get([1, 2], maxage=7200)), [1])
+
+    def test_many_bugs(self):
+        # more than sqlite's limit of host parameters
+        self.cache.size = 2000
+        self.cache.put([FakeBug(i) for i in range(1500)])
+        self.assertEqual(len(self.cache.get(range(1500))), 1500)
+
+    def test_least_recently_used_are_evicted(self):
+        self.cache.put([FakeBug(i) for i in range(10)])
+        self.age(100)
+        # bugs 0 to 4 are used again
+        self.cache.get(range(5))
+        self.cache.put([FakeBug(i) for i in range(10, 15)])
+        self.assertEqual(sorted(self.cache.get(range(15))), range(5) + range(10, 15))
+
+    def test_clear(self):
+        self.cache.put([FakeBug(1)])
+        self.cache.clear()
+        self.assertEqual(self.cache.get([1]), {})
+
+    def test_old_schema_is_replaced(self):
+        db = sqlite3.connect(self.path("old.sqlite"))
+        db.execute("""CREATE TABLE bugs (bug_num INTEGER PRIMARY KEY, package TEXT,
+                      subject TEXT, severity TEXT, tags TEXT, done INTEGER,
+                      archived INTEGER, log_modified INTEGER, fetched REAL, accessed REAL)""")
+        db.execute("INSERT INTO bugs VALUES (1, 'foo', 'bug 1', 'normal', '', 0, 0, 0, ?, ?)",
+                   (time.time(), time.time()))
+        db.commit()
+        db.close()
+        cache = rngcache.BugCache(self.path("old.sqlite"))
+        self.assertEqual(cache.get([1]), {})
+        cache.put([FakeBug(1)])
+        self.assertEqual(cache.get([1])[1].originator, "Jane Doe <jane@example.org>")
+
+
+if __name__ == "__main__":
+    unittest.main()
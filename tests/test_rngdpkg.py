@@ -0,0 +1,127 @@
+# test_rngdpkg.py - Tests of rngdpkg.
+# Copyright (C) 2007-2014  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import unittest
+from StringIO import StringIO
+
+from helpers import TempDirMixin
+
+import rngdpkg
+
+
+STATUS = """\
+Package: foo
+Status: install ok installed
+Version: 1.0-1
+Depends: libc6 (>= 2.19),
+ libbar1
+Description: the foo
+ It foos.
+
+Package: bar
+Status: deinstall ok config-files
+Version: 0.9
+
+Package: libbaz1
+Status: install ok installed
+Architecture: amd64
+Source: baz (2.0-1)
+Version: 2.0-1+b1
+
+Package: libbaz1
+Status: install ok installed
+Architecture: i386
+Version: 2.0-1
+"""
+
+
+class ParseStatusTest(unittest.TestCase):
+
+    def test_stanzas(self):
+        stanzas = list(rngdpkg.parse_status(StringIO(STATUS)))
+        self.assertEqual([s["package"] for s in stanzas], ["foo", "bar", "libbaz1", "libbaz1"])
+        self.assertEqual(stanzas[0]["depends"], "libc6 (>= 2.19),\nlibbar1")
+        self.assertEqual(stanzas[0]["description"], "the foo\nIt foos.")
+
+    def test_is_installed(self):
+        installed = [rngdpkg.is_installed(s) for s in rngdpkg.parse_status(StringIO(STATUS))]
+        self.assertEqual(installed, [True, False, True, True])
+        self.assertFalse(rngdpkg.is_installed({}))
+
+
+class InstalledPackagesTest(TempDirMixin, unittest.TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.statusfile = self.write("status", STATUS)
+        self.indexfile = self.path("cache", "installed.txt")
+
+    def test_read_installed(self):
+        self.assertEqual(rngdpkg.read_installed(self.statusfile), ["foo", "libbaz1"])
+
+    def test_index_is_reused_until_the_statusfile_changes(self):
+        self.assertEqual(rngdpkg.installed_packages(self.statusfile, self.indexfile), ["foo", "libbaz1"])
+        # a changed index file shows whether it was used
+        f = open(self.indexfile)
+        stamp = f.readline()
+        f.close()
+        self.write("cache/installed.txt", stamp + "cached\n")
+        self.assertEqual(rngdpkg.installed_packages(self.statusfile, self.indexfile), ["cached"])
+        self.write("status", STATUS.replace("deinstall ok config-files", "install ok installed"))
+        self.assertEqual(rngdpkg.installed_packages(self.statusfile, self.indexfile),
+                         ["bar", "foo", "libbaz1"])
+
+    def test_missing_statusfile(self):
+        self.assertEqual(rngdpkg.installed_packages(self.path("missing"), self.indexfile), [])
+
+
+class StatusIndexTest(TempDirMixin, unittest.TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.statusfile = self.write("status", STATUS)
+        self.index = rngdpkg.StatusIndex(self.statusfile)
+
+    def test_get(self):
+        self.assertEqual(self.index.field("foo", "version"), "1.0-1")
+        self.assertEqual(self.index.field("bar", "version"), "0.9")
+        self.assertEqual(self.index.get("missing"), None)
+        self.assertEqual(self.index.field("missing", "version", None), None)
+        # only the indexed fields are kept
+        self.assertEqual(self.index.field("foo", "description"), "")
+
+    def test_multiarch(self):
+        # the first instance wins
+        self.assertEqual(self.index.field("libbaz1", "version"), "2.0-1+b1")
+        self.assertEqual(self.index.field("libbaz1:any", "source"), "baz (2.0-1)")
+
+    def test_refresh(self):
+        self.assertEqual(self.index.field("foo", "version"), "1.0-1")
+        self.write("status", STATUS.replace("1.0-1", "1.0-2"))
+        st = os.stat(self.statusfile)
+        os.utime(self.statusfile, (st.st_atime, st.st_mtime + 10))
+        self.assertEqual(self.index.field("foo", "version"), "1.0-2")
+
+    def test_missing_statusfile(self):
+        index = rngdpkg.StatusIndex(self.path("missing"))
+        self.assertEqual(index.get("foo"), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
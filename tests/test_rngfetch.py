@@ -0,0 +1,274 @@
+# test_rngfetch.py - Tests of rngfetch.
+# Copyright (C) 2007-2014  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import socket
+import threading
+import unittest
+
+from helpers import FakeBTSMixin, TempDirMixin, needs_debianbts
+
+import rngbts as bts
+import rngcache
+import rngfetch
+
+
+class FakeBug(object):
+
+    def __init__(self, bug_num):
+        self.bug_num = bug_num
+
+
+class FakeGetStatus(object):
+    """get_status answering every chunk, except those containing a bad bug."""
+
+    def __init__(self, bad=(), error=bts.BTSError):
+        self.bad = set(bad)
+        self.error = error
+        self.calls = []
+
+    def __call__(self, chunk):
+        self.calls.append(list(chunk))
+        if self.bad.intersection(chunk):
+            raise self.error("bad bug")
+        return [FakeBug(i) for i in chunk]
+
+
+class AdaptiveBatcherTest(unittest.TestCase):
+
+    def test_chunks_cover_buglist_in_order(self):
+        batcher = rngfetch.AdaptiveBatcher(range(100), 30, minsize=10, maxsize=40)
+        chunks = []
+        while True:
+            task = batcher.next_chunk()
+            if task is None:
+                break
+            self.assertEqual(task[0], len(chunks))
+            chunks.append(task[1])
+        self.assertEqual(sum(chunks, []), range(100))
+        self.assertEqual([len(c) for c in chunks], [30, 30, 30, 10])
+
+    def test_report_adapts_chunksize_within_bounds(self):
+        batcher = rngfetch.AdaptiveBatcher(range(1000), 50, minsize=10, maxsize=400)
+        batcher.report(rngfetch.FAST / 2, True)
+        self.assertEqual(batcher.chunksize, 100)
+        for i in range(5):
+            batcher.report(rngfetch.FAST / 2, True)
+        self.assertEqual(batcher.chunksize, 400)
+        batcher.report(rngfetch.SLOW * 2, True)
+        self.assertEqual(batcher.chunksize, 200)
+        batcher.report(rngfetch.FAST / 2, False)
+        self.assertEqual(batcher.chunksize, 100)
+        # neither fast nor slow
+        batcher.report((rngfetch.FAST + rngfetch.SLOW) / 2, True)
+        self.assertEqual(batcher.chunksize, 100)
+        for i in range(10):
+            batcher.report(0, False)
+        self.assertEqual(batcher.chunksize, 10)
+
+
+class BisectStatusTest(unittest.TestCase):
+
+    def test_skips_only_the_bad_bugs(self):
+        get_status = FakeGetStatus(bad=[5, 40])
+        bugs = rngfetch.bisect_status(range(64), get_status)
+        self.assertEqual([b.bug_num for b in bugs], [i for i in range(64) if i not in (5, 40)])
+        # a bisection, not one call per bug
+        self.assertTrue(len(get_status.calls) < 30)
+
+    def test_unknown_bugs_are_not_bisected(self):
+        calls = []
+        def get_status(chunk):
+            calls.append(chunk)
+            return [FakeBug(i) for i in chunk if i % 2]
+        bugs = rngfetch.bisect_status(range(64), get_status)
+        self.assertEqual([b.bug_num for b in bugs], range(1, 64, 2))
+        self.assertEqual(rngfetch.bisect_status(range(100, 164), lambda c: calls.append(c) or []), [])
+        self.assertEqual(len(calls), 2)
+
+    def test_transport_error_is_raised(self):
+        get_status = FakeGetStatus(bad=[5], error=socket.error)
+        self.assertRaises(socket.error, rngfetch.bisect_status, range(64), get_status)
+        self.assertEqual(len(get_status.calls), 1)
+
+    def test_cancel_stops_bisection(self):
+        cancel = threading.Event()
+        cancel.set()
+        get_status = FakeGetStatus(bad=[5])
+        self.assertEqual(rngfetch.bisect_status(range(64), get_status, cancel=cancel), [])
+        self.assertEqual(len(get_status.calls), 1)
+
+    def test_failures_shrink_the_chunks(self):
+        batcher = rngfetch.AdaptiveBatcher(range(64), 64, minsize=2, maxsize=64)
+        rngfetch.bisect_status(range(64), FakeGetStatus(bad=[5]), batcher)
+        self.assertTrue(batcher.chunksize < 64)
+
+
+class FetchStatusFakeTest(unittest.TestCase):
+    """fetch_status with a get_status which doesn't need a BTS."""
+
+    def test_results_and_callbacks_in_order(self):
+        chunks = []
+        progress = []
+        bugs = rngfetch.fetch_status(range(500), chunksize=10, workers=4,
+                                     progress=progress.append, callback=chunks.append,
+                                     get_status=FakeGetStatus(bad=[123]))
+        expected = [i for i in range(500) if i != 123]
+        self.assertEqual([b.bug_num for b in bugs], expected)
+        self.assertEqual([b.bug_num for b in sum(chunks, [])], expected)
+        self.assertEqual(progress[-1], 100)
+        self.assertEqual(progress, sorted(progress))
+
+    def test_transport_error_stops_the_fetch(self):
+        get_status = FakeGetStatus(bad=range(5000), error=socket.error)
+        self.assertRaises(socket.error, rngfetch.fetch_status, range(5000),
+                          chunksize=10, workers=4, get_status=get_status)
+        # every worker gives up after its first chunk
+        self.assertTrue(len(get_status.calls) <= 4)
+
+    def test_cancelled(self):
+        cancel = threading.Event()
+        cancel.set()
+        get_status = FakeGetStatus()
+        self.assertEqual(rngfetch.fetch_status(range(500), get_status=get_status, cancel=cancel), [])
+        self.assertEqual(get_status.calls, [])
+
+    def test_merge_buglists(self):
+        buglist, matches = rngfetch.merge_buglists([[3, 1], None, [1, 2]])
+        self.assertEqual(buglist, [3, 1, 2])
+        self.assertEqual(matches, {3 : [0], 1 : [0, 2], 2 : [2]})
+
+
+class FetchStatusTest(FakeBTSMixin, TempDirMixin, unittest.TestCase):
+    """fetch_status against tools/fakebts.py."""
+
+    BADBUGS = (100050, 100123)
+
+    def setUp(self):
+        FakeBTSMixin.setUp(self)
+        TempDirMixin.setUp(self)
+        bts.set_url(self.url + "cgi-bin/soap.cgi")
+
+    def tearDown(self):
+        bts.set_url(bts.URL)
+        TempDirMixin.tearDown(self)
+        FakeBTSMixin.tearDown(self)
+
+    def test_get_buglist(self):
+        query = ("package", "package0")
+        cache = rngcache.QueryCache(self.path("cache.sqlite"))
+        expected = self.dataset.get_bugs(query)
+        self.assertTrue(expected)
+        self.assertEqual(rngfetch.get_buglist(query, cache=cache), expected)
+        requests = self.stats()["requests"]
+        self.assertEqual(rngfetch.get_buglist(query, cache=cache), expected)
+        self.assertEqual(self.stats()["requests"], requests)
+        rngfetch.get_buglist(query, cache=cache, refresh=True)
+        self.assertEqual(self.stats()["requests"], requests + 1)
+
+    def test_fetch_buglists(self):
+        queries = [("package", "package0"), ("severity", "grave")]
+        self.assertEqual(rngfetch.fetch_buglists(queries),
+                         [self.dataset.get_bugs(q) for q in queries])
+
+    @needs_debianbts
+    def test_bad_bugs_are_skipped(self):
+        chunks = []
+        bugs = rngfetch.fetch_status(self.buglist, chunksize=20, callback=chunks.append)
+        expected = [i for i in self.buglist if i not in self.BADBUGS]
+        self.assertEqual([b.bug_num for b in bugs], expected)
+        self.assertEqual([b.bug_num for b in sum(chunks, [])], expected)
+        self.assertEqual(bugs[0].package, self.dataset.bugs[expected[0]]["package"])
+        self.assertTrue(self.stats()["faults"] > 0)
+
+    @needs_debianbts
+    def test_connections_are_reused(self):
+        rngfetch.fetch_status(self.buglist, chunksize=10, workers=2)
+        stats = self.stats()
+        self.assertTrue(stats["requests"] > 20)
+        self.assertTrue(stats["connections"] <= 4)
+
+    @needs_debianbts
+    def test_cache(self):
+        cache = rngcache.BugCache(self.path("cache.sqlite"))
+        rngfetch.fetch_status(self.buglist, cache=cache)
+        requests = self.stats()["requests"]
+        bugs = rngfetch.fetch_status(self.buglist[:50], cache=cache)
+        self.assertEqual([b.bug_num for b in bugs], self.buglist[:50])
+        self.assertEqual(self.stats()["requests"], requests)
+        # only the bad bugs are missing in the cache, they are fetched as one
+        # chunk, which fails and is bisected
+        rngfetch.fetch_status(self.buglist, cache=cache)
+        self.assertEqual(self.stats()["requests"], requests + 3)
+        rngfetch.fetch_status(self.buglist[:50], cache=cache, maxage=60)
+        self.assertEqual(self.stats()["requests"], requests + 3)
+        rngfetch.fetch_status(self.buglist[:50], cache=cache, maxage=0)
+        self.assertTrue(self.stats()["requests"] > requests + 3)
+        requests = self.stats()["requests"]
+        rngfetch.fetch_status(self.buglist[:50], cache=cache, refresh=True)
+        self.assertTrue(self.stats()["requests"] > requests)
+
+
+@needs_debianbts
+class FlakyFetchStatusTest(FakeBTSMixin, unittest.TestCase):
+    """fetch_status against tools/fakebts.py failing every third request."""
+
+    BUGS = 1000
+    FAILRATE = 0.3
+
+    def setUp(self):
+        FakeBTSMixin.setUp(self)
+        bts.set_url(self.url + "cgi-bin/soap.cgi")
+
+    def tearDown(self):
+        bts.set_url(bts.URL)
+        FakeBTSMixin.tearDown(self)
+
+    def test_failed_chunks_are_bisected(self):
+        bugs = [b.bug_num for b in rngfetch.fetch_status(self.buglist, chunksize=10)]
+        stats = self.stats()
+        self.assertTrue(stats["faults"] > 0)
+        # only bugs whose single request failed are missing, in order
+        self.assertEqual(bugs, [i for i in self.buglist if i in set(bugs)])
+        self.assertTrue(len(self.buglist) - len(bugs) <= stats["faults"])
+        self.assertTrue(len(bugs) > len(self.buglist) // 2)
+
+
+class UnreachableTest(unittest.TestCase):
+
+    def setUp(self):
+        # a port nobody listens on
+        s = socket.socket()
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+        s.close()
+        bts.set_url("http://127.0.0.1:%i/cgi-bin/soap.cgi" % port)
+
+    def tearDown(self):
+        bts.set_url(bts.URL)
+
+    def test_fetch_status_gives_up(self):
+        self.assertRaises(socket.error, rngfetch.fetch_status, range(1, 5000))
+        # one attempt per worker at most, no bisection
+        self.assertTrue(bts.stats()["connections"] <= rngfetch.WORKERS)
+
+    def test_fetch_buglists_logs_the_error(self):
+        self.assertEqual(rngfetch.fetch_buglists([("package", "foo")]), [None])
+
+
+if __name__ == "__main__":
+    unittest.main()
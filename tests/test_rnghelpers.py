@@ -0,0 +1,67 @@
+# test_rnghelpers.py - Tests of rnghelpers.
+# Copyright (C) 2007-2014  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import time
+import threading
+import unittest
+
+import helpers
+
+import rnghelpers as rng
+
+
+class CollectSectionsTest(unittest.TestCase):
+
+    def test_results_in_order(self):
+        sections = [("slow", lambda: time.sleep(0.2) or "slow\n", (), 5),
+                    ("fast", lambda x: x, ("fast\n",), 5)]
+        self.assertEqual(rng.collectSections(sections), ["slow\n", "fast\n"])
+
+    def test_sections_run_concurrently(self):
+        barrier = threading.Event()
+        def waiter():
+            return "waited\n" if barrier.wait(5) else "timeout\n"
+        def releaser():
+            barrier.set()
+            return "released\n"
+        start = time.time()
+        # waiter only returns early if releaser runs at the same time
+        self.assertEqual(rng.collectSections([("waiter", waiter, (), 5),
+                                              ("releaser", releaser, (), 5)]),
+                         ["waited\n", "released\n"])
+        self.assertTrue(time.time() - start < 4)
+
+    def test_failing_section(self):
+        def fail():
+            raise OSError("no such file")
+        result = rng.collectSections([("Broken", fail, (), 5)])
+        self.assertEqual(result, ["--- Broken: not available, no such file ---\n"])
+
+    def test_hanging_section(self):
+        hang = threading.Event()
+        start = time.time()
+        result = rng.collectSections([("Hanging", hang.wait, (10,), 0.2),
+                                      ("Quick", lambda: "quick\n", (), 0.2)])
+        hang.set()
+        self.assertTrue(time.time() - start < 2)
+        self.assertEqual(result[1], "quick\n")
+        self.assertTrue(result[0].startswith("--- Hanging: not available, timed out"))
+
+
+if __name__ == "__main__":
+    unittest.main()
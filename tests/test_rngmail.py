@@ -0,0 +1,302 @@
+# test_rngmail.py - Tests of rngmail.
+# Copyright (C) 2007-2014  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import time
+import email
+from email.header import decode_header
+import threading
+import unittest
+
+from helpers import TempDirMixin
+
+import rngmail
+
+
+class FakeTransport(object):
+    """Transport recording the messages, failing with error if given and
+    taking delay seconds per message."""
+
+    def __init__(self, error=None, delay=0):
+        self.error = error
+        self.delay = delay
+        self.sent = []
+
+    def send(self, sender, recipients, msg):
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        self.sent.append((sender, recipients, msg))
+
+
+class ComposeTest(TempDirMixin, unittest.TestCase):
+
+    def test_plain(self):
+        msg = rngmail.compose("Jane <jane@example.org>", "submit@bugs.debian.org",
+                              u"[foo] caf\xe9", u"Package: foo\n\ncaf\xe9\n")
+        self.assertEqual(msg["To"], "submit@bugs.debian.org")
+        self.assertEqual(msg["X-Mailer"], "reportbug-ng")
+        parsed = email.message_from_string(msg.as_string())
+        subject = decode_header(parsed["Subject"])[0]
+        self.assertEqual(subject[0].decode(subject[1]), u"[foo] caf\xe9")
+        self.assertEqual(parsed.get_payload(decode=True).decode("utf-8"), u"Package: foo\n\ncaf\xe9\n")
+
+    def test_attachments(self):
+        path = self.write("script-output.txt", "lots of output\n")
+        msg = rngmail.compose("jane@example.org", "submit@bugs.debian.org", u"[foo] bar",
+                              u"Package: foo\n", [path])
+        parts = email.message_from_string(msg.as_string()).get_payload()
+        self.assertEqual(len(parts), 2)
+        self.assertEqual(parts[1].get_filename(), "script-output.txt")
+        self.assertEqual(parts[1].get_payload(decode=True), "lots of output\n")
+
+    def test_default_sender(self):
+        environ = dict(os.environ)
+        try:
+            os.environ.update({"DEBEMAIL" : "jane@example.org", "DEBFULLNAME" : "Jane Doe"})
+            self.assertEqual(rngmail.default_sender(), "Jane Doe <jane@example.org>")
+        finally:
+            os.environ.clear()
+            os.environ.update(environ)
+
+
+class OutboxTest(TempDirMixin, unittest.TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.outbox = rngmail.Outbox(self.path("outbox"))
+
+    def put(self):
+        return self.outbox.put("smtp", "jane@example.org", ["submit@bugs.debian.org"], "message")
+
+    def test_put(self):
+        self.assertEqual(self.outbox.names(), [])
+        self.assertEqual(self.outbox.next_attempt(), None)
+        name = self.put()
+        self.assertEqual(self.outbox.names(), [name])
+        self.assertEqual(self.outbox.message(name), "message")
+        info = self.outbox.info(name)
+        self.assertEqual(info["mailer"], "smtp")
+        self.assertEqual(info["recipients"], ["submit@bugs.debian.org"])
+        self.assertEqual(info["attempts"], 0)
+        self.assertEqual(self.outbox.due(), [name])
+        # no temporary files are left
+        self.assertEqual(sorted(os.listdir(self.path("outbox"))), [name + ".eml", name + ".json"])
+
+    def test_names_are_ordered(self):
+        names = [self.put() for i in range(5)]
+        self.assertEqual(self.outbox.names(), names)
+
+    def test_delivered(self):
+        name = self.put()
+        self.outbox.delivered(name)
+        self.assertEqual(self.outbox.names(), [])
+
+    def test_backoff(self):
+        name = self.put()
+        delays = []
+        for attempt in range(1, rngmail.MAX_ATTEMPTS):
+            start = time.time()
+            self.assertFalse(self.outbox.failed(name, self.outbox.info(name), "timeout"))
+            info = self.outbox.info(name)
+            self.assertEqual(info["attempts"], attempt)
+            self.assertEqual(info["error"], "timeout")
+            delays.append(int(round(info["next"] - start)))
+        self.assertEqual(delays[:4], [rngmail.RETRY_DELAY * f for f in (1, 2, 4, 8)])
+        self.assertEqual(max(delays), rngmail.MAX_RETRY_DELAY)
+        self.assertEqual(delays, sorted(delays))
+        self.assertEqual(self.outbox.due(), [])
+        self.assertEqual(self.outbox.due(time.time() + rngmail.MAX_RETRY_DELAY + 1), [name])
+        # the last attempt gives up
+        self.assertTrue(self.outbox.failed(name, self.outbox.info(name), "timeout"))
+        self.assertEqual(self.outbox.names(), [])
+        self.assertEqual(sorted(os.listdir(self.outbox.faileddir)), [name + ".eml", name + ".json"])
+
+    def test_permanent_failure(self):
+        name = self.put()
+        self.assertTrue(self.outbox.failed(name, self.outbox.info(name), "rejected", True))
+        self.assertEqual(self.outbox.names(), [])
+
+    def test_unreadable_info_is_due(self):
+        name = self.put()
+        self.write("outbox/%s.json" % name, "{broken")
+        self.assertEqual(self.outbox.due(), [name])
+        self.assertEqual(self.outbox.next_attempt(), None)
+
+    def test_claim(self):
+        name = self.put()
+        other = rngmail.Outbox(self.path("outbox"))
+        self.assertTrue(self.outbox.claim(name))
+        self.assertFalse(other.claim(name))
+        self.assertFalse(self.outbox.claim(name))
+        self.assertEqual(self.outbox.names(), [])
+        self.assertEqual(self.outbox.info(name)["attempts"], 0)
+        self.outbox.release(name)
+        self.assertEqual(self.outbox.names(), [name])
+        self.assertTrue(other.claim(name))
+
+    def test_failed_claim_is_returned(self):
+        name = self.put()
+        self.outbox.claim(name)
+        self.assertFalse(self.outbox.failed(name, self.outbox.info(name), "timeout"))
+        self.assertEqual(self.outbox.info(name)["attempts"], 1)
+        # still claimed until it is released
+        self.assertFalse(rngmail.Outbox(self.path("outbox")).claim(name))
+        self.outbox.release(name)
+        self.assertEqual(self.outbox.names(), [name])
+        self.assertEqual(self.outbox.info(name)["attempts"], 1)
+        self.assertEqual(os.listdir(self.outbox.sendingdir), [])
+
+    def test_delivered_claim(self):
+        name = self.put()
+        self.outbox.claim(name)
+        self.outbox.delivered(name)
+        self.outbox.release(name)
+        self.assertEqual(self.outbox.names(), [])
+        self.assertEqual(os.listdir(self.outbox.sendingdir), [])
+
+    def test_requeue(self):
+        held, stale = self.put(), self.put()
+        other = rngmail.Outbox(self.path("outbox"))
+        other.claim(held)
+        # the claim of a sender which died while delivering
+        os.rename(self.path("outbox", stale + ".json"), self.path("outbox", "sending", stale + ".json"))
+        self.assertEqual(self.outbox.requeue(), [stale])
+        self.assertEqual(other.requeue(), [])
+        self.assertEqual(self.outbox.names(), [stale])
+
+
+class SenderTest(TempDirMixin, unittest.TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.outbox = rngmail.Outbox(self.path("outbox"))
+        self.results = []
+
+    def sender(self, transport):
+        return rngmail.Sender(self.outbox, lambda mailer: transport,
+                              lambda *result: self.results.append(result))
+
+    def put(self):
+        return self.outbox.put("smtp", "jane@example.org", ["submit@bugs.debian.org"], "message")
+
+    def test_delivered(self):
+        name = self.put()
+        transport = FakeTransport()
+        self.assertEqual(self.sender(transport).flush(), 0)
+        self.assertEqual(transport.sent, [("jane@example.org", ["submit@bugs.debian.org"], "message")])
+        self.assertEqual(self.results, [(name, True, "")])
+
+    def test_failed_message_is_retried_later(self):
+        name = self.put()
+        sender = self.sender(FakeTransport(rngmail.MailError("timeout")))
+        self.assertEqual(sender.flush(), 1)
+        self.assertEqual(self.results, [(name, False, "timeout")])
+        # not due yet
+        self.assertEqual(sender.flush(), 1)
+        self.assertEqual(len(self.results), 1)
+        self.assertEqual(sender.flush(force=True), 1)
+        self.assertEqual(self.outbox.info(name)["attempts"], 2)
+
+    def test_permanent_failure(self):
+        self.put()
+        sender = self.sender(FakeTransport(rngmail.MailError("rejected", True)))
+        self.assertEqual(sender.flush(), 0)
+        self.assertEqual(len(os.listdir(self.outbox.faileddir)), 2)
+
+    def test_corrupt_info(self):
+        broken = self.put()
+        self.write("outbox/%s.json" % broken, "{broken")
+        name = self.put()
+        transport = FakeTransport()
+        self.assertEqual(self.sender(transport).flush(), 0)
+        self.assertEqual(len(transport.sent), 1)
+        self.assertEqual([r[0:2] for r in self.results], [(broken, False), (name, True)])
+        self.assertTrue(os.path.exists(os.path.join(self.outbox.faileddir, broken + ".json")))
+
+    def test_two_senders(self):
+        names = [self.put() for i in range(20)]
+        transports = [FakeTransport(delay=0.01), FakeTransport(delay=0.01)]
+        senders = [rngmail.Sender(rngmail.Outbox(self.path("outbox")), lambda mailer, t=t: t)
+                   for t in transports]
+        threads = [threading.Thread(target=s.flush) for s in senders]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        sent = transports[0].sent + transports[1].sent
+        self.assertEqual(len(sent), len(names))
+        self.assertEqual(self.outbox.names(), [])
+
+    def test_thread(self):
+        sender = self.sender(FakeTransport())
+        sender.start()
+        try:
+            self.put()
+            sender.wake()
+            deadline = time.time() + 10
+            while not self.results and time.time() < deadline:
+                time.sleep(0.05)
+        finally:
+            sender.stop()
+        self.assertEqual(len(self.results), 1)
+        self.assertEqual(self.outbox.names(), [])
+
+
+class SendmailTransportTest(TempDirMixin, unittest.TestCase):
+
+    def sendmail(self, status=0):
+        """Return the path of a fake sendmail recording its arguments and
+        input."""
+        path = self.write("sendmail", '#!/bin/sh\necho "$@" > %s\ncat > %s\necho oops\nexit %i\n' %
+                          (self.path("args"), self.path("input"), status))
+        os.chmod(path, 0o755)
+        return path
+
+    def read(self, name):
+        f = open(self.path(name))
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def test_send(self):
+        transport = rngmail.SendmailTransport(self.sendmail())
+        transport.send("Jane Doe <jane@example.org>", ["submit@bugs.debian.org"], "message\n")
+        # the envelope sender is the bare address
+        self.assertEqual(self.read("args"), "-oi -f jane@example.org -- submit@bugs.debian.org\n")
+        self.assertEqual(self.read("input"), "message\n")
+
+    def test_failure(self):
+        transport = rngmail.SendmailTransport(self.sendmail(75))
+        try:
+            transport.send("jane@example.org", ["submit@bugs.debian.org"], "message\n")
+        except rngmail.MailError as e:
+            self.assertTrue("75" in str(e) and "oops" in str(e))
+            self.assertFalse(e.permanent)
+        else:
+            self.fail("MailError not raised")
+
+    def test_missing_sendmail(self):
+        transport = rngmail.SendmailTransport(self.path("missing"))
+        self.assertRaises(rngmail.MailError, transport.send, "jane@example.org",
+                          ["submit@bugs.debian.org"], "message\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
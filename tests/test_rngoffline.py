@@ -0,0 +1,151 @@
+# test_rngoffline.py - Tests of rngoffline.
+# Copyright (C) 2007-2014  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import json
+import unittest
+from StringIO import StringIO
+
+from helpers import TempDirMixin, needs_debianbts
+
+import rngoffline
+
+
+SUMMARY = """\
+Format-Version: 3
+Submitter: Jane Doe <jane@example.org>
+Subject: foo: crashes on startup
+Package: foo
+Tags: patch l10n
+Severity: grave
+
+Body: not a field of the summary
+"""
+
+# originator, date, subject, msgid, package, tags, done, forwarded,
+# mergedwith, severity
+STATUS = """\
+John Doe <john@example.org>
+1234567890
+bar: wrong colors
+<123@example.org>
+bar
+moreinfo
+
+Someone <someone@example.org>
+
+"""
+
+
+class ParserTest(TempDirMixin, unittest.TestCase):
+
+    def test_parse_summary(self):
+        self.assertEqual(rngoffline.parse_summary(StringIO(SUMMARY)),
+                         {"originator" : u"Jane Doe <jane@example.org>",
+                          "subject"    : u"foo: crashes on startup",
+                          "package"    : u"foo",
+                          "tags"       : [u"patch", u"l10n"],
+                          "done"       : False,
+                          "severity"   : u"grave"})
+
+    def test_parse_summary_defaults(self):
+        d = rngoffline.parse_summary(StringIO("Package: foo\nDone: me\n"))
+        self.assertEqual(d["severity"], "normal")
+        self.assertEqual(d["tags"], [])
+        self.assertEqual(d["done"], True)
+
+    def test_parse_summary_invalid_utf8(self):
+        d = rngoffline.parse_summary(StringIO("Subject: caf\xe9\n"))
+        self.assertEqual(d["subject"], u"caf\ufffd")
+
+    def test_parse_status(self):
+        self.assertEqual(rngoffline.parse_status(StringIO(STATUS)),
+                         {"originator" : u"John Doe <john@example.org>",
+                          "subject"    : u"bar: wrong colors",
+                          "package"    : u"bar",
+                          "tags"       : [u"moreinfo"],
+                          "done"       : False,
+                          "severity"   : u"normal"})
+
+    def test_parse_short_status(self):
+        d = rngoffline.parse_status(StringIO("John Doe <john@example.org>\n"))
+        self.assertEqual(d["originator"], "John Doe <john@example.org>")
+        self.assertEqual(d["package"], "")
+
+    def test_read_index(self):
+        path = self.write("Maintainers", "foo    Jane Doe <jane@example.org>\nbroken\nbar John <j@example.org>\n")
+        self.assertEqual(rngoffline.read_index(path),
+                         {"foo" : u"Jane Doe <jane@example.org>", "bar" : u"John <j@example.org>"})
+        self.assertEqual(rngoffline.read_index(self.path("missing")), {})
+
+    def test_email(self):
+        self.assertEqual(rngoffline._email("Jane Doe <Jane@Example.org>"), "jane@example.org")
+        self.assertEqual(rngoffline._email(" jane@example.org "), "jane@example.org")
+
+
+class OfflineBTSTest(TempDirMixin, unittest.TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.bts = rngoffline.OfflineBTS(self.path("offline.sqlite"))
+        self.write("spool/db-h/23/123.summary", SUMMARY)
+        self.write("spool/db-h/23/123.log", "")
+        self.write("spool/db-h/24/124.status", STATUS)
+        self.write("spool/archive/25/125.summary", "Package: foo\n")
+        self.write("spool/indices/Maintainers", "foo Jane Doe <Jane@example.org>\n")
+        self.write("spool/indices/sources", "bar main src-bar\n")
+        self.assertEqual(self.bts.import_spool(self.path("spool")), 3)
+
+    def test_get_bugs(self):
+        self.assertEqual(self.bts.get_bugs(("package", "foo")), [123])
+        self.assertEqual(self.bts.get_bugs(("src", "src-bar")), [124])
+        self.assertEqual(self.bts.get_bugs(("maint", "Jane <jane@example.org>")), [123])
+        self.assertEqual(self.bts.get_bugs(("submitter", "john@example.org")), [124])
+        self.assertEqual(self.bts.get_bugs(("tag", "patch", "severity", "grave")), [123])
+        self.assertEqual(self.bts.get_bugs(("tag", "patch", "severity", "normal")), [])
+        # values of the same key are alternatives
+        self.assertEqual(self.bts.get_bugs(("package", "foo", "package", "bar")), [123, 124])
+
+    @needs_debianbts
+    def test_get_status(self):
+        bugs = self.bts.get_status([124, 123, 999])
+        self.assertEqual(sorted(b.bug_num for b in bugs), [123, 124])
+        bug = [b for b in bugs if b.bug_num == 123][0]
+        self.assertEqual(bug.tags, ["patch", "l10n"])
+        self.assertEqual(bug.severity, "grave")
+        self.assertEqual(bug.archived, False)
+
+    def test_export_import(self):
+        out = StringIO()
+        self.bts.export(out)
+        lines = [json.loads(l) for l in out.getvalue().splitlines()]
+        self.assertEqual([d["bug_num"] for d in lines], [123, 124, 125])
+        self.assertEqual(lines[2]["archived"], True)
+        other = rngoffline.OfflineBTS(self.path("other.sqlite"))
+        self.assertEqual(other.import_jsonl(StringIO(out.getvalue())), 3)
+        self.assertEqual(other.get_bugs(("package", "foo")), [123])
+
+    @needs_debianbts
+    def test_bug_dict_roundtrip(self):
+        d = {"bug_num" : 1, "package" : "foo", "source" : "foo", "originator" : "me",
+             "subject" : "broken", "severity" : "minor", "tags" : ["patch"],
+             "done" : True, "archived" : False, "log_modified" : 1400000000}
+        self.assertEqual(rngoffline.bug_to_dict(rngoffline.dict_to_bug(d)), d)
+
+
+if __name__ == "__main__":
+    unittest.main()
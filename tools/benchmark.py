@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+# benchmark.py - Benchmark Reportbug-NG's BTS fetch path.
+# Copyright (C) 2007-2014  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Run representative queries through rngfetch against a local fakebts.py
+and report wall time, number of SOAP requests, number of connections and
+the peak memory of the client for each of them.
+
+Every query runs in a fresh process, so the peak memory is not skewed by
+earlier queries or by the server.
+"""
+
+
+import os
+import sys
+import json
+import time
+import urllib2
+import resource
+import subprocess
+from optparse import OptionParser, SUPPRESS_HELP
+
+
+TOOLSDIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TOOLSDIR, "..", "src"))
+
+# Queries as returned by translate_query. With the default dataset package0
+# and source0 are the largest packages, severity:normal is a huge list.
+QUERIES = (["package", "package0"],
+           ["package", "package7"],
+           ["src", "source0"],
+           ["maint", "maint0@example.org"],
+           ["severity", "grave"],
+           ["tag", "patch"],
+           ["severity", "normal"])
+
+
+def run_query(url, query, workers):
+    """Run a single query and return the measurements as dictionary."""
+    import rngbts as bts
+    import rngfetch
+    bts.set_url(url)
+    start = time.time()
+    buglist = bts.get_bugs(query)
+    first = []
+    bugs = rngfetch.fetch_status(buglist, workers=workers,
+                                 callback=lambda bl: first or first.append(time.time()))
+    end = time.time()
+    return {"bugs"    : len(bugs),
+            "seconds" : end - start,
+            "first"   : (first[0] if first else end) - start,
+            "maxrss"  : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def stats(url):
+    return json.load(urllib2.urlopen(url + "stats"))
+
+
+def main():
+    parser = OptionParser(usage="%prog [Options] [key:value ...]", description=__doc__.split("\n\n")[0])
+    parser.add_option("--url",
+        help="Use an already running fakebts.py instead of starting one")
+    parser.add_option("--bugs", type="int", default=10000,
+        help="Number of bugs in the dataset [default: %default]")
+    parser.add_option("--latency", type="float", default=0.1,
+        help="Seconds the server waits before answering [default: %default]")
+    parser.add_option("--per-bug", type="float", default=0.001, dest="perbug",
+        help="Additional seconds per bug in get_status [default: %default]")
+    parser.add_option("--fail-rate", type="float", default=0.0, dest="failrate",
+        help="Probability that a request fails [default: %default]")
+    parser.add_option("--workers", type="int",
+        help="Number of worker threads of rngfetch [default: rngfetch.WORKERS]")
+    # only used internally to run a single query in a child process
+    parser.add_option("--run", help=SUPPRESS_HELP)
+    options, args = parser.parse_args()
+
+    if options.run:
+        # we are the child process running a single query
+        import rngfetch
+        workers = options.workers or rngfetch.WORKERS
+        sys.stdout.write(json.dumps(run_query(options.url, json.loads(options.run), workers)) + "\n")
+        return
+
+    queries = QUERIES
+    if args:
+        queries = [a.split(":", 1) for a in args]
+
+    server = None
+    url = options.url
+    if not url:
+        server = subprocess.Popen([sys.executable, os.path.join(TOOLSDIR, "fakebts.py"),
+                                   "--bugs", str(options.bugs),
+                                   "--latency", str(options.latency),
+                                   "--per-bug", str(options.perbug),
+                                   "--fail-rate", str(options.failrate)],
+                                  stdout=subprocess.PIPE)
+        url = server.stdout.readline().strip()
+    try:
+        sys.stdout.write("%-32s %7s %9s %9s %9s %6s %10s\n" %
+                         ("Query", "Bugs", "Wall [s]", "First [s]", "Requests", "Conns", "Peak [KiB]"))
+        for query in queries:
+            before = stats(url)
+            cmd = [sys.executable, os.path.abspath(__file__), "--url", url,
+                   "--run", json.dumps(list(query))]
+            if options.workers:
+                cmd.extend(["--workers", str(options.workers)])
+            result = json.loads(subprocess.check_output(cmd))
+            after = stats(url)
+            sys.stdout.write("%-32s %7i %9.2f %9.2f %9i %6i %10i\n" %
+                             (":".join(query), result["bugs"], result["seconds"],
+                              result["first"], after["requests"] - before["requests"],
+                              # minus the connection of the second stats call
+                              after["connections"] - before["connections"] - 1,
+                              result["maxrss"]))
+    finally:
+        if server:
+            server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+
+# fakebts.py - Local stand-in for the SOAP interface of Debian's BTS.
+# Copyright (C) 2007-2014  Bastian Venthur
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Serve a synthetic dataset via the subset of the debbugs SOAP interface
+used by debianbts: get_bugs, get_status and get_bug_log.
+
+The dataset is generated from a seed, so the same options always produce the
+same bugs. Latency and failures can be injected to mimic a slow or flaky BTS.
+GET /stats returns the number of requests and connections served so far as
+JSON.
+"""
+
+
+import sys
+import time
+import json
+import random
+import logging
+import threading
+import BaseHTTPServer
+import SocketServer
+from optparse import OptionParser
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+
+SEVERITIES = ("critical", "grave", "serious", "important", "normal", "minor", "wishlist")
+# normal and wishlist bugs are the most common ones
+SEVERITY_WEIGHTS = (1, 2, 3, 10, 60, 10, 14)
+TAGS = ("patch", "moreinfo", "upstream", "confirmed", "l10n", "security", "sid", "help")
+
+ENVELOPE = """<?xml version="1.0" encoding="UTF-8"?>\
+<soap:Envelope soap:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/" \
+xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" \
+xmlns:soapenc="http://schemas.xmlsoap.org/soap/encoding/" \
+xmlns:xsd="http://www.w3.org/2001/XMLSchema" \
+xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\
+<soap:Body>%s</soap:Body></soap:Envelope>"""
+
+FAULT = """<soap:Fault><faultcode>soap:Server</faultcode>\
+<faultstring>%s</faultstring></soap:Fault>"""
+
+
+def _localname(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _string(name, value):
+    return '<%s xsi:type="xsd:string">%s</%s>' % (name, escape(value), name)
+
+
+def _int(name, value):
+    return '<%s xsi:type="xsd:int">%i</%s>' % (name, value, name)
+
+
+def _int_array(name, values):
+    return ('<%s soapenc:arrayType="xsd:int[%i]" xsi:type="soapenc:Array">%s</%s>' %
+            (name, len(values), "".join(_int("item", v) for v in values), name))
+
+
+class Dataset(object):
+    """A synthetic set of bugreports with indices for get_bugs."""
+
+    def __init__(self, bugs=10000, packages=None, seed=0, start=100000):
+        self.logger = logging.getLogger("Dataset")
+        if packages is None:
+            packages = max(1, bugs // 20)
+        rnd = random.Random(seed)
+        self.bugs = dict()
+        self.index = dict()
+        now = int(time.time())
+        for bug_num in range(start, start + bugs):
+            p = (int(rnd.paretovariate(1.2)) - 1) % packages
+            bug = {"bug_num"      : bug_num,
+                   "package"      : "package%i" % p,
+                   "source"       : "source%i" % (p // 2),
+                   "maint"        : "maint%i@example.org" % (p // 10),
+                   "submitter"    : "submitter%i@example.org" % rnd.randint(0, bugs // 5),
+                   "severity"     : self._weighted(rnd),
+                   "tags"         : sorted(set(rnd.sample(TAGS, rnd.choice((0, 0, 0, 1, 1, 2))))),
+                   "subject"      : "package%i: synthetic bug number %i" % (p, bug_num),
+                   "done"         : rnd.random() < 0.2,
+                   "date"         : now - rnd.randint(0, 10 * 365 * 86400),
+                   "archived"     : False}
+            bug["log_modified"] = bug["date"] + rnd.randint(0, now - bug["date"])
+            self.bugs[bug_num] = bug
+            for key in ("package", "source", "maint", "submitter", "severity"):
+                self.index.setdefault((key, bug[key]), []).append(bug_num)
+            for tag in bug["tags"]:
+                self.index.setdefault(("tag", tag), []).append(bug_num)
+        self.logger.info("Generated %i bugs for %i packages." % (bugs, packages))
+
+
+    def _weighted(self, rnd):
+        x = rnd.randint(1, sum(SEVERITY_WEIGHTS))
+        for severity, weight in zip(SEVERITIES, SEVERITY_WEIGHTS):
+            x -= weight
+            if x <= 0:
+                return severity
+        return "normal"
+
+
+    def get_bugs(self, query):
+        """Return the sorted bugnumbers matching all key/value pairs."""
+        keys = {"src" : "source"}
+        result = None
+        for i in range(0, len(query) - 1, 2):
+            key = keys.get(query[i], query[i])
+            matches = set(self.index.get((key, query[i+1]), []))
+            result = matches if result is None else result & matches
+        return sorted(result or [])
+
+
+class FakeBTS(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Threaded HTTP server answering debbugs SOAP requests from a Dataset.
+
+    latency seconds plus perbug seconds for every bug in a get_status call
+    are waited before answering. failrate is the probability that a request
+    fails with a SOAP fault, get_status calls containing one of badbugs
+    always do.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, dataset, latency=0.0, perbug=0.0,
+                 failrate=0.0, badbugs=()):
+        BaseHTTPServer.HTTPServer.__init__(self, address, SoapHandler)
+        self.dataset = dataset
+        self.latency = latency
+        self.perbug = perbug
+        self.failrate = failrate
+        self.badbugs = set(badbugs)
+        self.random = random.Random()
+        self.lock = threading.Lock()
+        self.stats = {"requests" : 0, "connections" : 0, "faults" : 0}
+
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+
+    def call(self, method, args):
+        """Return the body of the answer to the SOAP call method(args)."""
+        if self.random.random() < self.failrate:
+            raise RuntimeError("Injected failure")
+        if method == "get_bugs":
+            time.sleep(self.latency)
+            return _int_array("soapenc:Array", self.dataset.get_bugs(args))
+        if method == "get_status":
+            numbers = [int(i) for i in args]
+            time.sleep(self.latency + self.perbug * len(numbers))
+            if self.badbugs.intersection(numbers):
+                raise RuntimeError("Injected failure for bad bug")
+            return "<s-gensym3>%s</s-gensym3>" % "".join(
+                self.status(self.dataset.bugs[i]) for i in numbers if i in self.dataset.bugs)
+        if method == "get_bug_log":
+            time.sleep(self.latency)
+            bug = self.dataset.bugs.get(int(args[0]))
+            if bug is None:
+                return '<soapenc:Array soapenc:arrayType="xsd:anyType[0]" xsi:type="soapenc:Array"/>'
+            header = "From: %s\nSubject: %s\n" % (bug["submitter"], bug["subject"])
+            body = "Package: %s\nSeverity: %s\n\nThis is a synthetic bug.\n" % (bug["package"], bug["severity"])
+            return ('<soapenc:Array soapenc:arrayType="xsd:anyType[1]" xsi:type="soapenc:Array">'
+                    '<item>%s%s%s<attachments soapenc:arrayType="xsd:anyType[0]" xsi:type="soapenc:Array"/>'
+                    '</item></soapenc:Array>' % (_string("header", header), _int("msg_num", 2),
+                                                 _string("body", body)))
+        raise RuntimeError("Unsupported method %s" % method)
+
+
+    def status(self, bug):
+        empty = ('<%s soapenc:arrayType="xsd:anyType[0]" xsi:type="soapenc:Array"/>')
+        fields = [_int("bug_num", bug["bug_num"]),
+                  _int("id", bug["bug_num"]),
+                  _string("package", bug["package"]),
+                  _string("source", bug["source"]),
+                  _string("subject", bug["subject"]),
+                  _string("originator", bug["submitter"]),
+                  _string("severity", bug["severity"]),
+                  _string("tags", " ".join(bug["tags"])),
+                  _string("keywords", " ".join(bug["tags"])),
+                  _string("done", "Someone <someone@example.org>" if bug["done"] else ""),
+                  _string("pending", "done" if bug["done"] else "pending"),
+                  _string("forwarded", ""),
+                  _string("owner", ""),
+                  _string("summary", ""),
+                  _string("affects", ""),
+                  _string("blocks", ""),
+                  _string("blockedby", ""),
+                  _string("mergedwith", ""),
+                  _string("msgid", "<%i@example.org>" % bug["bug_num"]),
+                  _string("location", "archive" if bug["archived"] else "db-h"),
+                  _int("archived", int(bug["archived"])),
+                  _int("unarchived", 0),
+                  _int("date", bug["date"]),
+                  _int("log_modified", bug["log_modified"]),
+                  _int("last_modified", bug["log_modified"]),
+                  empty % "found_versions",
+                  empty % "fixed_versions",
+                  empty % "found_date",
+                  empty % "fixed_date"]
+        return "<item>%s<value>%s</value></item>" % (_int("key", bug["bug_num"]), "".join(fields))
+
+
+class SoapHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.count("connections")
+
+
+    def log_message(self, format, *args):
+        logging.getLogger("SoapHandler").debug(format % args)
+
+
+    def do_GET(self):
+        if self.path.strip("/") != "stats":
+            self.send_error(404)
+            return
+        with self.server.lock:
+            self._reply(200, json.dumps(self.server.stats), "application/json")
+
+
+    def do_POST(self):
+        self.server.count("requests")
+        data = self.rfile.read(int(self.headers.getheader("content-length", 0)))
+        try:
+            method, args = self._parse(data)
+            body = '<%sResponse xmlns="Debbugs/SOAP">%s</%sResponse>' % (method, self.server.call(method, args), method)
+            self._reply(200, ENVELOPE % body)
+        except Exception as e:
+            self.server.count("faults")
+            self._reply(500, ENVELOPE % (FAULT % escape(str(e))))
+
+
+    def _parse(self, data):
+        """Return the method name and the flattened list of arguments."""
+        root = ElementTree.fromstring(data)
+        body = [el for el in root if _localname(el.tag) == "Body"][0]
+        call = list(body)[0]
+        args = []
+        for arg in call:
+            items = list(arg)
+            if items:
+                args.extend(item.text or "" for item in items)
+            else:
+                args.append(arg.text or "")
+        return _localname(call.tag), args
+
+
+    def _reply(self, code, content, contenttype="text/xml; charset=utf-8"):
+        self.send_response(code)
+        self.send_header("Content-Type", contenttype)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+if __name__ == "__main__":
+    parser = OptionParser(usage="%prog [Options]", description=__doc__.split("\n\n")[0])
+    parser.add_option("--port", type="int", default=0,
+        help="Port to listen on [default: a free one, printed on startup]")
+    parser.add_option("--bugs", type="int", default=10000,
+        help="Number of bugs in the dataset [default: %default]")
+    parser.add_option("--packages", type="int",
+        help="Number of packages in the dataset [default: bugs / 20]")
+    parser.add_option("--seed", type="int", default=0,
+        help="Seed of the dataset [default: %default]")
+    parser.add_option("--latency", type="float", default=0.0,
+        help="Seconds to wait before answering a request [default: %default]")
+    parser.add_option("--per-bug", type="float", default=0.0, dest="perbug",
+        help="Additional seconds to wait per bug in get_status [default: %default]")
+    parser.add_option("--fail-rate", type="float", default=0.0, dest="failrate",
+        help="Probability that a request fails [default: %default]")
+    parser.add_option("--bad-bug", type="int", action="append", default=[], dest="badbugs",
+        help="get_status calls containing this bug always fail, can be given more than once")
+    parser.add_option("-l", "--loglevel", default="warning",
+        help="Which loglevel to use [default: %default]")
+    options, args = parser.parse_args()
+
+    logging.basicConfig(level=getattr(logging, options.loglevel.upper(), logging.WARNING),
+                        format='%(name)-12s %(levelname)-8s %(message)s')
+    dataset = Dataset(options.bugs, options.packages, options.seed)
+    server = FakeBTS(("127.0.0.1", options.port), dataset, options.latency,
+                     options.perbug, options.failrate, options.badbugs)
+    sys.stdout.write("http://127.0.0.1:%i/\n" % server.server_address[1])
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass